@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'core',
@@ -46,6 +47,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.PerformanceMiddleware',
+    'core.middleware.DatabaseRoutingMiddleware',
+    'core.middleware.NPlusOneMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -82,14 +86,94 @@ DATABASES = {
     'default': {
         # 'ENGINE': 'django.db.backends.sqlite3',
         # 'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-        'ENGINE' : 'django.db.backends.postgresql',
+        # core.db.backends.postgresql_pool pools connections per process,
+        # see core.db.pool
+        'ENGINE' : os.environ.get('DB_ENGINE', 'core.db.backends.postgresql'),
         'HOST' : os.environ.get('DB_HOST'),
         'NAME' : os.environ.get('DB_NAME'),
         'USER' : os.environ.get('DB_USER'),
-        'PASSWORD' : os.environ.get('DB_PASS')
+        'PASSWORD' : os.environ.get('DB_PASS'),
+        'OPTIONS': {
+            # seconds before giving up on reaching the server
+            'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 5)),
+        },
+        # seconds a connection is kept for the following requests
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        # check a kept connection still works before a request uses it
+        'CONN_HEALTH_CHECKS': True,
+        # only read by the pooling engine
+        'POOL': {
+            'MAX_SIZE': int(os.environ.get('DB_POOL_SIZE', 10)),
+            'TIMEOUT': int(os.environ.get('DB_POOL_TIMEOUT', 5)),
+            'MAX_LIFETIME': 600,
+        },
+    }
+}
+
+# Read replicas, one per host in DB_REPLICA_HOSTS, otherwise configured
+# like the primary. Safe requests read from them, see core.routers
+DATABASE_REPLICAS = []
+for number, host in enumerate(
+        filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+
+# Seconds a user's reads stay on the primary after they changed data,
+# recorded in a cache that should be shared by every process
+DATABASE_STICKY_SECONDS = int(os.environ.get('DB_STICKY_SECONDS', 10))
+DATABASE_STICKY_CACHE_ALIAS = 'default'
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.1/topics/cache/
+# The local-memory backend evicts the least recently used entries once
+# MAX_ENTRIES is reached. It is private to each process, so deployments
+# running several workers should point this at a shared cache instead
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 5000)),
+            # cull the least recently used tenth when full
+            'CULL_FREQUENCY': 10,
+        },
     }
 }
 
+# Per-user cache of the recipe API list/retrieve responses (recipe.cache)
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = 300
+RESPONSE_CACHE_MAX_ENTRY_SIZE = 256 * 1024
+
+# Token authentication cache (core.authentication). Users and tokens are
+# kept for up to TOKEN_CACHE_TIMEOUT seconds in a per-process LRU of
+# TOKEN_CACHE_SIZE entries (0 turns it off), checked against the
+# revocations recorded in the TOKEN_CACHE_ALIAS cache. Name a cache shared
+# by all workers there, e.g. memcached: a local memory cache such as the
+# default one is per process and is ignored. Without a shared cache,
+# entries only live TOKEN_CACHE_LOCAL_TIMEOUT seconds, as other workers
+# cannot tell them about revocations
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 10000))
+TOKEN_CACHE_TIMEOUT = 300
+TOKEN_CACHE_LOCAL_TIMEOUT = 5
+TOKEN_CACHE_ALIAS = os.environ.get('TOKEN_CACHE_ALIAS') or None
+
+# Signed access tokens (core.tokens), lifetimes in seconds. Revocations
+# and user changes made by other workers are picked up every
+# ACCESS_DENYLIST_SYNC_INTERVAL
+ACCESS_TOKEN_LIFETIME = 300
+REFRESH_TOKEN_LIFETIME = 14 * 24 * 60 * 60
+ACCESS_DENYLIST_SYNC_INTERVAL = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
@@ -133,5 +217,87 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
 
+# Who sends a media file once Django authorised the request: 'django'
+# (FileResponse, with Range support), 'x-accel-redirect' (nginx) or
+# 'x-sendfile' (Apache, lighttpd). See core.media
+MEDIA_SERVE_MODE = os.environ.get('MEDIA_SERVE_MODE', 'django')
+
+# Internal nginx location aliasing MEDIA_ROOT, for x-accel-redirect
+MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get(
+    'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/'
+)
+
+
+AUTH_USER_MODEL = 'core.User'
+
+
+# Number of tag/ingredient autocomplete results each process keeps in
+# memory. Set to 0 to disable the cache
+AUTOCOMPLETE_CACHE_SIZE = int(os.environ.get('AUTOCOMPLETE_CACHE_SIZE', 4096))
+
+# Render tag, ingredient and recipe lists straight from .values() rows
+# instead of through the DRF serializers (see recipe.serializers)
+FAST_LIST_SERIALIZERS = True
+
+# Largest number of recipes accepted by one bulk create request
+RECIPE_BULK_CREATE_MAX_ITEMS = 1000
 
-AUTH_USER_MODEL = 'core.User'
\ No newline at end of file
+# Largest number of names accepted by one tag/ingredient bulk request
+RECIPE_ATTR_BULK_MAX_NAMES = 1000
+
+# Recipes read from the database per round trip while streaming an export.
+# Bounds the memory an export uses, whatever the size of the library
+RECIPE_EXPORT_CHUNK_SIZE = 2000
+
+# Recipes inserted per transaction by the import endpoint
+RECIPE_IMPORT_BATCH_SIZE = 1000
+
+# Threads per process rendering the resized variants of uploaded recipe
+# images. Set to 0 to render them in the request instead
+RECIPE_IMAGE_WORKERS = int(os.environ.get('RECIPE_IMAGE_WORKERS', 2))
+
+# {variant name: (max width, max height)} rendered for every recipe image
+RECIPE_IMAGE_VARIANTS = {
+    'thumbnail': (150, 150),
+    'medium': (600, 600),
+}
+
+# JPEG quality of the rendered variants
+RECIPE_IMAGE_QUALITY = 85
+
+# Unreferenced recipe images deleted per transaction by the collection
+# that runs after recipes are deleted or get a new image
+RECIPE_IMAGE_GC_BATCH_SIZE = 500
+
+# Seconds after which delete_orphaned_files deletes a stored image left
+# without any reference row, by an upload in a transaction that rolled
+# back. Longer than any transaction runs
+RECIPE_IMAGE_ORPHAN_AGE = int(
+    os.environ.get('RECIPE_IMAGE_ORPHAN_AGE', 24 * 60 * 60)
+)
+
+# Request timing (core.middleware.PerformanceMiddleware) of the views in
+# METRICS_NAMESPACES, for a METRICS_SAMPLE_RATE share of the requests.
+# Served at /metrics and in Server-Timing headers
+METRICS_ENABLED = True
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', 1.0))
+METRICS_NAMESPACES = ('recipe', 'user')
+# /metrics and the details of /readyz are only served to requests from
+# METRICS_ALLOWED_IPS (addresses or networks, comma separated) or bearing
+# METRICS_TOKEN, and in DEBUG.
+# Behind a reverse proxy every request comes from the proxy's address, so
+# prefer the token there
+METRICS_ALLOWED_IPS = [
+    address.strip() for address in
+    os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if address.strip()
+]
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Report SQL SELECTs run more than NPLUSONE_THRESHOLD times by one
+# request, i.e. once per row (core.nplusone). NPLUSONE_ACTION is 'warn'
+# or 'raise'. The tests of NPLUSONE_TEST_APPS always raise
+NPLUSONE_ENABLED = DEBUG
+NPLUSONE_THRESHOLD = 5
+NPLUSONE_ACTION = 'warn'
+NPLUSONE_TEST_APPS = ('recipe', 'user')
+TEST_RUNNER = 'core.testing.TestRunner'
@@ -0,0 +1,287 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from rest_framework import exceptions
+from rest_framework.authentication import (
+    BaseAuthentication,
+    TokenAuthentication,
+    get_authorization_header,
+)
+from rest_framework.authtoken.models import Token
+
+from core import metrics, tokens
+
+
+TOKEN_KEY = 'auth:token:{digest}'
+VERSION_KEY = 'auth:version:{user_id}'
+
+
+class TokenCacheStats:
+    """Per-process counters of the token cache"""
+
+    COUNTERS = ('local_hits', 'shared_hits', 'misses', 'revocations')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def increment(self, counter):
+        with self._lock:
+            self._counts[counter] += 1
+
+    def reset(self):
+        with self._lock:
+            self._counts = dict.fromkeys(self.COUNTERS, 0)
+
+    def snapshot(self):
+        """Return a copy of the counters and the overall hit rate"""
+        with self._lock:
+            counts = dict(self._counts)
+
+        hits = counts['local_hits'] + counts['shared_hits']
+        lookups = hits + counts['misses']
+        counts['hit_rate'] = hits / lookups if lookups else 0.0
+        return counts
+
+
+def field_values(instance):
+    return tuple(
+        getattr(instance, field.attname)
+        for field in instance._meta.concrete_fields
+    )
+
+
+def from_values(model, values):
+    """Build a fresh instance, so no request sees another one's changes"""
+    names = [field.attname for field in model._meta.concrete_fields]
+    return model.from_db(None, names, values)
+
+
+class TokenCache:
+    """Two tier cache of the users and tokens authenticated by token key
+
+    The first tier is a bounded, per-process LRU sized by
+    settings.TOKEN_CACHE_SIZE, 0 turning it off. The optional second tier
+    is the cache named by settings.TOKEN_CACHE_ALIAS, shared by all
+    processes, see tokens.shared_cache(). Entries of both live for
+    settings.TOKEN_CACHE_TIMEOUT seconds at most.
+
+    revoke() drops a user's entries. With a shared tier every entry is
+    checked against the user's auth version kept there, so a revocation
+    takes effect in every process at once; without one, other processes
+    keep their entries until they expire, so entries then only live for
+    settings.TOKEN_CACHE_LOCAL_TIMEOUT seconds.
+
+    Only a hash of the token key is used in cache keys.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # bumped by every revoke(), so a lookup that raced with one does
+        # not cache what it read
+        self._generation = 0
+        self.stats = TokenCacheStats()
+
+    @property
+    def max_entries(self):
+        return settings.TOKEN_CACHE_SIZE
+
+    @property
+    def shared(self):
+        return tokens.shared_cache()
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def get(self, key):
+        """Return the cached (user, token) for a token key or None"""
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        shared = self.shared
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self._entries.move_to_end(digest)
+        if entry is not None and entry[-1] > now:
+            user_id, user, token, version, _ = entry
+            if shared is None or version == self.get_version(user_id):
+                self.stats.increment('local_hits')
+                return self.build(user, token)
+
+        if shared is not None:
+            cached = shared.get(TOKEN_KEY.format(digest=digest))
+            if cached is not None:
+                user_id, user, token, version = cached
+                if version == self.get_version(user_id):
+                    self.stats.increment('shared_hits')
+                    self.set_local(digest, cached)
+                    return self.build(user, token)
+
+        self.stats.increment('misses')
+        return None
+
+    def set(self, key, user, token, generation):
+        """Cache what a lookup started at `generation` found for key"""
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        shared = self.shared
+        version = self.get_version(user.pk) if shared is not None else None
+        entry = (user.pk, field_values(user), field_values(token), version)
+
+        if shared is not None:
+            shared.set(
+                TOKEN_KEY.format(digest=digest),
+                entry,
+                settings.TOKEN_CACHE_TIMEOUT
+            )
+        if generation == self._generation:
+            self.set_local(digest, entry)
+
+    def set_local(self, digest, entry):
+        max_entries = self.max_entries
+        if max_entries <= 0:
+            return
+
+        if self.shared is not None:
+            timeout = settings.TOKEN_CACHE_TIMEOUT
+        else:
+            timeout = settings.TOKEN_CACHE_LOCAL_TIMEOUT
+        expires = time.monotonic() + timeout
+        with self._lock:
+            self._entries[digest] = entry + (expires,)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+
+    def build(self, user, token):
+        user = from_values(get_user_model(), user)
+        token = from_values(Token, token)
+        token.user = user
+        return user, token
+
+    def get_version(self, user_id):
+        """Return the user's current auth version in the shared tier"""
+        shared = self.shared
+        key = VERSION_KEY.format(user_id=user_id)
+        version = shared.get(key)
+        if version is None:
+            version = uuid.uuid4().hex
+            if not shared.add(key, version, timeout=None):
+                version = shared.get(key, version)
+
+        return version
+
+    def revoke(self, user_id):
+        """Drop every cached entry of a user, in all processes if shared"""
+        self.stats.increment('revocations')
+        shared = self.shared
+        if shared is not None:
+            shared.set(
+                VERSION_KEY.format(user_id=user_id),
+                uuid.uuid4().hex,
+                timeout=None
+            )
+
+        with self._lock:
+            self._generation += 1
+            stale = [
+                digest for digest, entry in self._entries.items()
+                if entry[0] == user_id
+            ]
+            for digest in stale:
+                del self._entries[digest]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
+@metrics.register_collector
+def collect_stats():
+    counts = token_cache.stats.snapshot()
+    hit_rate = counts.pop('hit_rate')
+    return metrics.counter_samples(
+        'app_token_cache', 'Token authentication cache events', counts
+    ) + [
+        metrics.Sample(
+            'app_token_cache_hit_rate', 'gauge',
+            'Share of token lookups answered from the cache.', {}, hit_rate
+        )
+    ]
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication answering repeat lookups from the token cache
+
+    Unknown keys and inactive users are always checked against the
+    database, so only valid credentials are ever cached. Every request
+    gets its own user and token instances.
+    """
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+
+        generation = token_cache.generation
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, user, token, generation)
+        return user, token
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """Authenticate the signed access tokens of core.tokens
+
+    Clients send `Authorization: Bearer <access token>`. Checking a token
+    needs no database work: the user is built from the claims it carries,
+    see core.tokens.token_user.
+    """
+
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed(
+                'Invalid token header. Credentials string should not '
+                'contain spaces.'
+            )
+        try:
+            token = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed('Invalid token header.')
+
+        try:
+            payload = tokens.read_access_token(token)
+            user = tokens.token_user(payload)
+        except tokens.InvalidToken as error:
+            raise exceptions.AuthenticationFailed(str(error))
+
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        return user, payload
+
+    def authenticate_header(self, request):
+        return self.keyword
+
+
+# Opaque tokens first, so unauthenticated responses keep asking for them
+TOKEN_AUTHENTICATION_CLASSES = (
+    CachedTokenAuthentication,
+    SignedTokenAuthentication,
+)
@@ -0,0 +1,174 @@
+import io
+
+from django.db import connections, router, transaction
+from django.db.models import AutoField
+
+from core.models import Recipe
+from core.search import update_search_vectors
+from core.signals import touch_user_data
+
+
+# the recipe M2M fields whose links insert_recipes() writes
+RELATIONS = ('tags', 'ingredients')
+
+
+def copy_supported(using=None):
+    """Return True if rows can be loaded with PostgreSQL's COPY"""
+    using = using or router.db_for_write(Recipe)
+    return connections[using].vendor == 'postgresql'
+
+
+def copy_text(value):
+    """Encode a value for COPY's text format"""
+    if value is None:
+        return '\\N'
+
+    return str(value).replace('\\', '\\\\').replace(
+        '\t', '\\t'
+    ).replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_rows(cursor, table, columns, rows):
+    """Load rows into table with a single COPY ... FROM STDIN"""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(copy_text(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+
+    cursor.copy_expert(
+        f'COPY {table} ({", ".join(columns)}) FROM STDIN', buffer
+    )
+
+
+def through_columns(field_name):
+    """Return (through model, recipe column, related column) of a relation"""
+    model_field = Recipe._meta.get_field(field_name)
+    through = model_field.remote_field.through
+    source = through._meta.get_field(model_field.m2m_field_name()).column
+    target = through._meta.get_field(
+        model_field.m2m_reverse_field_name()
+    ).column
+    return through, source, target
+
+
+def insert_recipes(recipes, related, using=None):
+    """Insert new recipes and their tag and ingredient links in batch
+
+    `related` holds one {'tags': [pk, ...], 'ingredients': [pk, ...]} dict
+    per recipe. On PostgreSQL the ids are reserved from the sequence up
+    front and every table is loaded with one COPY. Elsewhere the recipes
+    and the links go through bulk_create; SQLite, which cannot return the
+    new ids, reports the last one of every INSERT. Other databases that
+    cannot return them get the recipes saved one by one. The pks are set
+    on `recipes`.
+
+    No model signals are sent, short of those one by one saves, so the
+    search vectors and the owners' change tracking are updated here
+    instead.
+    """
+    using = using or router.db_for_write(Recipe)
+    if not recipes:
+        return recipes
+
+    if copy_supported(using):
+        _copy_recipes(recipes, related, using)
+    else:
+        _create_recipes(recipes, related, using)
+
+    update_search_vectors([recipe.pk for recipe in recipes], using=using)
+    touch_user_data({recipe.user_id for recipe in recipes}, using)
+
+    return recipes
+
+
+def _copy_recipes(recipes, related, using):
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    fields = Recipe._meta.concrete_fields
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT nextval(pg_get_serial_sequence(%s, %s)) '
+            'FROM generate_series(1, %s)',
+            [Recipe._meta.db_table, Recipe._meta.pk.column, len(recipes)]
+        )
+        for recipe, (pk,) in zip(recipes, cursor.fetchall()):
+            recipe.pk = pk
+
+        copy_rows(
+            cursor,
+            quote(Recipe._meta.db_table),
+            [quote(field.column) for field in fields],
+            (
+                [field.get_db_prep_save(
+                    field.pre_save(recipe, add=True), connection=connection
+                ) for field in fields]
+                for recipe in recipes
+            )
+        )
+
+        for field_name in RELATIONS:
+            through, source, target = through_columns(field_name)
+            copy_rows(
+                cursor,
+                quote(through._meta.db_table),
+                [quote(source), quote(target)],
+                (
+                    (recipe.pk, pk)
+                    for recipe, links in zip(recipes, related)
+                    for pk in links.get(field_name, ())
+                )
+            )
+
+    for recipe in recipes:
+        recipe._state.adding = False
+        recipe._state.db = using
+
+
+def _create_recipes(recipes, related, using):
+    connection = connections[using]
+    if connection.features.can_return_ids_from_bulk_insert:
+        Recipe.objects.using(using).bulk_create(recipes)
+    elif connection.vendor == 'sqlite':
+        _bulk_create_sqlite(recipes, using)
+    else:
+        with transaction.atomic(using=using, savepoint=False):
+            for recipe in recipes:
+                recipe.save(using=using)
+
+    for field_name in RELATIONS:
+        through, source, target = through_columns(field_name)
+        through.objects.using(using).bulk_create([
+            through(**{source: recipe.pk, target: pk})
+            for recipe, links in zip(recipes, related)
+            for pk in links.get(field_name, ())
+        ])
+
+
+def _bulk_create_sqlite(recipes, using):
+    """bulk_create recipes, setting their pks from SQLite's rowids
+
+    The rows of one INSERT get consecutive rowids, SQLite allowing a
+    single writer, and last_insert_rowid() is the last of them. Batches
+    are sized as bulk_create does, so each is one INSERT.
+    """
+    connection = connections[using]
+    fields = [
+        field for field in Recipe._meta.concrete_fields
+        if not isinstance(field, AutoField)
+    ]
+    batch_size = max(connection.ops.bulk_batch_size(fields, recipes), 1)
+
+    with transaction.atomic(using=using, savepoint=False):
+        for start in range(0, len(recipes), batch_size):
+            batch = recipes[start:start + batch_size]
+            Recipe.objects.using(using).bulk_create(batch)
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT last_insert_rowid()')
+                last = cursor.fetchone()[0]
+            for pk, recipe in zip(range(last - len(batch) + 1, last + 1),
+                                  batch):
+                recipe.pk = pk
+                recipe._state.adding = False
+                recipe._state.db = using
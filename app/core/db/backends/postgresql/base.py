@@ -0,0 +1,44 @@
+"""PostgreSQL backend checking persistent connections before reuse
+
+With CONN_MAX_AGE set, a connection outlives the request that opened it
+and may have been dropped by the server or a proxy in the meantime. With
+CONN_HEALTH_CHECKS set as well, the first query of every request on a
+reused connection is preceded by a check, and a broken connection is
+replaced instead of failing the request.
+"""
+from django.db.backends.postgresql import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_enabled = self.settings_dict.get(
+            'CONN_HEALTH_CHECKS', False
+        )
+        # a fresh connection needs no check
+        self.health_check_done = True
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        # called as each request starts and finishes, so a connection kept
+        # for the next request is checked by that request's first query
+        if self.connection is not None:
+            self.health_check_done = False
+
+    def close_if_health_check_failed(self):
+        if self.connection is None or self.health_check_done or \
+                not self.health_check_enabled or self.in_atomic_block:
+            return
+
+        if not self.is_usable():
+            self.close()
+        self.health_check_done = True
+
+    def _cursor(self, name=None):
+        self.close_if_health_check_failed()
+        return super()._cursor(name)
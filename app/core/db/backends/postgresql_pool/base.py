@@ -0,0 +1,84 @@
+"""PostgreSQL backend drawing its connections from an in-process pool
+
+Configured through the POOL entry of the database settings:
+
+    'POOL': {
+        'MAX_SIZE': 10,       # connections per process
+        'TIMEOUT': 5,         # seconds to wait for a free connection
+        'MAX_LIFETIME': 600,  # seconds before a connection is replaced
+    }
+
+A request hands its connection back to the pool when it finishes, so
+CONN_MAX_AGE does not apply; threads share MAX_SIZE connections between
+them. Connections checked out again are health checked before their
+first query when CONN_HEALTH_CHECKS is set. See core.db.pool.
+"""
+import time
+
+from psycopg2 import extensions
+
+from core.db import pool
+from core.db.backends.postgresql import base
+
+
+class DatabaseCreation(base.DatabaseWrapper.creation_class):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # idle pooled connections would keep the database from being dropped
+        pool.close_idle_connections()
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    creation_class = DatabaseCreation
+
+    def get_new_connection(self, conn_params):
+        self.pool = pool.get_pool(
+            self.alias,
+            conn_params,
+            self.settings_dict.get('POOL', {}),
+            lambda: super(DatabaseWrapper, self).get_new_connection(
+                conn_params
+            )
+        )
+        connection, self.pooled_reused = self.pool.checkout()
+        return connection
+
+    def connect(self):
+        super().connect()
+        # handed back at the end of every request
+        self.close_at = time.time()
+        if self.pooled_reused:
+            self.health_check_done = False
+
+    def _close(self):
+        if self.connection is None:
+            return
+        self.pool.checkin(self.connection, self.reset_connection())
+
+    def reset_connection(self):
+        """Return the connection to a clean state, True if that worked
+
+        Besides an open transaction, the session state a request may have
+        left behind is thrown away: SET parameters, prepared statements,
+        temporary tables, advisory locks and LISTENs. Django sets its own
+        parameters again when the connection is checked out.
+        """
+        connection = self.connection
+        if connection.closed:
+            return False
+
+        status = connection.get_transaction_status()
+        if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        try:
+            if status != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+            # DISCARD cannot run inside a transaction block
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute('DISCARD ALL')
+        except Exception:
+            return False
+        return True
@@ -0,0 +1,244 @@
+"""A bounded, thread safe pool of DB-API connections
+
+Used by the core.db.backends.postgresql_pool engine: its connections are
+checked out of a pool shared by every thread of the process instead of
+being opened for each one, and are handed back instead of being closed.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+from django.db import OperationalError
+
+from core import metrics
+
+
+class PoolStats:
+    """Counters of a pool, reported by /readyz and /metrics"""
+
+    COUNTERS = (
+        'checkouts', 'connects', 'discards', 'waits', 'timeouts'
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def increment(self, counter, amount=1):
+        with self._lock:
+            self._counts[counter] += amount
+
+    def add_wait(self, seconds):
+        with self._lock:
+            self._counts['waits'] += 1
+            self._wait_time += seconds
+
+    def reset(self):
+        with self._lock:
+            self._counts = dict.fromkeys(self.COUNTERS, 0)
+            self._wait_time = 0.0
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self._counts)
+            counts['wait_time_ms'] = round(self._wait_time * 1000, 3)
+        return counts
+
+
+class ConnectionPool:
+    """Up to max_size connections made by connect()
+
+    checkout() hands out an idle connection, or makes a new one while
+    fewer than max_size exist, or else waits up to timeout seconds for one
+    to be checked in before raising OperationalError. Connections older
+    than max_lifetime seconds are closed when they come back, so server
+    side resources and configuration changes are picked up eventually.
+    """
+
+    def __init__(self, connect, max_size, timeout, max_lifetime=None):
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.stats = PoolStats()
+        self._condition = threading.Condition()
+        # most recently used last
+        self._idle = deque()
+        # {id(connection): when it was made}
+        self._created = {}
+        self._size = 0
+        self._pid = os.getpid()
+
+    def checkout(self):
+        """Return (connection, True if it was used before)"""
+        deadline = None
+        with self._condition:
+            self._forget_if_forked()
+            while not self._idle and self._size >= self.max_size:
+                now = time.monotonic()
+                if deadline is None:
+                    deadline = now + self.timeout
+                    started = now
+                remaining = deadline - now
+                if remaining <= 0:
+                    self.stats.increment('timeouts')
+                    raise OperationalError(
+                        f'No database connection free after '
+                        f'{self.timeout}s ({self.max_size} in use)'
+                    )
+                self._condition.wait(remaining)
+            if deadline is not None:
+                self.stats.add_wait(time.monotonic() - started)
+
+            self.stats.increment('checkouts')
+            if self._idle:
+                return self._idle.pop(), True
+            self._size += 1
+
+        try:
+            connection = self.connect()
+        except BaseException:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+        self.stats.increment('connects')
+        with self._condition:
+            self._created[id(connection)] = time.monotonic()
+        return connection, False
+
+    def checkin(self, connection, reusable):
+        """Take back a connection, closing it unless reusable"""
+        with self._condition:
+            if self._forget_if_forked():
+                return
+            created = self._created.get(id(connection), 0)
+            expired = self.max_lifetime is not None and \
+                time.monotonic() - created >= self.max_lifetime
+            if reusable and not expired:
+                self._idle.append(connection)
+            else:
+                self._discard(connection)
+            self._condition.notify()
+
+        if not reusable or expired:
+            self._close(connection)
+
+    def close_idle(self):
+        """Close every idle connection, e.g. before dropping a database"""
+        with self._condition:
+            idle = list(self._idle)
+            self._idle.clear()
+            for connection in idle:
+                self._discard(connection)
+            self._condition.notify_all()
+
+        for connection in idle:
+            self._close(connection)
+
+    def snapshot(self):
+        """Return the pool's size and usage counters"""
+        with self._condition:
+            sizes = {
+                'max_size': self.max_size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+            }
+        return {**sizes, **self.stats.snapshot()}
+
+    def _discard(self, connection):
+        self._size -= 1
+        self._created.pop(id(connection), None)
+        self.stats.increment('discards')
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _forget_if_forked(self):
+        # connections inherited from a parent process belong to it
+        if self._pid == os.getpid():
+            return False
+        self._pid = os.getpid()
+        self._idle.clear()
+        self._created.clear()
+        self._size = 0
+        return True
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, conn_params, options, connect):
+    """Return the pool of connections made with conn_params
+
+    Pools are keyed by the parameters as well as the alias, so a test run
+    switching the database name gets a pool of its own.
+    """
+    key = (alias, tuple(sorted(
+        (name, str(value)) for name, value in conn_params.items()
+    )))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(
+                connect,
+                max_size=options.get('MAX_SIZE', 10),
+                timeout=options.get('TIMEOUT', 5),
+                max_lifetime=options.get('MAX_LIFETIME'),
+            )
+        return pool
+
+
+def close_idle_connections():
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_idle()
+
+
+def pool_stats():
+    """Return {alias: usage} of every pool of the process"""
+    with _pools_lock:
+        pools = list(_pools.items())
+
+    stats = {}
+    for (alias, _), pool in pools:
+        snapshot = pool.snapshot()
+        if alias in stats:
+            # the same alias pointed at several databases, e.g. in tests
+            for name, value in snapshot.items():
+                stats[alias][name] += value
+        else:
+            stats[alias] = snapshot
+    return stats
+
+
+POOL_GAUGES = ('max_size', 'idle', 'in_use')
+
+
+@metrics.register_collector
+def collect_stats():
+    samples = []
+    for alias, stats in sorted(pool_stats().items()):
+        labels = {'alias': alias}
+        wait_time = stats.pop('wait_time_ms') / 1000
+        for name in POOL_GAUGES:
+            samples.append(metrics.Sample(
+                f'app_db_pool_{name}', 'gauge',
+                f'Database pool connections ({name}).', labels,
+                stats.pop(name)
+            ))
+        samples.extend(metrics.counter_samples(
+            'app_db_pool', 'Database pool events', stats, labels
+        ))
+        samples.append(metrics.Sample(
+            'app_db_pool_wait_seconds_total', 'counter',
+            'Time spent waiting for a free connection.', labels, wait_time
+        ))
+    return samples
@@ -0,0 +1,58 @@
+"""Checks of the services a process needs before it can take traffic
+
+Used by the wait_for_db command and the /readyz endpoint. Every check
+returns the seconds it took and raises if the service is unusable.
+"""
+import tempfile
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+
+def ping_database(alias='default'):
+    """Run SELECT 1 on a database, connecting first if needed"""
+    connection = connections[alias]
+    start = time.monotonic()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+    except DatabaseError:
+        # a broken connection is not replaced until it is closed
+        if not connection.in_atomic_block:
+            connection.close()
+        raise
+    return time.monotonic() - start
+
+
+def check_media():
+    """Check MEDIA_ROOT can be written to"""
+    start = time.monotonic()
+    with tempfile.TemporaryFile(dir=settings.MEDIA_ROOT):
+        pass
+    return time.monotonic() - start
+
+
+CHECKS = {
+    'database': ping_database,
+    'media': check_media,
+}
+
+
+def run_checks():
+    """Run every check, returning (all passed, {name: result})"""
+    results = {}
+    for name, check in CHECKS.items():
+        try:
+            latency = check()
+        except (DatabaseError, OSError) as error:
+            # the type is enough to act on, without leaking details
+            results[name] = {'ok': False, 'error': type(error).__name__}
+        else:
+            results[name] = {
+                'ok': True,
+                'latency_ms': round(latency * 1000, 3),
+            }
+
+    return all(result['ok'] for result in results.values()), results
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.models import StoredFile
+
+
+class Command(BaseCommand):
+    """Django command to delete the stored files nothing references
+
+    The files are normally deleted right after they lose their last
+    reference. This catches up after a collection was interrupted, e.g. by
+    a restart, and deletes the files of uploads that rolled back once they
+    are --orphan-age seconds old.
+    """
+
+    help = 'Delete stored images that no recipe uses any more'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.RECIPE_IMAGE_GC_BATCH_SIZE)
+        parser.add_argument('--orphan-age', type=int,
+                            default=settings.RECIPE_IMAGE_ORPHAN_AGE)
+
+    def handle(self, *args, **options):
+        deleted = StoredFile.objects.collect_garbage(
+            options['batch_size'], orphan_age=options['orphan_age']
+        )
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} files'))
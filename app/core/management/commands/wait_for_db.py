@@ -1,23 +1,69 @@
+import random
 import time
 
 from django.db import connections
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+
+from core.health import ping_database
 
 
 class Command(BaseCommand):
-    """Django command to pause execution to pause until db is available"""
+    """Django command to pause execution to pause until db is available
+
+    Every attempt runs a real query, as merely looking the connection up
+    does not connect. Failed attempts are retried after an exponentially
+    growing, jittered delay until --max-wait seconds have passed.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument(
+            '--timeout', type=int, default=None,
+            help='Seconds one connection attempt may take (PostgreSQL), '
+                 'overriding the connect_timeout of the database settings'
+        )
+        parser.add_argument(
+            '--max-wait', type=float, default=60,
+            help='Seconds to keep trying before failing'
+        )
+        parser.add_argument('--initial-delay', type=float, default=0.5)
+        parser.add_argument('--max-delay', type=float, default=5)
 
     # handle function is run whenever this management command is run
     def handle(self, *args, **options):
+        alias = options['database']
+        connection = connections[alias]
+        if options['timeout'] is not None and \
+                connection.vendor == 'postgresql':
+            connection.settings_dict['OPTIONS']['connect_timeout'] = \
+                options['timeout']
+
         self.stdout.write('Waiting for database...')
-        db_conn = None
+        deadline = time.monotonic() + options['max_wait']
+        attempt = 0
 
-        while not db_conn:
+        while True:
             try:
-                db_conn = connections['default']
+                ping_database(alias)
+                break
             except OperationalError:
-                self.stdout.write('Database unavailable, waiting 1 second...')
-                time.sleep(1)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise CommandError(
+                        f"Database unavailable after {options['max_wait']}s"
+                    )
+
+                delay = min(
+                    options['max_delay'],
+                    options['initial_delay'] * 2 ** attempt
+                )
+                # jitter spreads out the retries of pods started together
+                delay = min(random.uniform(delay / 2, delay), remaining)
+                attempt += 1
+                self.stdout.write(
+                    f'Database unavailable, waiting {delay:.2f} seconds...'
+                )
+                time.sleep(delay)
 
         self.stdout.write(self.style.SUCCESS('Database available'))
@@ -0,0 +1,165 @@
+"""Send stored files once a view has decided the request may have them
+
+settings.MEDIA_SERVE_MODE picks who transfers the file:
+
+- 'django' streams it from the Python process with FileResponse. The
+  server's wsgi.file_wrapper (gunicorn, uWSGI) can then sendfile() it, and
+  single byte ranges are answered with 206 Partial Content.
+- 'x-accel-redirect' leaves it to nginx, with an internal location that
+  aliases MEDIA_ROOT at MEDIA_ACCEL_REDIRECT_PREFIX, e.g.
+
+      location /protected-media/ {
+          internal;
+          alias /vol/web/media/;
+      }
+
+- 'x-sendfile' leaves it to Apache's mod_xsendfile or lighttpd.
+
+The proxies answer range requests themselves.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response, \
+                               patch_cache_control
+from django.utils.http import http_date
+
+
+DJANGO = 'django'
+X_ACCEL_REDIRECT = 'x-accel-redirect'
+X_SENDFILE = 'x-sendfile'
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# a year, the longest max-age caches are asked to honour
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+class FileRange:
+    """A file cut down to the next `length` bytes
+
+    Keeps fileno() so that wsgi.file_wrapper can still sendfile() it, from
+    the current offset for the response's Content-Length.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """Return the (start, end) byte range asked for, both inclusive
+
+    Returns None to send the whole file, which is allowed for headers that
+    are malformed or ask for several ranges, and raises ValueError if the
+    range lies beyond the end of the file.
+    """
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+
+    first, last = match.groups()
+    if first == '':
+        # the last n bytes
+        if int(last) == 0:
+            raise ValueError(header)
+        return max(size - int(last), 0), size - 1
+    if int(first) >= size:
+        raise ValueError(header)
+
+    end = min(int(last), size - 1) if last else size - 1
+    if end < int(first):
+        return None
+    return int(first), end
+
+
+def serve_file(request, name, path, immutable=False):
+    """Return the response sending the stored file `name` found at path
+
+    Immutable files, whose name changes with their content, may be cached
+    for good. Others are revalidated with their ETag every time. Responses
+    are private since the view authorised the requesting user.
+    """
+    stat = os.stat(path)
+    etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+    last_modified = int(stat.st_mtime)
+
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        response = transfer_file(request, name, path, stat.st_size, etag)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if immutable:
+        patch_cache_control(
+            response, private=True, max_age=IMMUTABLE_MAX_AGE, immutable=True
+        )
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def transfer_file(request, name, path, size, etag):
+    content_type = mimetypes.guess_type(name)[0] or \
+        'application/octet-stream'
+    mode = settings.MEDIA_SERVE_MODE
+
+    if mode == X_ACCEL_REDIRECT:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = (
+            settings.MEDIA_ACCEL_REDIRECT_PREFIX + quote(name)
+        )
+        return response
+
+    if mode == X_SENDFILE:
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+        return response
+
+    byte_range = None
+    header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    # a range of a file that changed since the client's copy is useless
+    if header and (not if_range or if_range == etag):
+        try:
+            byte_range = parse_range(header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(
+            FileRange(open(path, 'rb'), start, length),
+            status=206,
+            content_type=content_type
+        )
+        response['Content-Length'] = length
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,196 @@
+"""Per-process metrics served in the Prometheus text format at /metrics
+
+Request metrics are recorded by core.middleware.PerformanceMiddleware
+into fixed-bucket histograms: an observation costs a bisect and a few
+additions under a lock. Counters kept elsewhere, like the cache stats,
+are added at scrape time by collectors, see register_collector().
+
+Every worker process keeps its own numbers; Prometheus sums them up.
+"""
+import bisect
+import threading
+from collections import namedtuple
+
+
+# seconds, from a cached response to a slow export
+DURATION_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+Sample = namedtuple('Sample', 'name kind help labels value')
+
+
+class Histogram:
+    """Cumulative histogram of observations, per set of label values"""
+
+    def __init__(self, name, help, labelnames, buckets):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # {label values: [count per bucket, +Inf last], sum}
+        self._series = {}
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [
+                    [0] * (len(self.buckets) + 1), 0.0
+                ]
+            series[0][index] += 1
+            series[1] += value
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def snapshot(self):
+        """Return {label values: (cumulative bucket counts, sum)}"""
+        with self._lock:
+            series = {
+                labels: (list(counts), total)
+                for labels, (counts, total) in self._series.items()
+            }
+
+        result = {}
+        for labels, (counts, total) in series.items():
+            cumulative = []
+            running = 0
+            for count in counts:
+                running += count
+                cumulative.append(running)
+            result[labels] = (cumulative, total)
+        return result
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.help}',
+            f'# TYPE {self.name} histogram',
+        ]
+        bounds = [format_value(bound) for bound in self.buckets] + ['+Inf']
+        for labels, (cumulative, total) in sorted(self.snapshot().items()):
+            names = list(zip(self.labelnames, labels))
+            for bound, count in zip(bounds, cumulative):
+                lines.append(
+                    f'{self.name}_bucket'
+                    f'{format_labels(names + [("le", bound)])} {count}'
+                )
+            lines.append(
+                f'{self.name}_sum{format_labels(names)} {format_value(total)}'
+            )
+            lines.append(
+                f'{self.name}_count{format_labels(names)} {cumulative[-1]}'
+            )
+        return lines
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def format_labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', r'\\').replace('"', r'\"')
+         .replace('\n', r'\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+REQUEST_LABELS = ('view', 'method')
+
+request_duration = Histogram(
+    'app_request_duration_seconds',
+    'Time from the view being called to the response being rendered.',
+    REQUEST_LABELS, DURATION_BUCKETS
+)
+db_duration = Histogram(
+    'app_request_db_duration_seconds',
+    'Time spent running SQL queries per request.',
+    REQUEST_LABELS, DURATION_BUCKETS
+)
+db_queries = Histogram(
+    'app_request_db_queries',
+    'SQL queries run per request.',
+    REQUEST_LABELS, QUERY_COUNT_BUCKETS
+)
+serialize_duration = Histogram(
+    'app_request_serialize_duration_seconds',
+    'Time spent in the view outside SQL queries per request.',
+    REQUEST_LABELS, DURATION_BUCKETS
+)
+render_duration = Histogram(
+    'app_request_render_duration_seconds',
+    'Time spent rendering the response body per request.',
+    REQUEST_LABELS, DURATION_BUCKETS
+)
+response_size = Histogram(
+    'app_response_size_bytes',
+    'Size of the response body, where known up front.',
+    REQUEST_LABELS, SIZE_BUCKETS
+)
+
+HISTOGRAMS = (
+    request_duration, db_duration, db_queries, serialize_duration,
+    render_duration, response_size,
+)
+
+_collectors = []
+
+
+def register_collector(collector):
+    """Add a callable returning Samples to every scrape
+
+    Usable as a decorator.
+    """
+    _collectors.append(collector)
+    return collector
+
+
+def reset():
+    for histogram in HISTOGRAMS:
+        histogram.reset()
+
+
+def render():
+    """Return every metric in the Prometheus text exposition format"""
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+
+    # the samples of a metric have to be listed together
+    families = {}
+    for collector in _collectors:
+        for sample in collector():
+            families.setdefault(sample.name, []).append(sample)
+
+    for name, samples in families.items():
+        lines.append(f'# HELP {name} {samples[0].help}')
+        lines.append(f'# TYPE {name} {samples[0].kind}')
+        for sample in samples:
+            lines.append(
+                f'{name}{format_labels(sorted(sample.labels.items()))}'
+                f' {format_value(sample.value)}'
+            )
+
+    return '\n'.join(lines) + '\n'
+
+
+def counter_samples(prefix, help, counts, labels=None):
+    """Return Samples of a {name: count} dict of stats counters"""
+    return [
+        Sample(
+            f'{prefix}_{name}_total', 'counter', f'{help} ({name}).',
+            labels or {}, value
+        )
+        for name, value in counts.items()
+    ]
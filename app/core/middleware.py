@@ -0,0 +1,177 @@
+import random
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from core import metrics, routers
+from core.nplusone import detect_n_plus_one
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class DatabaseRoutingMiddleware:
+    """Let safe requests read from the replicas, see core.routers
+
+    Requests with other methods use the primary throughout, and mark
+    their user so the user's next reads stay on it too.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method not in SAFE_METHODS:
+            response = self.get_response(request)
+            # set by the view once it authenticated the request
+            user = request.__dict__.get('user')
+            if getattr(user, 'pk', None) is not None:
+                routers.mark_sticky([user.pk])
+            return response
+
+        routers.start_reads(request)
+        try:
+            response = self.get_response(request)
+            # streamed bodies run their queries as they are sent
+            if getattr(response, 'streaming', False):
+                response.streaming_content = routers.stream_reads(
+                    response.streaming_content
+                )
+            return response
+        finally:
+            routers.end_reads()
+
+
+class RequestTimings:
+    """Where a sampled request spent its time, in seconds
+
+    Also the execute wrapper counting and timing its SQL queries.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.view_ended = None
+        self.view_db = None
+        self.render = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - start
+            self.queries += 1
+
+    def end_view(self):
+        if self.view_ended is None:
+            self.view_ended = time.perf_counter()
+            self.view_db = self.db
+
+    def rendered(self, response):
+        self.render = time.perf_counter() - self.view_ended
+
+    @property
+    def serialize(self):
+        """Time in the view outside SQL: building and serializing data
+
+        The view's querysets are only evaluated while it serializes, so
+        taking the queries out leaves the Python side of that work.
+        """
+        if self.view_started is None:
+            return 0.0
+        view = self.view_ended - self.view_started
+        return max(view - self.view_db, 0.0)
+
+
+class PerformanceMiddleware:
+    """Time the views of settings.METRICS_NAMESPACES, see core.metrics
+
+    A settings.METRICS_SAMPLE_RATE share of requests is measured: SQL
+    query count and time, serialization and render time, response size.
+    Measured responses get a Server-Timing header for the browser's
+    developer tools, and the numbers are added to the histograms served
+    at /metrics.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED or \
+                random.random() >= settings.METRICS_SAMPLE_RATE:
+            return self.get_response(request)
+
+        timings = request.performance_timings = RequestTimings()
+        # what connection.execute_wrapper() does, without the context
+        # manager machinery it costs on every request
+        wrapped = connections.all()
+        for connection in wrapped:
+            connection.execute_wrappers.append(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            for connection in wrapped:
+                connection.execute_wrappers.remove(timings)
+
+        match = request.resolver_match
+        if match is None or match.namespace not in settings.METRICS_NAMESPACES:
+            return response
+
+        timings.end_view()
+        self.record(request, response, timings)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = getattr(request, 'performance_timings', None)
+        if timings is not None:
+            timings.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # called just before the response is rendered
+        timings = getattr(request, 'performance_timings', None)
+        if timings is not None:
+            timings.end_view()
+            response.add_post_render_callback(timings.rendered)
+        return response
+
+    def record(self, request, response, timings):
+        total = time.perf_counter() - timings.started
+        labels = (request.resolver_match.view_name, request.method)
+        metrics.request_duration.observe(labels, total)
+        metrics.db_duration.observe(labels, timings.db)
+        metrics.db_queries.observe(labels, timings.queries)
+        metrics.serialize_duration.observe(labels, timings.serialize)
+        metrics.render_duration.observe(labels, timings.render)
+        if not response.streaming:
+            metrics.response_size.observe(labels, len(response.content))
+
+        entries = [
+            f'db;dur={timings.db * 1000:.3f};desc="{timings.queries} queries"',
+            f'serialize;dur={timings.serialize * 1000:.3f}',
+            f'render;dur={timings.render * 1000:.3f}',
+            f'total;dur={total * 1000:.3f}',
+        ]
+        if response.has_header('Server-Timing'):
+            entries.insert(0, response['Server-Timing'])
+        response['Server-Timing'] = ', '.join(entries)
+
+
+class NPlusOneMiddleware:
+    """Report queries repeated once per row, see core.nplusone
+
+    Does nothing unless settings.NPLUSONE_ENABLED is set.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.NPLUSONE_ENABLED:
+            return self.get_response(request)
+
+        with detect_n_plus_one():
+            return self.get_response(request)
@@ -0,0 +1,40 @@
+# Generated by Django 2.1.15 on 2026-10-18 19:20
+
+from django.db import migrations
+
+
+# The auto created M2M through tables only get a unique (recipe_id, x_id)
+# index, which cannot serve "x_id IN (...) GROUP BY recipe_id". These
+# covering indexes let the tag/ingredient filters run as index only scans.
+# The through tables have no user column; the per-user side of the lookup
+# is served by core_recipe_user_id_desc_idx on the recipe table.
+INDEXES = (
+    ('core_recipe_tags', 'tag_id'),
+    ('core_recipe_ingredients', 'ingredient_id'),
+)
+
+
+def create_sql(table, column):
+    return (
+        f'CREATE INDEX {table}_{column}_recipe_idx '
+        f'ON {table} ({column}, recipe_id);'
+    )
+
+
+def drop_sql(table, column):
+    return f'DROP INDEX {table}_{column}_recipe_idx;'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[create_sql(table, column)],
+            reverse_sql=[drop_sql(table, column)],
+        )
+        for table, column in INDEXES
+    ]
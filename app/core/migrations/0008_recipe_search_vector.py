@@ -0,0 +1,76 @@
+# Generated by Django 2.1.15 on 2026-10-18 19:02
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+BACKFILL_BATCH_SIZE = 1000
+
+# core.search.UPDATE_SEARCH_VECTOR_SQL as of this migration, copied so
+# later changes to the app do not change what the migration does
+BACKFILL_SQL = """
+    UPDATE core_recipe AS recipe SET search_vector =
+        setweight(to_tsvector('english', recipe.title), 'A') ||
+        setweight(to_tsvector('english', coalesce((
+            SELECT string_agg(tag.name, ' ')
+            FROM core_tag AS tag
+            JOIN core_recipe_tags AS link ON link.tag_id = tag.id
+            WHERE link.recipe_id = recipe.id
+        ), '')), 'B') ||
+        setweight(to_tsvector('english', coalesce((
+            SELECT string_agg(ingredient.name, ' ')
+            FROM core_ingredient AS ingredient
+            JOIN core_recipe_ingredients AS link
+                ON link.ingredient_id = ingredient.id
+            WHERE link.recipe_id = recipe.id
+        ), '')), 'B')
+    WHERE recipe.id = ANY(%s)
+"""
+
+
+def create_search_index(apps, schema_editor):
+    """Add the GIN index and fill in the vectors of existing recipes"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute(
+        'CREATE INDEX core_recipe_search_vector_gin '
+        'ON core_recipe USING gin (search_vector)'
+    )
+
+    Recipe = apps.get_model('core', 'Recipe')
+    alias = schema_editor.connection.alias
+    recipe_ids = list(
+        Recipe.objects.using(alias).values_list('id', flat=True)
+    )
+    with schema_editor.connection.cursor() as cursor:
+        for start in range(0, len(recipe_ids), BACKFILL_BATCH_SIZE):
+            cursor.execute(
+                BACKFILL_SQL,
+                [recipe_ids[start:start + BACKFILL_BATCH_SIZE]]
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute('DROP INDEX core_recipe_search_vector_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_recipe_m2m_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        # GIN indexes only exist on PostgreSQL, so the index is created here
+        # rather than in Recipe.Meta where SQLite would fail to build it
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 2.1.15 on 2026-10-18 19:40
+
+from django.db import migrations
+
+
+TABLES = ('core_tag', 'core_ingredient')
+
+
+def create_autocomplete_indexes(apps, schema_editor):
+    """Add the prefix and (where possible) trigram name indexes"""
+    vendor = schema_editor.connection.vendor
+
+    for table in TABLES:
+        # text_pattern_ops lets PostgreSQL use the index for LIKE 'abc%'
+        # whatever the database collation is
+        opclass = ' text_pattern_ops' if vendor == 'postgresql' else ''
+        schema_editor.execute(
+            f'CREATE INDEX {table}_user_lower_name_idx '
+            f'ON {table} (user_id, lower(name){opclass})'
+        )
+
+    if vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+        )
+        if cursor.fetchone() is None:
+            # fuzzy matching is skipped at runtime without the extension
+            return
+
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in TABLES:
+        schema_editor.execute(
+            f'CREATE INDEX {table}_name_trgm_idx '
+            f'ON {table} USING gin (name gin_trgm_ops)'
+        )
+
+
+def drop_autocomplete_indexes(apps, schema_editor):
+    for table in TABLES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {table}_name_trgm_idx')
+        schema_editor.execute(f'DROP INDEX {table}_user_lower_name_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_recipe_search_vector'),
+    ]
+
+    operations = [
+        # Django 2.1 cannot declare expression indexes in Model.Meta
+        migrations.RunPython(
+            create_autocomplete_indexes,
+            drop_autocomplete_indexes
+        ),
+    ]
@@ -0,0 +1,82 @@
+from django.db import migrations
+from django.db.models import Count, Min
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+
+# (model, recipe M2M field) of the per user named models
+NAMED_MODELS = (
+    ('Tag', 'tags'),
+    ('Ingredient', 'ingredients'),
+)
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """Merge the tags/ingredients a user has under the same name
+
+    The oldest object of every (user, lower(name)) group is kept and the
+    recipes of the others are moved over to it.
+    """
+    using = schema_editor.connection.alias
+    User = apps.get_model('core', 'User')
+    Recipe = apps.get_model('core', 'Recipe')
+
+    changed_users = set()
+    for model_name, field_name in NAMED_MODELS:
+        model = apps.get_model('core', model_name)
+        through = getattr(Recipe, field_name).through
+        column = model_name.lower() + '_id'
+
+        groups = model.objects.using(using).annotate(
+            name_lower=Lower('name')
+        ).values('user_id', 'name_lower').annotate(
+            keep=Min('id'),
+            count=Count('id')
+        ).filter(count__gt=1)
+
+        for group in groups:
+            duplicates = list(model.objects.using(using).annotate(
+                name_lower=Lower('name')
+            ).filter(
+                user_id=group['user_id'],
+                name_lower=group['name_lower']
+            ).exclude(id=group['keep']).values_list('id', flat=True))
+
+            links = through.objects.using(using)
+            recipe_ids = set(links.filter(
+                **{f'{column}__in': duplicates}
+            ).values_list('recipe_id', flat=True))
+            linked = set(links.filter(
+                **{column: group['keep'], 'recipe_id__in': recipe_ids}
+            ).values_list('recipe_id', flat=True))
+            # one link to the kept object per recipe, a recipe may be
+            # linked to several of the duplicates
+            links.bulk_create([
+                through(recipe_id=recipe_id, **{column: group['keep']})
+                for recipe_id in sorted(recipe_ids - linked)
+            ])
+            links.filter(**{f'{column}__in': duplicates}).delete()
+
+            model.objects.using(using).filter(id__in=duplicates).delete()
+            changed_users.add(group['user_id'])
+
+    # invalidate the ETags of the users whose lists changed
+    User.objects.using(using).filter(
+        id__in=changed_users
+    ).update(data_changed_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_change_tracking'),
+    ]
+
+    operations = [
+        # the unique index of 0012 is created in a separate migration as
+        # PostgreSQL cannot index a table with pending deferred FK checks
+        migrations.RunPython(
+            merge_duplicate_names,
+            migrations.RunPython.noop
+        ),
+    ]
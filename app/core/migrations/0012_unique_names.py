@@ -0,0 +1,48 @@
+from django.db import migrations
+
+
+TABLES = ('core_tag', 'core_ingredient')
+
+
+def create_unique_indexes(apps, schema_editor):
+    """Make the (user_id, lower(name)) autocomplete indexes unique"""
+    vendor = schema_editor.connection.vendor
+
+    for table in TABLES:
+        opclass = ' text_pattern_ops' if vendor == 'postgresql' else ''
+        # SQLite already lost the index when 0010 rebuilt the table
+        schema_editor.execute(
+            f'DROP INDEX IF EXISTS {table}_user_lower_name_idx'
+        )
+        schema_editor.execute(
+            f'CREATE UNIQUE INDEX {table}_user_lower_name_uniq '
+            f'ON {table} (user_id, lower(name){opclass})'
+        )
+
+
+def drop_unique_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    for table in TABLES:
+        opclass = ' text_pattern_ops' if vendor == 'postgresql' else ''
+        schema_editor.execute(f'DROP INDEX {table}_user_lower_name_uniq')
+        schema_editor.execute(
+            f'CREATE INDEX {table}_user_lower_name_idx '
+            f'ON {table} (user_id, lower(name){opclass})'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_merge_duplicate_names'),
+    ]
+
+    operations = [
+        # the index also serves the autocomplete prefix lookups, so it
+        # replaces the plain index of 0009 rather than adding another one
+        migrations.RunPython(
+            create_unique_indexes,
+            drop_unique_indexes
+        ),
+    ]
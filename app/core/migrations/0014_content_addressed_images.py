@@ -0,0 +1,51 @@
+# Generated by Django 2.1.15 on 2026-10-18 19:49
+
+import core.models
+import core.storage
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_image_references(apps, schema_editor):
+    """Count the recipes using each existing image
+
+    Images uploaded before keep their flat uploads/recipe/<uuid> names,
+    which the storage still serves, and are deleted like any other once
+    no recipe uses them.
+    """
+    using = schema_editor.connection.alias
+    Recipe = apps.get_model('core', 'Recipe')
+    StoredFile = apps.get_model('core', 'StoredFile')
+
+    images = Recipe.objects.using(using).exclude(image='').exclude(
+        image__isnull=True
+    ).values('image').annotate(refcount=Count('id'))
+    StoredFile.objects.using(using).bulk_create(
+        StoredFile(name=row['image'], refcount=row['refcount'])
+        for row in images.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('refcount', models.PositiveIntegerField(db_index=True, default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(null=True, storage=core.storage.ContentAddressedStorage(), upload_to=core.models.recipe_image_file_path),
+        ),
+        migrations.RunPython(
+            count_image_references, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.15 on 2026-10-18 21:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_signed_access_tokens'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accesstokenrevocation',
+            name='claims_changed',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,10 +1,19 @@
-from django.db import models
+from collections import Counter, defaultdict
+
+from django.db import models, connections, router, transaction, \
+                      IntegrityError
+from django.db.models.functions import Lower
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
                                        PermissionsMixin
 from django.conf import settings
+from django.utils import timezone
+
+from core.storage import image_storage
 
 import uuid
 import os
+import time
 
 
 def recipe_image_file_path(instance, filename):
@@ -46,6 +55,98 @@ class UserManager(BaseUserManager):
         return user
 
 
+class UserNameManager(models.Manager):
+    """Manager for models whose names are unique per user, ignoring case"""
+
+    # Inserts the new names and returns the rows of all of them in a single
+    # statement. The outer SELECT does not see the rows inserted by the
+    # `created` CTE, so it only finds the names that already existed
+    UPSERT_SQL = """
+        WITH names (name) AS (SELECT unnest(%(names)s::text[])),
+        created AS (
+            INSERT INTO {table} (user_id, name, updated_at)
+            SELECT %(user_id)s, name, %(now)s FROM names
+            ON CONFLICT (user_id, lower(name)) DO NOTHING
+            RETURNING id, name
+        )
+        SELECT id, name, true FROM created
+        UNION ALL
+        SELECT existing.id, existing.name, false FROM {table} AS existing
+        WHERE existing.user_id = %(user_id)s
+            AND lower(existing.name) IN (SELECT lower(name) FROM names)
+    """
+
+    def filter_names(self, user, names):
+        """Return the user's objects with any of the names, ignoring case"""
+        return self.get_queryset().annotate(
+            name_lower=Lower('name')
+        ).filter(
+            user=user,
+            name_lower__in=[name.lower() for name in names]
+        )
+
+    def get_or_create_names(self, user, names):
+        """Return (object, created) for each name, creating missing ones
+
+        Names are matched ignoring case and the first spelling of a name
+        is kept. On PostgreSQL this is a single INSERT ... ON CONFLICT
+        round trip. Bulk inserts send no post_save signals, so callers
+        must record the change of the user's data themselves.
+        """
+        unique = {}
+        for name in names:
+            unique.setdefault(name.lower(), name)
+
+        using = router.db_for_write(self.model)
+        if connections[using].vendor == 'postgresql':
+            found = self._upsert_names(user, list(unique.values()), using)
+        else:
+            found = self._create_names(user, list(unique.values()), using)
+
+        # names created by a concurrent transaction after the upsert took
+        # its snapshot were neither inserted nor seen by it
+        missing = [name for key, name in unique.items() if key not in found]
+        if missing:
+            for obj in self.filter_names(user, missing).using(using):
+                found[obj.name.lower()] = (obj, False)
+
+        return [found[key] for key in unique]
+
+    def _upsert_names(self, user, names, using):
+        connection = connections[using]
+        sql = self.UPSERT_SQL.format(
+            table=connection.ops.quote_name(self.model._meta.db_table)
+        )
+        params = {'names': names, 'user_id': user.pk, 'now': timezone.now()}
+
+        found = {}
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            for pk, name, created in cursor.fetchall():
+                obj = self.model(id=pk, name=name, user=user)
+                obj._state.adding = False
+                obj._state.db = using
+                found[name.lower()] = (obj, created)
+
+        return found
+
+    def _create_names(self, user, names, using):
+        with transaction.atomic(using=using):
+            existing = {
+                obj.name.lower()
+                for obj in self.filter_names(user, names).using(using)
+            }
+            self.using(using).bulk_create([
+                self.model(user=user, name=name)
+                for name in names if name.lower() not in existing
+            ])
+
+            return {
+                obj.name.lower(): (obj, obj.name.lower() not in existing)
+                for obj in self.filter_names(user, names).using(using)
+            }
+
+
 class User(AbstractBaseUser, PermissionsMixin):
     """Custom user model using email instead of username"""
 
@@ -53,6 +154,9 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # last time any of the user's tags, ingredients or recipes changed.
+    # Maintained by core.signals and used for ETag/Last-Modified headers
+    data_changed_at = models.DateTimeField(null=True, editable=False)
 
     # Assign UserManager
     objects = UserManager()
@@ -68,6 +172,18 @@ class Tag(models.Model):
         settings.AUTH_USER_MODEL,  # best practice to get auth model from settings
         on_delete=models.CASCADE
     )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # names are unique per user ignoring case, which is enforced by the
+    # (user_id, lower(name)) index of migration 0012
+    objects = UserNameManager()
+
+    class Meta:
+        indexes = [
+            # backs the (-name, id) order the list is paginated in
+            models.Index(fields=['user', '-name', 'id'],
+                         name='core_tag_user_name_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -81,11 +197,32 @@ class Ingredient(models.Model):
         settings.AUTH_USER_MODEL,  # best practice to get auth model from settings
         on_delete=models.CASCADE
     )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # unique per user ignoring case, see Tag
+    objects = UserNameManager()
+
+    class Meta:
+        indexes = [
+            # backs the (-name, id) order the list is paginated in
+            models.Index(fields=['user', '-name', 'id'],
+                         name='core_ingr_user_name_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
 
+IMAGE_PENDING = 'pending'
+IMAGE_READY = 'ready'
+IMAGE_FAILED = 'failed'
+IMAGE_STATUS_CHOICES = (
+    (IMAGE_PENDING, 'Pending'),
+    (IMAGE_READY, 'Ready'),
+    (IMAGE_FAILED, 'Failed'),
+)
+
+
 class Recipe(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -97,8 +234,180 @@ class Recipe(models.Model):
     link = models.CharField(max_length=255, blank=True)
     ingredients = models.ManyToManyField('Ingredient')
     tags = models.ManyToManyField('Tag')
-    image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    # stored by content hash, so recipes with the same picture share a file
+    image = models.ImageField(
+        null=True,
+        upload_to=recipe_image_file_path,
+        storage=image_storage
+    )
+    # progress of the thumbnails recipe.images renders off the request
+    image_status = models.CharField(
+        max_length=16, blank=True, choices=IMAGE_STATUS_CHOICES
+    )
+    # comma separated names of the variants already written
+    image_variants = models.CharField(max_length=255, blank=True)
+    # weighted title, tag and ingredient names, kept in sync by the handlers
+    # in core.signals. Only populated on PostgreSQL
+    search_vector = SearchVectorField(null=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-id'],
+                         name='core_recipe_user_id_desc_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    @property
+    def ready_image_variants(self):
+        """Return the names of the image variants already written"""
+        return [name for name in self.image_variants.split(',') if name]
+
+
+class StoredFileManager(models.Manager):
+    """Reference counting for the files of a ContentAddressedStorage"""
+
+    def write_db(self):
+        return self._db or router.db_for_write(self.model)
+
+    def acquire(self, name):
+        """Take a reference on a stored file"""
+        # the UPDATE waits for a garbage collection holding the row, which
+        # then has deleted it by the time the row is created again
+        if self.filter(name=name).update(refcount=models.F('refcount') + 1):
+            return
+
+        try:
+            with transaction.atomic(using=self.write_db()):
+                self.create(name=name, refcount=1)
+        except IntegrityError:
+            # created concurrently
+            self.filter(name=name).update(refcount=models.F('refcount') + 1)
+
+    def release(self, names):
+        """Drop one reference on each of names, a name may repeat"""
+        for name, count in Counter(name for name in names if name).items():
+            self.filter(name=name, refcount__gte=count).update(
+                refcount=models.F('refcount') - count
+            )
+
+    def collect_garbage(self, batch_size=500, orphan_age=None):
+        """Delete the unreferenced files and the files derived from them
+
+        Works in transactions of batch_size files and returns the number
+        of files deleted. The rows are locked while the files go, so a
+        concurrent acquire() waits and then starts over.
+
+        Given orphan_age in seconds, also deletes the stored files without
+        any row that were last written longer ago than that: those saved
+        in transactions that rolled back. Their rows are gone with the
+        transaction, so they are only found by listing the storage.
+        """
+        deleted = 0
+        while True:
+            count = self._collect_batch(batch_size)
+            deleted += count
+            if count < batch_size:
+                break
+
+        if orphan_age is not None:
+            deleted += self._collect_orphans(orphan_age)
+        return deleted
+
+    def _collect_batch(self, batch_size):
+        using = self.write_db()
+        with transaction.atomic(using=using):
+            names = list(
+                self.using(using).select_for_update(skip_locked=True).filter(
+                    refcount=0
+                ).values_list('name', flat=True)[:batch_size]
+            )
+            for name in names:
+                image_storage.delete_with_derived(name)
+            self.using(using).filter(name__in=names, refcount=0).delete()
+
+        return len(names)
+
+    def _collect_orphans(self, orphan_age):
+        using = self.write_db()
+        cutoff = time.time() - orphan_age
+        directories = defaultdict(list)
+        for name in image_storage.walk_content():
+            directories[os.path.dirname(name)].append(name)
+
+        deleted = 0
+        for directory, names in directories.items():
+            # a directory holds few files, see ContentAddressedStorage
+            referenced = {
+                image_storage.source_stem(name) for name in
+                self.using(using).filter(
+                    name__startswith=f'{directory}/'
+                ).values_list('name', flat=True)
+            }
+            for name in names:
+                if image_storage.source_stem(name) in referenced:
+                    continue
+                try:
+                    modified = os.path.getmtime(image_storage.path(name))
+                except FileNotFoundError:
+                    continue
+                # younger files may belong to a save not committed yet
+                if modified < cutoff:
+                    image_storage.delete(name)
+                    deleted += 1
+
+        return deleted
+
+
+class StoredFile(models.Model):
+    """A content addressed file and the number of references to it"""
+
+    name = models.CharField(max_length=255, primary_key=True)
+    # files at 0 are deleted by StoredFile.objects.collect_garbage()
+    refcount = models.PositiveIntegerField(default=0, db_index=True)
+
+    objects = StoredFileManager()
+
+    def __str__(self):
+        return self.name
+
+
+class RefreshToken(models.Model):
+    """Long lived, single use token exchanged for signed access tokens
+
+    Only the SHA-256 of the token is stored. See core.tokens.
+    """
+
+    digest = models.CharField(max_length=64, primary_key=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    # set once the token has been exchanged or revoked
+    used = models.BooleanField(default=False)
+
+
+class AccessTokenRevocation(models.Model):
+    """A revoked signed access token, or all of a user's up to a time
+
+    Rows with a jti revoke that one token. Rows without one revoke every
+    token of the user issued before `created`, unless claims_changed is
+    set: the tokens then stay valid, but their claims are out of date and
+    the user is read from the database instead. A row is of no use once
+    every token it covers has expired, at `expires_at`.
+    """
+
+    jti = models.CharField(max_length=32, blank=True)
+    claims_changed = models.BooleanField(default=False)
+    # outlives the user, whose tokens stay valid until they expire
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False
+    )
+    created = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
@@ -0,0 +1,131 @@
+"""Catch N+1 queries: the same SELECT run once per row of a result
+
+While a QueryShapeRecorder is installed on the connections, every SELECT
+is reduced to its shape, the SQL less its parameter values and the
+length of its IN lists. A shape run more than `threshold` times is the
+per-row query of an unprefetched relation, and is reported with the
+serializer field that asked for it and the stack of project code that
+led there.
+
+Only SELECTs are counted: repeated writes are not N+1 reads.
+
+core.middleware.NPlusOneMiddleware watches every request when
+settings.NPLUSONE_ENABLED is set, and core.testing runs the tests of
+settings.NPLUSONE_TEST_APPS with detection raising errors.
+"""
+import os
+import re
+import sys
+import traceback
+import warnings
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+
+from rest_framework.fields import Field
+
+
+WARN = 'warn'
+RAISE = 'raise'
+
+IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+SPACE_RE = re.compile(r'\s+')
+
+# frames from these are left out of reports
+LIBRARY_PATHS = tuple(
+    os.path.dirname(module.__file__) + os.sep
+    for module in (sys.modules['django'], sys.modules['rest_framework'])
+)
+
+
+class NPlusOneError(Exception):
+    """Raised for a query repeated once per row"""
+
+
+class NPlusOneWarning(UserWarning):
+    """Warned about a query repeated once per row"""
+
+
+def query_shape(sql):
+    """Return sql without the values that vary between rows"""
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    return SPACE_RE.sub(' ', sql).strip()
+
+
+def serializer_field(frame):
+    """Return 'Serializer.field' of the innermost field serializing"""
+    while frame is not None:
+        field = frame.f_locals.get('self')
+        if isinstance(field, Field) and field.field_name:
+            return f'{type(field.parent).__name__}.{field.field_name}'
+        frame = frame.f_back
+    return None
+
+
+def project_stack(frame):
+    """Return the formatted frames of project code, outermost first"""
+    summary = traceback.extract_stack(frame)
+    frames = [
+        entry for entry in summary
+        if entry.filename.startswith(settings.BASE_DIR)
+        and not entry.filename.startswith(LIBRARY_PATHS)
+        and entry.filename != __file__
+    ]
+    return ''.join(traceback.format_list(frames))
+
+
+class QueryShapeRecorder:
+    """Execute wrapper counting SELECTs by shape, see the module docs"""
+
+    def __init__(self, threshold, action):
+        self.threshold = threshold
+        self.action = action
+        self.counts = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip()[:6].upper() == 'SELECT':
+            shape = query_shape(sql)
+            self.counts[shape] += 1
+            # reported once, when the shape first goes over the limit
+            if self.counts[shape] == self.threshold + 1:
+                self.report(shape, sys._getframe(1))
+        return execute(sql, params, many, context)
+
+    def report(self, shape, frame):
+        field = serializer_field(frame)
+        message = (
+            f'Query run more than {self.threshold} times in one request, '
+            f'once per row?\n  {shape}\n'
+        )
+        if field is not None:
+            message += f'Asked for by {field}\n'
+        message += f'Stack:\n{project_stack(frame)}'
+
+        if self.action == RAISE:
+            raise NPlusOneError(message)
+        warnings.warn(message, NPlusOneWarning)
+
+
+class detect_n_plus_one:
+    """Context manager watching the queries run inside it"""
+
+    def __init__(self, threshold=None, action=None):
+        self.recorder = QueryShapeRecorder(
+            settings.NPLUSONE_THRESHOLD if threshold is None else threshold,
+            action or settings.NPLUSONE_ACTION
+        )
+
+    def __enter__(self):
+        self.connections = connections.all()
+        for connection in self.connections:
+            connection.execute_wrappers.append(self.recorder)
+        return self.recorder
+
+    def __exit__(self, *exc_info):
+        for connection in self.connections:
+            connection.execute_wrappers.remove(self.recorder)
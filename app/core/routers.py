@@ -0,0 +1,155 @@
+"""Send reads to the read replicas and writes to the primary database
+
+settings.DATABASE_REPLICAS names the database aliases of the replicas,
+with 'default' being the primary. Reads only go to a replica while a
+request with a safe method (GET, HEAD, OPTIONS) is handled, see
+core.middleware.DatabaseRoutingMiddleware. Everything else, management
+commands and background threads included, uses the primary.
+
+Once a user changed their data, their reads stay on the primary for
+settings.DATABASE_STICKY_SECONDS, longer than the replicas lag behind,
+so nobody is shown data older than what they just wrote. The marks are
+kept in the settings.DATABASE_STICKY_CACHE_ALIAS cache, which should be
+shared by every process.
+
+Authentication data and sessions are always read from the primary: a
+new token must work at once and a revoked one must stop working at once.
+
+A replica only needs the alias in DATABASES and DATABASE_REPLICAS. In
+tests, and to try the routing locally with SQLite files standing in for
+the databases, mirror it onto the primary:
+
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS = ['replica']
+"""
+import random
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.functional import SimpleLazyObject, empty
+
+
+STICKY_KEY = 'db:sticky:{user_id}'
+
+# read from the primary whatever the request
+PRIMARY_ONLY_MODELS = {
+    'core.user',
+    'core.refreshtoken',
+    'core.accesstokenrevocation',
+    'core.storedfile',
+    'authtoken.token',
+    # a session written at login must be readable at once
+    'sessions.session',
+}
+
+_state = threading.local()
+
+
+def mark_sticky(user_ids):
+    """Keep the users' reads on the primary for a while"""
+    keys = {STICKY_KEY.format(user_id=user_id): True for user_id in user_ids}
+    if keys and settings.DATABASE_REPLICAS:
+        caches[settings.DATABASE_STICKY_CACHE_ALIAS].set_many(
+            keys, settings.DATABASE_STICKY_SECONDS
+        )
+
+
+def is_sticky(user_id):
+    return caches[settings.DATABASE_STICKY_CACHE_ALIAS].get(
+        STICKY_KEY.format(user_id=user_id), False
+    )
+
+
+class RoutingState:
+    """Where the reads of the request being handled may go"""
+
+    def __init__(self, request, replica):
+        self.request = request
+        self.replica = replica
+        self.user_id = None
+
+    def read_alias(self):
+        # requests are authenticated by the view, after the middleware ran
+        user = self.request.__dict__.get('user')
+        if isinstance(user, SimpleLazyObject):
+            # resolving a session user reads the session, which is routed
+            # through here again: only use it once something resolved it
+            user = None if user._wrapped is empty else user._wrapped
+        user_id = getattr(user, 'pk', None)
+        if user_id is not None and user_id != self.user_id:
+            self.user_id = user_id
+            if is_sticky(user_id):
+                self.replica = DEFAULT_DB_ALIAS
+
+        return self.replica
+
+
+def start_reads(request):
+    """Let the reads of a request go to a replica from now on"""
+    replicas = settings.DATABASE_REPLICAS
+    if replicas:
+        _state.current = RoutingState(request, random.choice(replicas))
+
+
+def end_reads():
+    _state.current = None
+
+
+def stream_reads(content):
+    """Wrap a streamed response body to read like the request it answers
+
+    The body is only produced once the middleware returned and ended the
+    request's reads. Each chunk is produced with them restored, and they
+    are ended again before the chunk is handed on.
+    """
+    state = getattr(_state, 'current', None)
+
+    def stream():
+        iterator = iter(content)
+        try:
+            while True:
+                _state.current = state
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    _state.current = None
+                yield chunk
+        finally:
+            # the response closes the wrapper, e.g. when the client left
+            if hasattr(iterator, 'close'):
+                iterator.close()
+
+    return stream()
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        state = getattr(_state, 'current', None)
+        if state is None or model._meta.label_lower in PRIMARY_ONLY_MODELS:
+            return DEFAULT_DB_ALIAS
+        # reads inside a transaction must see what it wrote
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return state.read_alias()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their schema from the primary
+        return db not in settings.DATABASE_REPLICAS
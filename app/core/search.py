@@ -0,0 +1,53 @@
+from django.db import connections, router
+
+from core.models import Recipe
+
+
+# text search configuration used both to build and to query the vectors
+SEARCH_CONFIG = 'english'
+
+# The title is weighted above tag and ingredient names so that a recipe
+# called "Curry" ranks above one that merely has a "curry" tag
+UPDATE_SEARCH_VECTOR_SQL = """
+    UPDATE core_recipe AS recipe SET search_vector =
+        setweight(to_tsvector(%(config)s, recipe.title), 'A') ||
+        setweight(to_tsvector(%(config)s, coalesce((
+            SELECT string_agg(tag.name, ' ')
+            FROM core_tag AS tag
+            JOIN core_recipe_tags AS link ON link.tag_id = tag.id
+            WHERE link.recipe_id = recipe.id
+        ), '')), 'B') ||
+        setweight(to_tsvector(%(config)s, coalesce((
+            SELECT string_agg(ingredient.name, ' ')
+            FROM core_ingredient AS ingredient
+            JOIN core_recipe_ingredients AS link
+                ON link.ingredient_id = ingredient.id
+            WHERE link.recipe_id = recipe.id
+        ), '')), 'B')
+    WHERE recipe.id = ANY(%(ids)s)
+"""
+
+
+def search_vector_supported(using=None):
+    """Return True if the database stores recipe search vectors"""
+    using = using or router.db_for_write(Recipe)
+    return connections[using].vendor == 'postgresql'
+
+
+def update_search_vectors(recipe_ids, using=None):
+    """Rebuild the stored search vector of the given recipes
+
+    Runs a single UPDATE however many recipes are passed. Other databases
+    have no tsvector type, so this is a no-op there and searches use the
+    fallback in recipe.filters instead.
+    """
+    using = using or router.db_for_write(Recipe)
+    recipe_ids = [pk for pk in set(recipe_ids) if pk is not None]
+    if not recipe_ids or not search_vector_supported(using):
+        return
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            UPDATE_SEARCH_VECTOR_SQL,
+            {'config': SEARCH_CONFIG, 'ids': recipe_ids}
+        )
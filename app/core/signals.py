@@ -0,0 +1,197 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_save, pre_delete, post_delete, \
+                                     m2m_changed
+from django.dispatch import receiver, Signal
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+
+from core import routers, tokens
+from core.authentication import token_cache
+from core.models import Tag, Ingredient, Recipe, StoredFile
+from core.search import search_vector_supported, update_search_vectors
+
+
+# Sent after a user's tags, ingredients or recipes changed in any way,
+# possibly before the transaction of the database `using` committed
+user_data_changed = Signal(providing_args=['user_ids', 'using'])
+
+
+def linked_recipe_ids(instance):
+    """Return the ids of the recipes a tag or ingredient is attached to"""
+    return list(instance.recipe_set.values_list('pk', flat=True))
+
+
+def touch_user_data(user_ids, using):
+    """Record that the users' data changed and tell listeners about it"""
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return
+
+    get_user_model().objects.using(using).filter(
+        pk__in=user_ids
+    ).update(data_changed_at=timezone.now())
+    user_data_changed.send(sender=None, user_ids=user_ids, using=using)
+
+
+def touch_recipes(recipe_ids, using):
+    """Mark recipes whose tags or ingredients changed as updated
+
+    Returns the ids of the users owning the recipes.
+    """
+    recipes = Recipe.objects.using(using).filter(pk__in=recipe_ids)
+    user_ids = set(recipes.values_list('user_id', flat=True).distinct())
+    recipes.update(updated_at=timezone.now())
+    return user_ids
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, using, update_fields=None, **kwargs):
+    """Rebuild the search vector when a recipe title may have changed"""
+    if update_fields is not None and 'title' not in update_fields:
+        return
+
+    update_search_vectors([instance.pk], using=using)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def user_object_changed(sender, instance, using, **kwargs):
+    """Record the change of one of a user's objects"""
+    touch_user_data([instance.user_id], using)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_image_released(sender, instance, using, **kwargs):
+    """Drop the deleted recipe's reference on its stored image"""
+    if instance.image:
+        StoredFile.objects.db_manager(using).release([instance.image.name])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_links_changed(sender, instance, action, reverse, pk_set, using,
+                         **kwargs):
+    """Update the recipes whose tags or ingredients changed"""
+    if action == 'pre_clear' and reverse:
+        # the cleared recipes are gone by post_clear, so note them now
+        instance._cleared_recipe_ids = linked_recipe_ids(instance)
+        return
+
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        recipe_ids = [instance.pk]
+    elif action == 'post_clear':
+        recipe_ids = instance.__dict__.pop('_cleared_recipe_ids', [])
+    else:
+        recipe_ids = pk_set
+
+    update_search_vectors(recipe_ids, using=using)
+    # a tag or ingredient may be linked to another user's recipes
+    user_ids = touch_recipes(recipe_ids, using) | {instance.user_id}
+    touch_user_data(user_ids, using)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def recipe_attr_saved(sender, instance, created, using, **kwargs):
+    """Rebuild the search vectors of recipes using a renamed tag/ingredient"""
+    if created or not search_vector_supported(using):
+        return
+
+    update_search_vectors(linked_recipe_ids(instance), using=using)
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def recipe_attr_deleting(sender, instance, using, **kwargs):
+    """Note the recipes of a tag/ingredient before its links are deleted
+
+    The links are removed by the delete cascade, which sends no
+    m2m_changed signal.
+    """
+    instance._deleted_recipe_ids = linked_recipe_ids(instance)
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def recipe_attr_deleted(sender, instance, using, **kwargs):
+    """Update the recipes a deleted tag/ingredient was attached to"""
+    recipe_ids = instance.__dict__.pop('_deleted_recipe_ids', [])
+    update_search_vectors(recipe_ids, using=using)
+
+    user_ids = {instance.user_id}
+    if recipe_ids:
+        user_ids |= touch_recipes(recipe_ids, using)
+    touch_user_data(user_ids, using)
+
+
+def revoke_cached_tokens(user_id, using):
+    """Drop a user's cached authentication, again once the change commits
+
+    Until the transaction commits, other requests still read the old rows
+    and may cache them again.
+    """
+    token_cache.revoke(user_id)
+    if transaction.get_connection(using).in_atomic_block:
+        transaction.on_commit(
+            lambda: token_cache.revoke(user_id), using=using
+        )
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_credentials_changed(sender, instance, using, **kwargs):
+    """Drop the cached authentication of a changed or deleted user
+
+    Covers deactivation and password changes, and keeps the cached user
+    from going stale.
+    """
+    revoke_cached_tokens(instance.pk, using)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, using, **kwargs):
+    """Stop accepting a deleted token from the cache"""
+    revoke_cached_tokens(instance.user_id, using)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_signed_tokens_changed(sender, instance, signal, using,
+                               created=False, update_fields=None, **kwargs):
+    """Revoke the signed tokens of a deleted, deactivated or re-keyed user
+
+    Their access tokens carry nothing but the user's id and claims, so
+    nothing else stops them from being accepted until they expire. Tokens
+    issued before other changes of the claims are marked out of date.
+    """
+    if created:
+        return
+
+    # set by set_password() until the save completes
+    password_changed = instance._password is not None
+    if signal is post_delete or password_changed or not instance.is_active:
+        tokens.revoke_user_tokens(instance.pk)
+    elif update_fields is None or set(update_fields) & set(tokens.USER_CLAIMS):
+        tokens.mark_user_changed(instance.pk)
+    else:
+        return
+
+    # tokens issued until the change commits carry the old claims
+    if transaction.get_connection(using).in_atomic_block:
+        transaction.on_commit(
+            lambda: tokens.mark_user_changed(instance.pk), using=using
+        )
+
+
+@receiver(user_data_changed)
+def user_data_written(sender, user_ids, **kwargs):
+    """Keep the reads of users whose data changed on the primary"""
+    routers.mark_sticky(user_ids)
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import re
+import uuid
+
+from django.apps import apps
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+def file_digest(content):
+    """Return the SHA-256 hex digest of a file, read in chunks"""
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+# <directory>/ab/cd/abcd<60 more hex digits>[_<suffix>].<extension>
+CONTENT_NAME_RE = re.compile(
+    r'(?:^|/)([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}(?:_[\w-]+)?\.\w+$'
+)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage naming files after the hash of their content
+
+    A file saved as `uploads/recipe/x.jpg` is stored as
+    `uploads/recipe/ab/cd/abcd...ef.jpg`. The two levels of hash prefix
+    directories keep every directory small however many files there are,
+    and identical uploads end up as one file.
+
+    Every save takes a reference on the file in core.models.StoredFile.
+    Whoever stops using a file releases it, and files without references
+    are deleted, along with the files derived from them, by
+    StoredFile.objects.collect_garbage(). A save in a transaction that
+    rolls back leaves its file without any row, which collect_garbage()
+    deletes once the file is older than its orphan_age.
+    """
+
+    shard_levels = 2
+    shard_width = 2
+
+    def content_name(self, name, content):
+        """Return the name content is stored under in name's directory"""
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        digest = file_digest(content)
+        shards = [
+            digest[level * self.shard_width:(level + 1) * self.shard_width]
+            for level in range(self.shard_levels)
+        ]
+        return os.path.join(directory, *shards, digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        name = self.content_name(name, content)
+        # taken before the file is checked, so a garbage collection that
+        # holds the reference row cannot delete a file this save relies on
+        apps.get_model('core', 'StoredFile').objects.acquire(name)
+        if not self.exists(name):
+            self.save_as(name, content)
+        else:
+            # the file may be left by a save that rolled back, which is
+            # only deleted after it went unmodified for a while
+            try:
+                os.utime(self.path(name))
+            except FileNotFoundError:
+                self.save_as(name, content)
+        return name
+
+    def save_as(self, name, content):
+        """Store content under exactly name, replacing any file there
+
+        The file is written under a temporary name and renamed into place,
+        so readers never see a partly written file.
+        """
+        temporary = self._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
+
+    def derived_name(self, name, suffix):
+        """Return the name of a file derived from name, e.g. a thumbnail
+
+        Derived files share the directory of their source, which is how
+        delete_with_derived() finds them.
+        """
+        return f'{os.path.splitext(name)[0]}_{suffix}'
+
+    def source_stem(self, name):
+        """Return the name of the file name derives from, less extension
+
+        For a file that is not derived that is its own name.
+        """
+        directory, filename = os.path.split(os.path.splitext(name)[0])
+        return os.path.join(directory, filename.split('_', 1)[0])
+
+    def is_content_addressed(self, name):
+        """Return True if the file at name can never change
+
+        Holds for the files named by their hash and the files derived from
+        them, but not for files stored before the storage was used.
+        """
+        return bool(CONTENT_NAME_RE.search(name))
+
+    def walk_content(self):
+        """Yield the name of every content addressed file stored"""
+        for root, _, filenames in os.walk(self.location):
+            directory = os.path.relpath(root, self.location)
+            for filename in filenames:
+                name = os.path.normpath(os.path.join(directory, filename))
+                name = name.replace(os.sep, '/')
+                if self.is_content_addressed(name):
+                    yield name
+
+    def delete_with_derived(self, name):
+        """Delete a file and every file derived from it"""
+        directory, filename = os.path.split(name)
+        prefix = self.derived_name(filename, '')
+        try:
+            _, filenames = self.listdir(directory)
+        except FileNotFoundError:
+            return
+
+        for other in filenames:
+            if other == filename or other.startswith(prefix):
+                self.delete(os.path.join(directory, other))
+
+
+image_storage = ContentAddressedStorage()
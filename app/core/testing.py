@@ -0,0 +1,139 @@
+import tempfile
+import unittest
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
+
+from core.nplusone import RAISE
+
+
+class QueryBudgetMixin:
+    """Query count assertions for TestCase classes
+
+    Use assertMaxQueries to cap the number of queries a block may run and
+    assertQueriesDoNotScale to prove a request costs the same no matter how
+    many rows it returns (i.e. there is no N+1 hiding in a serializer).
+    """
+
+    @contextmanager
+    def assertMaxQueries(self, budget, using=DEFAULT_DB_ALIAS):
+        """Fail if the wrapped block runs more than `budget` queries"""
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+
+        executed = len(context.captured_queries)
+        if executed > budget:
+            queries = '\n'.join(
+                f'{i}. {query["sql"]}'
+                for i, query in enumerate(context.captured_queries, start=1)
+            )
+            self.fail(
+                f'{executed} queries executed, budget was {budget}\n'
+                f'Captured queries were:\n{queries}'
+            )
+
+    def assertQueriesDoNotScale(self, request, add_rows, rounds=3,
+                                using=DEFAULT_DB_ALIAS):
+        """Fail if `request` runs more queries as `add_rows` adds data
+
+        `add_rows` is called before every round to grow the data set, and
+        `request` is then run and its queries counted. Every round must run
+        the same number of queries as the first one.
+        """
+        counts = []
+        for _ in range(rounds):
+            add_rows()
+            with CaptureQueriesContext(connections[using]) as context:
+                request()
+            counts.append(len(context.captured_queries))
+
+        self.assertEqual(
+            len(set(counts)), 1,
+            f'Query count grew with the number of rows: {counts}'
+        )
+        return counts[0]
+
+
+# what the tests of NPLUSONE_TEST_APPS run with
+NPLUSONE_TEST_SETTINGS = {
+    'NPLUSONE_ENABLED': True,
+    'NPLUSONE_ACTION': RAISE,
+}
+
+
+class NPlusOneMixin:
+    """Fail tests whose requests repeat a query once per row
+
+    See core.nplusone. The tests of settings.NPLUSONE_TEST_APPS get the
+    same settings from TestRunner; other test cases can use the mixin.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls._nplusone_settings = override_settings(**NPLUSONE_TEST_SETTINGS)
+        cls._nplusone_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._nplusone_settings.disable()
+
+
+class SharedCacheMixin:
+    """Name a cache every process sees as settings.TOKEN_CACHE_ALIAS
+
+    The default local memory cache is per process, so it is not used as
+    a shared tier (see core.tokens.shared_cache). The mixin adds a file
+    based 'shared' cache, in a directory of its own for the test case.
+    Its settings apply over those of the test case.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._shared_cache_dir = tempfile.TemporaryDirectory()
+        cls._shared_cache_settings = override_settings(
+            CACHES={**settings.CACHES, 'shared': {
+                'BACKEND':
+                    'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': cls._shared_cache_dir.name,
+            }},
+            TOKEN_CACHE_ALIAS='shared',
+        )
+        cls._shared_cache_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._shared_cache_settings.disable()
+        cls._shared_cache_dir.cleanup()
+        super().tearDownClass()
+
+
+class TestRunner(DiscoverRunner):
+    """Test runner catching N+1 queries in the NPLUSONE_TEST_APPS tests
+
+    Saves every test case of those apps from having to remember the
+    mixin, so new endpoints cannot quietly add per-row queries.
+    """
+
+    def build_suite(self, *args, **kwargs):
+        suite = super().build_suite(*args, **kwargs)
+        for cls in {type(test) for test in iter_test_cases(suite)}:
+            app = cls.__module__.split('.', 1)[0]
+            if app in settings.NPLUSONE_TEST_APPS:
+                override_settings(**NPLUSONE_TEST_SETTINGS)(cls)
+        return suite
+
+
+def iter_test_cases(suite):
+    # a parallel suite keeps its tests in subsuites
+    for test in getattr(suite, 'subsuites', suite):
+        if isinstance(test, unittest.TestSuite):
+            yield from iter_test_cases(test)
+        else:
+            yield test
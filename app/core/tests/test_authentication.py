@@ -0,0 +1,191 @@
+from django.core.cache import caches
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.authentication import token_cache, VERSION_KEY
+from core.testing import SharedCacheMixin
+
+
+ME_URL = reverse('user:me')
+
+
+@override_settings(TOKEN_CACHE_ALIAS=None)
+class CachedTokenAuthenticationTests(TestCase):
+    """Test authenticating tokens through the token cache"""
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = get_user_model().objects.create_user(
+            'test@email.com',
+            'testPW'
+        )
+        self.token = Token.objects.create(user=self.user)
+        token_cache.clear()
+        token_cache.stats.reset()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_repeat_requests_skip_token_lookup(self):
+        """Test only the first request looks the token up"""
+        with self.assertNumQueries(1):
+            self.client.get(ME_URL)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(ME_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['email'], 'test@email.com')
+        stats = token_cache.stats.snapshot()
+        self.assertEqual(stats['local_hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_invalid_token_not_cached(self):
+        """Test unknown keys are rejected every time"""
+        self.client.credentials(HTTP_AUTHORIZATION='Token nope')
+
+        for _ in range(2):
+            response = self.client.get(ME_URL)
+
+            self.assertEqual(
+                response.status_code, status.HTTP_401_UNAUTHORIZED
+            )
+        self.assertEqual(token_cache.stats.snapshot()['misses'], 2)
+
+    def test_deleted_token_revoked(self):
+        """Test a deleted token stops working at once"""
+        self.client.get(ME_URL)
+
+        self.token.delete()
+        response = self.client.get(ME_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_revoked(self):
+        """Test a deactivated user is locked out at once"""
+        self.client.get(ME_URL)
+
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(ME_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_revokes(self):
+        """Test changing the password drops the cached user"""
+        self.client.get(ME_URL)
+
+        self.client.patch(ME_URL, {'password': 'newPassword'})
+
+        with self.assertNumQueries(1):
+            self.client.get(ME_URL)
+        self.assertGreater(token_cache.stats.snapshot()['revocations'], 0)
+
+    def test_requests_get_own_user(self):
+        """Test a cached user is not shared between requests"""
+        self.client.get(ME_URL)
+
+        first, _ = token_cache.get(self.token.key)
+        second, _ = token_cache.get(self.token.key)
+
+        self.assertEqual(first, second)
+        self.assertIsNot(first, second)
+
+    @override_settings(TOKEN_CACHE_SIZE=0)
+    def test_local_tier_disabled(self):
+        """Test a size of 0 turns the per-process tier off"""
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                self.client.get(ME_URL)
+
+
+class SharedTokenCacheTests(SharedCacheMixin,
+                            CachedTokenAuthenticationTests):
+    """Test the token cache with a shared tier"""
+
+    def setUp(self):
+        caches['shared'].clear()
+        super().setUp()
+
+    def test_shared_tier_hit(self):
+        """Test a process without a local entry uses the shared one"""
+        self.client.get(ME_URL)
+        token_cache.clear()
+
+        with self.assertNumQueries(0):
+            self.client.get(ME_URL)
+
+        self.assertEqual(token_cache.stats.snapshot()['shared_hits'], 1)
+
+    def test_revocation_from_other_process(self):
+        """Test local entries honour a revocation made elsewhere"""
+        self.client.get(ME_URL)
+
+        # what revoke() in another process leaves in the shared cache
+        caches['shared'].set(
+            VERSION_KEY.format(user_id=self.user.pk), 'other', None
+        )
+
+        with self.assertNumQueries(1):
+            self.client.get(ME_URL)
+
+    @override_settings(TOKEN_CACHE_SIZE=0)
+    def test_local_tier_disabled(self):
+        """Test the shared tier still answers without the local one"""
+        self.client.get(ME_URL)
+
+        with self.assertNumQueries(0):
+            self.client.get(ME_URL)
+
+
+class TokenRevocationCommitTests(TransactionTestCase):
+    """Test revocations outlive lookups racing with the transaction"""
+
+    def setUp(self):
+        caches['default'].clear()
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@email.com',
+            'testPW'
+        )
+        self.token = Token.objects.create(user=self.user)
+
+    def test_entry_cached_before_commit_dropped(self):
+        """Test what a request read before the commit is not kept"""
+        with transaction.atomic():
+            self.user.is_active = False
+            self.user.save()
+            # what a request reading the old row meanwhile caches
+            old_user = get_user_model()(
+                pk=self.user.pk, email=self.user.email, is_active=True
+            )
+            token_cache.set(
+                self.token.key, old_user, self.token, token_cache.generation
+            )
+
+        self.assertIsNone(token_cache.get(self.token.key))
+
+    @override_settings(TOKEN_CACHE_ALIAS='default',
+                       TOKEN_CACHE_LOCAL_TIMEOUT=0)
+    def test_local_memory_cache_not_shared(self):
+        """Test a per-process cache does not count as the shared tier"""
+        token_cache.set(
+            self.token.key, self.user, self.token, token_cache.generation
+        )
+
+        self.assertIsNone(token_cache.get(self.token.key))
+
+    @override_settings(TOKEN_CACHE_ALIAS=None, TOKEN_CACHE_LOCAL_TIMEOUT=0)
+    def test_local_entries_short_lived(self):
+        """Test entries only other processes could revoke expire soon"""
+        token_cache.set(
+            self.token.key, self.user, self.token, token_cache.generation
+        )
+
+        self.assertIsNone(token_cache.get(self.token.key))
@@ -1,10 +1,15 @@
+from io import StringIO
 from unittest.mock import patch  # allows us to sim whether db is ready or not
 
 from django.core.management import call_command  # call command in source
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
 from django.test import TestCase
 
 
+PING = 'core.management.commands.wait_for_db.ping_database'
+
+
 class CommandTests(TestCase):
 
     def test_wait_for_db_ready(self):
@@ -14,17 +19,43 @@ class CommandTests(TestCase):
         # we mock this function by returning trye, which simulates the
         # return value of the assigned task. We can also use this to monitor
         # how often this command is called
-        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.return_value = True
+        with patch(PING) as ping:
+            ping.return_value = 0.001
             call_command('wait_for_db')
-            self.assertEqual(gi.call_count, 1)
+            self.assertEqual(ping.call_count, 1)
 
     @patch('time.sleep', return_value=True)
     def test_wait_for_db(self, ts):
         """Test waiting for db"""
-        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
+        with patch(PING) as ping:
             # patch has the ability to raise 'sideeffects' which are
             # side effects to the function that we are mocking
-            gi.side_effect = [OperationalError] * 5 + [True]
+            ping.side_effect = [OperationalError] * 5 + [0.001]
             call_command('wait_for_db')
-            self.assertEqual(gi.call_count, 6)
+            self.assertEqual(ping.call_count, 6)
+
+    @patch('time.sleep', return_value=True)
+    def test_wait_for_db_backs_off(self, ts):
+        """Test the delays grow, with jitter, up to the maximum"""
+        with patch(PING) as ping:
+            ping.side_effect = [OperationalError] * 6 + [0.001]
+            call_command(
+                'wait_for_db', initial_delay=1, max_delay=8, stdout=StringIO()
+            )
+
+        delays = [call[0][0] for call in ts.call_args_list]
+        for delay, limit in zip(delays, [1, 2, 4, 8, 8, 8]):
+            self.assertGreaterEqual(delay, limit / 2)
+            self.assertLessEqual(delay, limit)
+
+    def test_wait_for_db_gives_up(self):
+        """Test the command fails once the maximum wait has passed"""
+        with patch(PING) as ping:
+            ping.side_effect = OperationalError
+            with self.assertRaises(CommandError):
+                call_command('wait_for_db', max_wait=0, stdout=StringIO())
+
+    def test_wait_for_db_queries(self):
+        """Test the database is really queried"""
+        with self.assertNumQueries(1):
+            call_command('wait_for_db', stdout=StringIO())
@@ -0,0 +1,75 @@
+import tempfile
+from unittest.mock import patch
+
+from django.db.utils import OperationalError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+
+HEALTHZ_URL = reverse('healthz')
+READYZ_URL = reverse('readyz')
+
+
+@override_settings(METRICS_TOKEN='scraper')
+class HealthEndpointTests(TestCase):
+    """Test the liveness and readiness probes"""
+
+    def ready(self):
+        """Return the detailed readiness an internal request gets"""
+        return self.client.get(
+            READYZ_URL, HTTP_AUTHORIZATION='Bearer scraper'
+        )
+
+    def test_healthz(self):
+        """Test liveness is reported without touching the database"""
+        with self.assertNumQueries(0):
+            response = self.client.get(HEALTHZ_URL)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'status': 'ok'})
+
+    def test_readyz(self):
+        """Test readiness reports every check and its latency"""
+        with tempfile.TemporaryDirectory() as media:
+            with override_settings(MEDIA_ROOT=media):
+                response = self.ready()
+
+        self.assertEqual(response.status_code, 200)
+        checks = response.json()['checks']
+        self.assertEqual(set(checks), {'database', 'media'})
+        for check in checks.values():
+            self.assertTrue(check['ok'])
+            self.assertGreaterEqual(check['latency_ms'], 0)
+
+    def test_readyz_database_down(self):
+        """Test an unusable database makes the pod unready"""
+        with patch(
+            'django.db.backends.utils.CursorWrapper.execute',
+            side_effect=OperationalError('connection refused')
+        ):
+            response = self.ready()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(
+            response.json()['checks']['database'],
+            {'ok': False, 'error': 'OperationalError'}
+        )
+
+    @override_settings(MEDIA_ROOT='/nonexistent/media')
+    def test_readyz_media_missing(self):
+        """Test a missing media volume makes the pod unready"""
+        response = self.ready()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.json()['checks']['media']['ok'])
+
+    @override_settings(MEDIA_ROOT='/nonexistent/media')
+    def test_readyz_public(self):
+        """Test other requests only learn which checks passed"""
+        response = self.client.get(READYZ_URL)
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json(), {
+            'status': 'unavailable',
+            'checks': {'database': True, 'media': False},
+        })
@@ -0,0 +1,126 @@
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import metrics
+from core.models import Tag
+
+
+METRICS_URL = reverse('metrics')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+class HistogramTests(SimpleTestCase):
+    """Test the histograms behind /metrics"""
+
+    def test_render(self):
+        """Test observations are rendered as cumulative buckets"""
+        histogram = metrics.Histogram(
+            'test_seconds', 'Test.', ('view',), (0.1, 1)
+        )
+        for value in (0.05, 0.1, 0.5, 2):
+            histogram.observe(('a"b',), value)
+
+        self.assertEqual(histogram.render(), [
+            '# HELP test_seconds Test.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{view="a\\"b",le="0.1"} 2',
+            'test_seconds_bucket{view="a\\"b",le="1"} 3',
+            'test_seconds_bucket{view="a\\"b",le="+Inf"} 4',
+            'test_seconds_sum{view="a\\"b"} 2.65',
+            'test_seconds_count{view="a\\"b"} 4',
+        ])
+
+
+@override_settings(METRICS_TOKEN='scraper')
+class PerformanceMiddlewareTests(TestCase):
+    """Test timing requests into Server-Timing headers and /metrics"""
+
+    def setUp(self):
+        metrics.reset()
+        self.user = get_user_model().objects.create_user(
+            'test@email.com',
+            'testPW'
+        )
+        Tag.objects.create(user=self.user, name='Vegan')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def scrape(self):
+        return self.client.get(
+            METRICS_URL, HTTP_AUTHORIZATION='Bearer scraper'
+        )
+
+    def test_server_timing(self):
+        """Test measured responses say where their time went"""
+        response = self.client.get(TAGS_URL)
+
+        timing = response['Server-Timing']
+        for name in ('db', 'serialize', 'render', 'total'):
+            self.assertIn(f'{name};dur=', timing)
+        self.assertRegex(timing, r'desc="[1-9]\d* queries"')
+
+    def test_metrics(self):
+        """Test measured requests are added to the histograms"""
+        self.client.get(TAGS_URL)
+        self.client.get(TAGS_URL)
+
+        response = self.scrape()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn(
+            'app_request_duration_seconds_count'
+            '{view="recipe:tag-list",method="GET"} 2',
+            body
+        )
+        self.assertIn('app_response_size_bytes_count', body)
+        self.assertIn('app_token_cache_misses_total', body)
+        self.assertIn('app_response_cache_hits_total', body)
+
+    def test_other_namespaces_not_measured(self):
+        """Test only the API namespaces are measured"""
+        response = self.client.get(reverse('healthz'))
+
+        self.assertFalse(response.has_header('Server-Timing'))
+        body = self.scrape().content.decode()
+        self.assertNotIn('healthz', body)
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_sampling(self):
+        """Test requests outside the sample are not measured"""
+        response = self.client.get(TAGS_URL)
+
+        self.assertFalse(response.has_header('Server-Timing'))
+        body = self.scrape().content.decode()
+        self.assertNotIn('tag-list', body)
+
+
+@override_settings(METRICS_TOKEN='scraper', METRICS_ALLOWED_IPS=['10.0.0.0/8'])
+class MetricsAccessTests(SimpleTestCase):
+    """Test /metrics is only served to internal requests"""
+
+    def test_public_request_refused(self):
+        """Test anyone else gets a 404"""
+        response = self.client.get(
+            METRICS_URL, HTTP_AUTHORIZATION='Bearer guess'
+        )
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_allowed_network(self):
+        """Test requests from the allowed networks are served"""
+        response = self.client.get(METRICS_URL, REMOTE_ADDR='10.1.2.3')
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_token(self):
+        """Test requests bearing the token are served"""
+        response = self.client.get(
+            METRICS_URL, HTTP_AUTHORIZATION='Bearer scraper'
+        )
+
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,92 @@
+from unittest import skipUnless
+
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+
+class MigrationTestCase(TransactionTestCase):
+    """Run a migration on data created at the migration before it"""
+
+    migrate_from = None
+    migrate_to = None
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Requires PostgreSQL')
+class RecipeSearchVectorTests(MigrationTestCase):
+    """Test 0008 filling in the search vectors of existing recipes"""
+
+    migrate_from = [('core', '0007_recipe_m2m_lookup_indexes')]
+    migrate_to = [('core', '0008_recipe_search_vector')]
+
+    def test_backfill(self):
+        """Test existing recipes get vectors of their title and tags"""
+        apps = self.migrate(self.migrate_from)
+        User = apps.get_model('core', 'User')
+        Tag = apps.get_model('core', 'Tag')
+        Recipe = apps.get_model('core', 'Recipe')
+        user = User.objects.create(email='test@email.com')
+        recipe = Recipe.objects.create(
+            user=user, title='Curry', time_minutes=5, price=5
+        )
+        recipe.tags.add(Tag.objects.create(user=user, name='Vegan'))
+
+        self.migrate(self.migrate_to)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT search_vector::text FROM core_recipe WHERE id = %s',
+                [recipe.id]
+            )
+            self.assertEqual(
+                cursor.fetchone()[0], "'curri':1A 'vegan':2B"
+            )
+
+
+class MergeDuplicateNamesTests(MigrationTestCase):
+    """Test 0011 merging the tags a user has under the same name"""
+
+    migrate_from = [('core', '0010_change_tracking')]
+    migrate_to = [('core', '0011_merge_duplicate_names')]
+
+    def test_recipe_linked_to_several_duplicates(self):
+        """Test a recipe linked to the kept tag and two duplicates"""
+        apps = self.migrate(self.migrate_from)
+        User = apps.get_model('core', 'User')
+        Tag = apps.get_model('core', 'Tag')
+        Recipe = apps.get_model('core', 'Recipe')
+        user = User.objects.create(email='test@email.com')
+        keep = Tag.objects.create(user=user, name='Vegan')
+        duplicates = [
+            Tag.objects.create(user=user, name='vegan'),
+            Tag.objects.create(user=user, name='VEGAN'),
+        ]
+        both = Recipe.objects.create(
+            user=user, title='Curry', time_minutes=5, price=5
+        )
+        both.tags.add(keep, *duplicates)
+        duplicates_only = Recipe.objects.create(
+            user=user, title='Dahl', time_minutes=5, price=5
+        )
+        duplicates_only.tags.add(*duplicates)
+
+        apps = self.migrate(self.migrate_to)
+
+        Tag = apps.get_model('core', 'Tag')
+        Recipe = apps.get_model('core', 'Recipe')
+        self.assertEqual(
+            list(Tag.objects.values_list('id', flat=True)), [keep.id]
+        )
+        for recipe in Recipe.objects.all():
+            self.assertEqual(
+                list(recipe.tags.values_list('id', flat=True)), [keep.id]
+            )
@@ -1,5 +1,6 @@
 from unittest.mock import patch
 
+from django.db import IntegrityError
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 # note that we can import the User Model directly, but if we ever change our
@@ -100,4 +101,29 @@ class ModelTests(TestCase):
 
         self.assertEqual(file_path, expected_path)
 
+    def test_tag_name_unique_per_user(self):
+        """test a user cannot have two tags differing only in case"""
+        user = sample_user()
+        models.Tag.objects.create(user=user, name='Vegan')
 
+        with self.assertRaises(IntegrityError):
+            models.Tag.objects.create(user=user, name='VEGAN')
+
+    def test_get_or_create_names(self):
+        """test names are resolved in order, creating the missing ones"""
+        user = sample_user()
+        vegan = models.Tag.objects.create(user=user, name='Vegan')
+
+        results = models.Tag.objects.get_or_create_names(
+            user, ['Quick', 'vegan', 'quick']
+        )
+
+        self.assertEqual(
+            [(tag.name, created) for tag, created in results],
+            [('Quick', True), ('Vegan', False)]
+        )
+        self.assertEqual(results[1][0].id, vegan.id)
+        self.assertEqual(
+            results[0][0].id,
+            models.Tag.objects.get(name='Quick').id
+        )
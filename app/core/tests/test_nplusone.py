@@ -0,0 +1,123 @@
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from core.models import Recipe, Tag
+from core.nplusone import (
+    RAISE, WARN, NPlusOneError, NPlusOneWarning, detect_n_plus_one,
+    query_shape,
+)
+from core.testing import TestRunner
+
+from recipe.serializers import RecipeDetailSerializer
+
+
+READYZ_URL = reverse('readyz')
+
+
+class QueryShapeTests(SimpleTestCase):
+    """Test reducing queries to their shape"""
+
+    def test_values_removed(self):
+        """Test queries differing only in their values share a shape"""
+        first = query_shape(
+            'SELECT * FROM "t" WHERE "id" = 1 AND "name" = \'it\'\'s\''
+        )
+        second = query_shape(
+            'SELECT  * FROM "t"\nWHERE "id" = 25 AND "name" = \'b\''
+        )
+
+        self.assertEqual(first, second)
+        self.assertEqual(
+            first, 'SELECT * FROM "t" WHERE "id" = ? AND "name" = ?'
+        )
+
+    def test_in_list_length_removed(self):
+        """Test IN lists of any length share a shape"""
+        self.assertEqual(
+            query_shape('SELECT 1 WHERE "id" IN (%s, %s, %s)'),
+            query_shape('SELECT 1 WHERE "id" IN (%s)'),
+        )
+
+
+class DetectNPlusOneTests(TestCase):
+    """Test catching queries repeated once per row"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            'test@londonappdev.com', 'testpass'
+        )
+        tag = Tag.objects.create(user=user, name='Vegan')
+        for i in range(4):
+            recipe = Recipe.objects.create(
+                user=user, title=f'Recipe {i}', time_minutes=5, price=5
+            )
+            recipe.tags.add(tag)
+
+    def serialize(self, queryset):
+        return RecipeDetailSerializer(queryset, many=True).data
+
+    def test_per_row_query_raises(self):
+        """Test an unprefetched relation is reported with its field"""
+        with self.assertRaises(NPlusOneError) as context:
+            with detect_n_plus_one(threshold=3, action=RAISE):
+                self.serialize(Recipe.objects.all())
+
+        message = str(context.exception)
+        self.assertIn('RecipeDetailSerializer.ingredients', message)
+        self.assertIn('test_nplusone.py', message)
+
+    def test_per_row_query_warns(self):
+        """Test the warn action warns and lets the request finish"""
+        with self.assertWarns(NPlusOneWarning):
+            with detect_n_plus_one(threshold=3, action=WARN):
+                data = self.serialize(Recipe.objects.all())
+
+        self.assertEqual(len(data), 4)
+
+    def test_prefetched_passes(self):
+        """Test prefetched relations are not reported"""
+        queryset = Recipe.objects.prefetch_related('ingredients', 'tags')
+
+        with detect_n_plus_one(threshold=1, action=RAISE):
+            self.serialize(queryset)
+
+    def test_writes_not_counted(self):
+        """Test repeated writes are not mistaken for N+1 reads"""
+        user = get_user_model().objects.get()
+
+        with detect_n_plus_one(threshold=1, action=RAISE):
+            for i in range(3):
+                Tag.objects.create(user=user, name=f'Tag {i}')
+
+    @override_settings(NPLUSONE_ENABLED=True, NPLUSONE_ACTION=RAISE,
+                       NPLUSONE_THRESHOLD=0)
+    def test_middleware(self):
+        """Test the middleware watches requests when enabled"""
+        with self.assertRaises(NPlusOneError):
+            self.client.get(READYZ_URL)
+
+    def test_middleware_disabled(self):
+        """Test the middleware does nothing unless enabled"""
+        # /readyz checks MEDIA_ROOT can be written to
+        with tempfile.TemporaryDirectory() as media:
+            with self.settings(NPLUSONE_ENABLED=False, NPLUSONE_THRESHOLD=0,
+                               NPLUSONE_ACTION=RAISE, MEDIA_ROOT=media):
+                response = self.client.get(READYZ_URL)
+
+        self.assertEqual(response.status_code, 200)
+
+
+class TestRunnerTests(SimpleTestCase):
+    """Test the runner turns detection on for NPLUSONE_TEST_APPS"""
+
+    def test_build_suite(self):
+        runner = TestRunner(verbosity=0)
+        suite = runner.build_suite(['recipe.tests.test_tags_api'])
+
+        for test in suite:
+            self.assertEqual(
+                type(test)._overridden_settings['NPLUSONE_ACTION'], RAISE
+            )
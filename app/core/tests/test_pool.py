@@ -0,0 +1,174 @@
+import threading
+from unittest import skipUnless
+from unittest.mock import Mock, patch
+
+from django.db import OperationalError, connection
+from django.db.utils import load_backend
+from django.test import SimpleTestCase, TransactionTestCase
+
+from core.db import pool
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """Test the bounded connection pool"""
+
+    def setUp(self):
+        self.pool = pool.ConnectionPool(Mock, max_size=2, timeout=0.05)
+
+    def test_reuse(self):
+        """Test a checked in connection is handed out again"""
+        first, reused = self.pool.checkout()
+        self.assertFalse(reused)
+        self.pool.checkin(first, True)
+
+        second, reused = self.pool.checkout()
+
+        self.assertIs(second, first)
+        self.assertTrue(reused)
+        self.assertEqual(self.pool.snapshot()['connects'], 1)
+
+    def test_unusable_closed(self):
+        """Test a connection that is not reusable is closed, not kept"""
+        first, _ = self.pool.checkout()
+        self.pool.checkin(first, False)
+
+        second, reused = self.pool.checkout()
+
+        first.close.assert_called_once_with()
+        self.assertIsNot(second, first)
+        self.assertFalse(reused)
+
+    def test_timeout(self):
+        """Test checkouts beyond the size wait, then fail"""
+        self.pool.checkout()
+        self.pool.checkout()
+
+        with self.assertRaises(OperationalError):
+            self.pool.checkout()
+
+        stats = self.pool.snapshot()
+        self.assertEqual(stats['in_use'], 2)
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertEqual(stats['waits'], 0)
+
+    def test_wait_for_checkin(self):
+        """Test a waiting checkout gets the next connection checked in"""
+        self.pool.timeout = 5
+        first, _ = self.pool.checkout()
+        self.pool.checkout()
+        timer = threading.Timer(0.05, self.pool.checkin, (first, True))
+        timer.start()
+
+        connection, reused = self.pool.checkout()
+
+        timer.join()
+        self.assertIs(connection, first)
+        stats = self.pool.snapshot()
+        self.assertEqual(stats['waits'], 1)
+        self.assertGreater(stats['wait_time_ms'], 0)
+
+    def test_max_lifetime(self):
+        """Test old connections are replaced when they come back"""
+        self.pool.max_lifetime = 0
+        first, _ = self.pool.checkout()
+        self.pool.checkin(first, True)
+
+        first.close.assert_called_once_with()
+        self.assertEqual(self.pool.snapshot()['idle'], 0)
+
+    def test_failed_connect_frees_slot(self):
+        """Test a connection that could not be made takes no room"""
+        self.pool.connect = Mock(side_effect=OperationalError)
+
+        for _ in range(3):
+            with self.assertRaises(OperationalError):
+                self.pool.checkout()
+
+        self.assertEqual(self.pool.snapshot()['in_use'], 0)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'PostgreSQL backends')
+class PostgresBackendTests(TransactionTestCase):
+    """Test the persistent and pooled PostgreSQL engines"""
+
+    def setUp(self):
+        # runs last, once the wrappers handed their connections back
+        self.addCleanup(pool.close_idle_connections)
+
+    def wrapper(self, engine, **settings):
+        backend = load_backend(engine)
+        settings_dict = {**connection.settings_dict, **settings}
+        wrapper = backend.DatabaseWrapper(settings_dict, connection.alias)
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_broken_connection_replaced(self):
+        """Test a kept connection that stopped working is replaced"""
+        wrapper = self.wrapper(
+            'core.db.backends.postgresql', CONN_HEALTH_CHECKS=True
+        )
+        wrapper.ensure_connection()
+        broken = wrapper.connection
+        wrapper.close_if_unusable_or_obsolete()
+
+        with patch.object(wrapper, 'is_usable', return_value=False):
+            with wrapper.cursor() as cursor:
+                cursor.execute('SELECT 1')
+
+        self.assertIsNot(wrapper.connection, broken)
+        self.assertTrue(broken.closed)
+
+    def test_pooled_connection_reused(self):
+        """Test closing hands the connection back to the pool"""
+        wrapper = self.wrapper(
+            'core.db.backends.postgresql_pool', POOL={'MAX_SIZE': 1}
+        )
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        wrapper.close()
+        self.assertFalse(raw.closed)
+
+        other = self.wrapper('core.db.backends.postgresql_pool')
+        with other.cursor() as cursor:
+            cursor.execute('SELECT 1')
+
+        self.assertIs(other.connection, raw)
+        self.assertEqual(pool.pool_stats()[connection.alias]['in_use'], 1)
+
+    def test_open_transaction_rolled_back(self):
+        """Test a connection comes back to the pool outside a transaction"""
+        wrapper = self.wrapper('core.db.backends.postgresql_pool')
+        wrapper.set_autocommit(False)
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        raw = wrapper.connection
+
+        wrapper.close()
+
+        self.assertFalse(raw.closed)
+        self.assertEqual(raw.get_transaction_status(), 0)
+
+    def test_session_state_discarded(self):
+        """Test a connection comes back without the last user's state"""
+        wrapper = self.wrapper(
+            'core.db.backends.postgresql_pool', POOL={'MAX_SIZE': 1}
+        )
+        with wrapper.cursor() as cursor:
+            cursor.execute("SET application_name = 'leaked'")
+            cursor.execute('SELECT pg_advisory_lock(42)')
+        raw = wrapper.connection
+        wrapper.close()
+
+        other = self.wrapper('core.db.backends.postgresql_pool')
+        with other.cursor() as cursor:
+            cursor.execute('SHOW application_name')
+            application_name = cursor.fetchone()[0]
+            cursor.execute(
+                "SELECT count(*) FROM pg_locks WHERE locktype = 'advisory' "
+                "AND pid = pg_backend_pid()"
+            )
+            advisory_locks = cursor.fetchone()[0]
+
+        self.assertIs(other.connection, raw)
+        self.assertNotEqual(application_name, 'leaked')
+        self.assertEqual(advisory_locks, 0)
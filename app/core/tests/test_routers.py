@@ -0,0 +1,165 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.db import router
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import (
+    RequestFactory, SimpleTestCase, TransactionTestCase, override_settings,
+)
+
+from rest_framework.authtoken.models import Token
+
+from core.middleware import DatabaseRoutingMiddleware
+from core.models import Recipe
+from core.signals import user_data_changed
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    """Test reads going to the replicas and writes to the primary"""
+
+    def setUp(self):
+        caches['default'].clear()
+        self.factory = RequestFactory()
+        self.user = get_user_model()(pk=1, email='test@email.com')
+
+    def route(self, method='get', model=Recipe, user=None):
+        """Return where the view of a request would read model from"""
+        def view(request):
+            if user is not None:
+                # what authenticating the request in the view does
+                request.user = user
+            return router.db_for_read(model)
+
+        request = getattr(self.factory, method)('/api/recipe/recipes/')
+        return DatabaseRoutingMiddleware(view)(request)
+
+    def test_safe_reads_use_replica(self):
+        """Test reads of safe requests go to a replica"""
+        self.assertEqual(self.route(user=self.user), 'replica')
+        self.assertEqual(router.db_for_write(Recipe), 'default')
+
+    def test_unsafe_requests_use_primary(self):
+        """Test the reads of writing requests go to the primary"""
+        self.assertEqual(self.route('post', user=self.user), 'default')
+
+    def test_outside_requests_use_primary(self):
+        """Test commands and background work read from the primary"""
+        self.route(user=self.user)
+
+        self.assertEqual(router.db_for_read(Recipe), 'default')
+
+    def test_streamed_reads_use_replica(self):
+        """Test a streamed body reads like its request while it is sent"""
+        def content():
+            for _ in range(2):
+                yield router.db_for_read(Recipe)
+
+        def view(request):
+            request.user = self.user
+            return StreamingHttpResponse(content())
+
+        request = self.factory.get('/api/recipe/recipes/export/')
+        response = DatabaseRoutingMiddleware(view)(request)
+
+        self.assertEqual(list(response), [b'replica', b'replica'])
+        self.assertEqual(router.db_for_read(Recipe), 'default')
+
+    def test_auth_data_uses_primary(self):
+        """Test users and tokens are always read from the primary"""
+        self.assertEqual(self.route(model=Token), 'default')
+        self.assertEqual(self.route(model=get_user_model()), 'default')
+
+    def test_sticky_after_write_request(self):
+        """Test a user's reads stay on the primary after they wrote"""
+        self.route('patch', user=self.user)
+
+        self.assertEqual(self.route(user=self.user), 'default')
+        other = get_user_model()(pk=2, email='other@email.com')
+        self.assertEqual(self.route(user=other), 'replica')
+
+    def test_sticky_after_data_changed(self):
+        """Test changes made outside requests make users sticky too"""
+        user_data_changed.send(sender=None, user_ids={self.user.pk})
+
+        self.assertEqual(self.route(user=self.user), 'default')
+
+    @override_settings(DATABASE_STICKY_SECONDS=0)
+    def test_sticky_window(self):
+        """Test reads return to the replicas once the window passed"""
+        self.route('post', user=self.user)
+
+        self.assertEqual(self.route(user=self.user), 'replica')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        """Test everything uses the primary without replicas"""
+        self.assertEqual(self.route(user=self.user), 'default')
+
+    def test_migrations_skip_replicas(self):
+        """Test replicas get their schema from the primary"""
+        self.assertTrue(router.allow_migrate('default', 'core'))
+        self.assertFalse(router.allow_migrate('replica', 'core'))
+
+    def test_relations_across_replicas(self):
+        """Test objects read from a replica relate to primary ones"""
+        recipe = Recipe(user=self.user)
+        recipe._state.db = 'replica'
+        self.user._state.db = 'default'
+
+        self.assertTrue(router.allow_relation(recipe, self.user))
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class SessionRoutingTests(TransactionTestCase):
+    """Test routing the requests of session authenticated users"""
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = get_user_model().objects.create_user(
+            'test@email.com', 'testpass'
+        )
+
+    def test_session_user(self):
+        """Test resolving the lazy session user does not recurse"""
+        self.client.force_login(self.user)
+        request = RequestFactory().get('/admin/')
+        request.COOKIES[settings.SESSION_COOKIE_NAME] = \
+            self.client.session.session_key
+        routed = []
+
+        def view(request):
+            # outside any transaction, as in a live request
+            routed.append(router.db_for_read(Recipe))
+            routed.append(request.user.pk)
+            routed.append(router.db_for_read(Session))
+            return HttpResponse()
+
+        DatabaseRoutingMiddleware(
+            SessionMiddleware(AuthenticationMiddleware(view))
+        )(request)
+
+        self.assertEqual(routed, ['replica', self.user.pk, 'default'])
+
+    def test_session_user_sticky(self):
+        """Test a resolved session user is checked for stickiness"""
+        user_data_changed.send(sender=None, user_ids={self.user.pk})
+        self.client.force_login(self.user)
+        request = RequestFactory().get('/admin/')
+        request.COOKIES[settings.SESSION_COOKIE_NAME] = \
+            self.client.session.session_key
+        routed = []
+
+        def view(request):
+            request.user.pk
+            routed.append(router.db_for_read(Recipe))
+            return HttpResponse()
+
+        DatabaseRoutingMiddleware(
+            SessionMiddleware(AuthenticationMiddleware(view))
+        )(request)
+
+        self.assertEqual(routed, ['default'])
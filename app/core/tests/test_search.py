@@ -0,0 +1,67 @@
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+
+from core import models
+
+
+def sample_user(email='test@email.com', password='testPW'):
+    return get_user_model().objects.create_user(email, password)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Requires PostgreSQL')
+class SearchVectorTests(TestCase):
+    """Test the recipe search vector is kept in sync"""
+
+    def setUp(self):
+        self.user = sample_user()
+        self.recipe = models.Recipe.objects.create(
+            user=self.user,
+            title='Green curry',
+            time_minutes=30,
+            price=8.00
+        )
+
+    def assertSearchable(self, term, found=True):
+        matches = models.Recipe.objects.filter(search_vector=term)
+        self.assertEqual(matches.filter(id=self.recipe.id).exists(), found)
+
+    def test_vector_built_on_save(self):
+        """Test the title is searchable once a recipe is saved"""
+        self.assertSearchable('curry')
+
+        self.recipe.title = 'Red stew'
+        self.recipe.save()
+
+        self.assertSearchable('curry', found=False)
+        self.assertSearchable('stew')
+
+    def test_vector_follows_tags(self):
+        """Test adding, renaming and removing a tag updates the vector"""
+        tag = models.Tag.objects.create(user=self.user, name='Spicy')
+
+        self.recipe.tags.add(tag)
+        self.assertSearchable('spicy')
+
+        tag.name = 'Mild'
+        tag.save()
+        self.assertSearchable('spicy', found=False)
+        self.assertSearchable('mild')
+
+        tag.recipe_set.clear()
+        self.assertSearchable('mild', found=False)
+
+    def test_vector_follows_deleted_ingredient(self):
+        """Test deleting an ingredient drops it from the vector"""
+        ingredient = models.Ingredient.objects.create(
+            user=self.user,
+            name='Coconut'
+        )
+        self.recipe.ingredients.add(ingredient)
+        self.assertSearchable('coconut')
+
+        ingredient.delete()
+
+        self.assertSearchable('coconut', found=False)
@@ -0,0 +1,146 @@
+import hashlib
+import os
+import tempfile
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.test import TestCase, override_settings
+
+from core.models import Recipe, StoredFile
+from core.storage import image_storage
+
+
+class ContentAddressedStorageTests(TestCase):
+    """Test storing files by the hash of their content"""
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.settings = override_settings(MEDIA_ROOT=self.media.name)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.media.cleanup()
+
+    def save(self, content, name='uploads/recipe/a.JPG'):
+        return image_storage.save(name, ContentFile(content))
+
+    def test_sharded_name(self):
+        """Test files are named by hash under hash prefix directories"""
+        name = self.save(b'curry')
+
+        digest = hashlib.sha256(b'curry').hexdigest()
+        self.assertEqual(
+            name, f'uploads/recipe/{digest[:2]}/{digest[2:4]}/{digest}.jpg'
+        )
+        self.assertTrue(image_storage.exists(name))
+
+    def test_identical_content_stored_once(self):
+        """Test saving identical content again shares the file"""
+        first = self.save(b'curry')
+        second = self.save(b'curry', 'uploads/recipe/b.jpg')
+
+        self.assertEqual(first, second)
+        self.assertEqual(StoredFile.objects.get(name=first).refcount, 2)
+        directory = os.path.dirname(image_storage.path(first))
+        self.assertEqual(len(os.listdir(directory)), 1)
+
+    def test_release_never_negative(self):
+        """Test releasing more references than taken stops at 0"""
+        name = self.save(b'curry')
+
+        StoredFile.objects.release([name, name])
+
+        self.assertEqual(StoredFile.objects.get(name=name).refcount, 1)
+        StoredFile.objects.release([name])
+        self.assertEqual(StoredFile.objects.get(name=name).refcount, 0)
+
+    def test_collect_garbage(self):
+        """Test unreferenced files go with their derived files"""
+        kept = self.save(b'curry')
+        orphan = self.save(b'dahl')
+        derived = image_storage.derived_name(orphan, 'thumbnail') + '.jpg'
+        image_storage.save_as(derived, ContentFile(b'small dahl'))
+        StoredFile.objects.release([orphan])
+
+        deleted = StoredFile.objects.collect_garbage(batch_size=1)
+
+        self.assertEqual(deleted, 1)
+        self.assertFalse(image_storage.exists(orphan))
+        self.assertFalse(image_storage.exists(derived))
+        self.assertTrue(image_storage.exists(kept))
+        self.assertEqual(
+            list(StoredFile.objects.values_list('name', flat=True)), [kept]
+        )
+
+    def save_rolled_back(self, content):
+        """Save content in a transaction that rolls back"""
+        class RolledBack(Exception):
+            pass
+
+        try:
+            with transaction.atomic():
+                name = self.save(content)
+                raise RolledBack
+        except RolledBack:
+            return name
+
+    def age(self, name, seconds):
+        modified = time.time() - seconds
+        os.utime(image_storage.path(name), (modified, modified))
+
+    def test_collect_rolled_back_files(self):
+        """Test files of rolled back saves go once old enough"""
+        kept = self.save(b'curry')
+        orphan = self.save_rolled_back(b'dahl')
+        young = self.save_rolled_back(b'rice')
+        self.assertTrue(image_storage.exists(orphan))
+        self.assertFalse(StoredFile.objects.filter(name=orphan).exists())
+        self.age(kept, 7200)
+        self.age(orphan, 7200)
+
+        deleted = StoredFile.objects.collect_garbage(orphan_age=3600)
+
+        self.assertEqual(deleted, 1)
+        self.assertFalse(image_storage.exists(orphan))
+        self.assertTrue(image_storage.exists(young))
+        self.assertTrue(image_storage.exists(kept))
+
+    def test_collect_orphans_keeps_derived_files(self):
+        """Test files derived from a referenced file are not orphans"""
+        name = self.save(b'curry')
+        derived = image_storage.derived_name(name, 'thumbnail') + '.jpg'
+        image_storage.save_as(derived, ContentFile(b'small curry'))
+        self.age(derived, 7200)
+
+        StoredFile.objects.collect_garbage(orphan_age=3600)
+
+        self.assertTrue(image_storage.exists(derived))
+
+    def test_save_refreshes_orphan(self):
+        """Test saving a rolled back file again keeps it from the sweep"""
+        orphan = self.save_rolled_back(b'dahl')
+        self.age(orphan, 7200)
+
+        self.assertEqual(self.save(b'dahl'), orphan)
+
+        # as a sweep sees it before the save commits
+        self.assertGreater(
+            os.path.getmtime(image_storage.path(orphan)), time.time() - 60
+        )
+
+    def test_deleted_recipe_releases_image(self):
+        """Test deleting a recipe drops its reference on the image"""
+        user = get_user_model().objects.create_user('test@email.com', 'pw')
+        recipe = Recipe.objects.create(
+            user=user, title='Curry', time_minutes=30, price=5.00
+        )
+        recipe.image.save('curry.jpg', ContentFile(b'curry'))
+
+        recipe.delete()
+
+        self.assertEqual(
+            StoredFile.objects.get(name=recipe.image.name).refcount, 0
+        )
@@ -0,0 +1,230 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient, APIRequestFactory
+
+from core import tokens
+from core.authentication import SignedTokenAuthentication
+from core.models import AccessTokenRevocation
+from core.testing import SharedCacheMixin
+
+
+TOKEN_URL = reverse('user:token')
+REFRESH_URL = reverse('user:token-refresh')
+REVOKE_URL = reverse('user:token-revoke')
+ME_URL = reverse('user:me')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class SignedTokenTests(SharedCacheMixin, TestCase):
+    """Test signed access tokens and refresh tokens"""
+
+    def setUp(self):
+        caches['shared'].clear()
+        tokens.access_denylist.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@email.com',
+            'testPW'
+        )
+        self.client = APIClient()
+
+    def obtain(self):
+        response = self.client.post(TOKEN_URL, {
+            'email': 'test@email.com',
+            'password': 'testPW',
+            'token_type': 'signed',
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def use(self, access):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def test_opaque_token_by_default(self):
+        """Test older clients still get an opaque token"""
+        response = self.client.post(TOKEN_URL, {
+            'email': 'test@email.com',
+            'password': 'testPW',
+        })
+
+        self.assertEqual(list(response.data), ['token'])
+
+    def test_access_token_needs_no_queries(self):
+        """Test authenticating an access token does no database work"""
+        access = self.obtain()['access']
+        request = APIRequestFactory().get(
+            RECIPES_URL, HTTP_AUTHORIZATION=f'Bearer {access}'
+        )
+        tokens.access_denylist.sync()
+
+        with self.assertNumQueries(0):
+            user, payload = SignedTokenAuthentication().authenticate(request)
+            self.assertEqual(user.email, 'test@email.com')
+            self.assertTrue(user.is_active)
+
+        self.assertEqual(user.pk, self.user.pk)
+        self.use(access)
+        response = self.client.get(RECIPES_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_profile_with_access_token(self):
+        """Test views needing the whole user load it"""
+        self.use(self.obtain()['access'])
+
+        response = self.client.get(ME_URL)
+
+        self.assertEqual(response.data['email'], 'test@email.com')
+
+    def test_profile_update_seen(self):
+        """Test tokens issued before a profile change use the new values"""
+        self.use(self.obtain()['access'])
+
+        self.client.patch(ME_URL, {'name': 'New name'})
+        response = self.client.get(ME_URL)
+
+        self.assertEqual(response.data['name'], 'New name')
+
+    def test_deactivation_from_other_process(self):
+        """Test a deactivation applies before the denylist syncs"""
+        self.use(self.obtain()['access'])
+
+        self.user.is_active = False
+        self.user.save()
+        # what a process that has not synced the revocation yet answers
+        with patch.object(tokens.access_denylist, 'is_denied',
+                          return_value=False):
+            response = self.client.get(RECIPES_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_tampered_token_rejected(self):
+        """Test an access token with a bad signature is rejected"""
+        self.use(self.obtain()['access'] + 'x')
+
+        response = self.client.get(ME_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_expired_token_rejected(self):
+        """Test an access token stops working once it expires"""
+        self.use(self.obtain()['access'])
+
+        with patch('core.tokens.time.time', return_value=2 ** 40):
+            response = self.client.get(ME_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_rotates(self):
+        """Test a refresh token is exchanged for a new pair exactly once"""
+        pair = self.obtain()
+
+        response = self.client.post(REFRESH_URL, {'refresh': pair['refresh']})
+        again = self.client.post(REFRESH_URL, {'refresh': pair['refresh']})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.data['refresh'], pair['refresh'])
+        self.assertEqual(again.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_revoke(self):
+        """Test a revoked access token and its refresh token stop working"""
+        pair = self.obtain()
+        self.use(pair['access'])
+
+        response = self.client.post(REVOKE_URL, {'refresh': pair['refresh']})
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(
+            self.client.get(ME_URL).status_code,
+            status.HTTP_401_UNAUTHORIZED
+        )
+        response = self.client.post(REFRESH_URL, {'refresh': pair['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_password_change_revokes(self):
+        """Test changing the password revokes the tokens issued so far"""
+        pair = self.obtain()
+        self.use(pair['access'])
+
+        self.client.patch(ME_URL, {'password': 'newPassword'})
+
+        self.assertEqual(
+            self.client.get(ME_URL).status_code,
+            status.HTTP_401_UNAUTHORIZED
+        )
+        response = self.client.post(REFRESH_URL, {'refresh': pair['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_revocation_from_other_process(self):
+        """Test revocations made elsewhere apply after the next sync"""
+        self.use(self.obtain()['access'])
+        self.client.get(ME_URL)
+
+        # what revoke_user_tokens() in another process leaves behind
+        AccessTokenRevocation.objects.create(
+            user=self.user,
+            expires_at=timezone.now() + timedelta(seconds=60)
+        )
+        with override_settings(ACCESS_DENYLIST_SYNC_INTERVAL=0):
+            response = self.client.get(ME_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_user_rejected(self):
+        """Test the access tokens of a deleted user stop working"""
+        self.use(self.obtain()['access'])
+
+        self.user.delete()
+        response = self.client.get(RECIPES_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class ClaimChangeSyncTests(TestCase):
+    """Test claim changes reach processes without a shared cache"""
+
+    def setUp(self):
+        tokens.access_denylist.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@email.com',
+            'testPW',
+            name='Old name'
+        )
+        access, _ = tokens.create_access_token(self.user)
+        self.authorization = f'Bearer {access}'
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=self.authorization)
+        self.client.get(ME_URL)
+
+    def test_change_from_other_process(self):
+        """Test claims changed elsewhere are read after the next sync"""
+        # what saving the user in another process leaves behind
+        get_user_model().objects.update(name='New name')
+        AccessTokenRevocation.objects.create(
+            user=self.user,
+            claims_changed=True,
+            expires_at=timezone.now() + timedelta(seconds=60)
+        )
+        with override_settings(ACCESS_DENYLIST_SYNC_INTERVAL=0):
+            response = self.client.get(ME_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], 'New name')
+
+    def test_change_in_this_process(self):
+        """Test a claim change applies at once in the process making it"""
+        self.user.is_staff = True
+        self.user.save()
+
+        request = APIRequestFactory().get(
+            RECIPES_URL, HTTP_AUTHORIZATION=self.authorization
+        )
+        user, _ = SignedTokenAuthentication().authenticate(request)
+
+        self.assertTrue(user.is_staff)
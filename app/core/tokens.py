@@ -0,0 +1,315 @@
+"""Signed access tokens and the refresh tokens they are issued for
+
+Access tokens are HMAC signed with SECRET_KEY (django.core.signing) and
+carry the user id and USER_CLAIMS, the issue and expiry times and a token
+id, so checking one and building its user needs no database work. They
+live for ACCESS_TOKEN_LIFETIME seconds.
+Refresh tokens are random, stored as a hash and exchanged, once, for a
+new access and refresh token pair.
+
+Revoked access tokens are listed in AccessTokenRevocation until they
+expire. Every process keeps the unexpired rows in memory, reloaded every
+ACCESS_DENYLIST_SYNC_INTERVAL seconds, so a revocation made by another
+process takes effect within that interval. Revocations made by the
+process itself apply at once.
+
+Changing a user's claims is recorded the same way, with a row marking
+the tokens issued before the change out of date: their user is read from
+the database instead of their claims. With a cache shared by all
+processes as settings.TOKEN_CACHE_ALIAS, claim changes and revocations of
+all of a user's tokens are also recorded there, so they apply in every
+process at once rather than after the next reload.
+"""
+import hashlib
+import secrets
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import router, transaction
+from django.utils import timezone
+
+from core.models import AccessTokenRevocation, RefreshToken
+
+
+SALT = 'core.tokens.access'
+CHANGED_KEY = 'auth:signed:changed:{user_id}'
+
+# user fields carried by access tokens, all the views read of the user
+USER_CLAIMS = ('email', 'name', 'is_active', 'is_staff')
+
+
+class InvalidToken(Exception):
+    """Raised for a bad, expired or revoked token"""
+
+
+class AccessDenylist:
+    """In-memory copy of the unexpired access token revocations"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._jtis = set()
+            # {user id: timestamp before which their tokens are revoked}
+            self._users = {}
+            # {user id: timestamp before which their claims are outdated}
+            self._changed = {}
+            self._synced_at = None
+
+    def is_denied(self, payload):
+        self.sync_if_stale()
+        with self._lock:
+            return (
+                payload['jti'] in self._jtis or
+                payload['iat'] < self._users.get(payload['uid'], 0)
+            )
+
+    def changed_at(self, user_id):
+        """Return when the claims of a user last changed, 0 if unknown"""
+        self.sync_if_stale()
+        with self._lock:
+            return self._changed.get(user_id, 0)
+
+    def sync_if_stale(self):
+        synced_at = self._synced_at
+        interval = settings.ACCESS_DENYLIST_SYNC_INTERVAL
+        if synced_at is None or time.monotonic() - synced_at >= interval:
+            self.sync()
+
+    def sync(self):
+        """Reload the revocations from the database"""
+        rows = AccessTokenRevocation.objects.filter(
+            expires_at__gt=timezone.now()
+        ).values_list('jti', 'user_id', 'created', 'claims_changed')
+
+        jtis = set()
+        users = {}
+        changed = {}
+        for jti, user_id, created, claims_changed in rows:
+            if jti:
+                jtis.add(jti)
+            else:
+                times = changed if claims_changed else users
+                times[user_id] = max(
+                    times.get(user_id, 0), created.timestamp()
+                )
+
+        with self._lock:
+            self._jtis = jtis
+            self._users = users
+            self._changed = changed
+            self._synced_at = time.monotonic()
+
+    def add(self, revocation):
+        with self._lock:
+            if revocation.jti:
+                self._jtis.add(revocation.jti)
+            else:
+                times = (
+                    self._changed if revocation.claims_changed
+                    else self._users
+                )
+                times[revocation.user_id] = max(
+                    times.get(revocation.user_id, 0),
+                    revocation.created.timestamp()
+                )
+
+
+access_denylist = AccessDenylist()
+
+
+def refresh_digest(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def create_access_token(user):
+    """Return a signed access token for user and its payload"""
+    now = time.time()
+    payload = {
+        'uid': user.pk,
+        'user': {name: getattr(user, name) for name in USER_CLAIMS},
+        'jti': uuid.uuid4().hex,
+        'iat': now,
+        'exp': now + settings.ACCESS_TOKEN_LIFETIME,
+    }
+    return signing.dumps(payload, salt=SALT), payload
+
+
+def read_access_token(token):
+    """Return the payload of a valid access token, or raise InvalidToken"""
+    try:
+        payload = signing.loads(token, salt=SALT)
+    except signing.BadSignature:
+        raise InvalidToken('Invalid access token.')
+
+    if payload['exp'] <= time.time():
+        raise InvalidToken('Access token expired.')
+    if access_denylist.is_denied(payload):
+        raise InvalidToken('Access token revoked.')
+
+    return payload
+
+
+def shared_cache():
+    """Return the settings.TOKEN_CACHE_ALIAS cache if processes share it
+
+    A local memory cache is only seen by its own process, so what is
+    recorded there for the other processes would never reach them.
+    """
+    alias = settings.TOKEN_CACHE_ALIAS
+    cache = caches[alias] if alias else None
+    return None if isinstance(cache, LocMemCache) else cache
+
+
+def mark_user_changed(user_id):
+    """Have the access tokens issued to a user so far checked in the db"""
+    mark_shared_user_changed(user_id)
+    revoke(AccessTokenRevocation(
+        user_id=user_id,
+        claims_changed=True,
+        expires_at=timezone.now() + timedelta(
+            seconds=settings.ACCESS_TOKEN_LIFETIME
+        )
+    ))
+
+
+def mark_shared_user_changed(user_id):
+    """Have other processes check a user's tokens in the db at once"""
+    cache = shared_cache()
+    if cache is not None:
+        cache.set(
+            CHANGED_KEY.format(user_id=user_id), time.time(),
+            settings.ACCESS_TOKEN_LIFETIME
+        )
+
+
+def token_user(payload):
+    """Return the user of a valid access token, or raise InvalidToken
+
+    Built from the claims of the token, unless the user changed or their
+    tokens were revoked since it was issued: the user is then read from
+    the database, and the revocations this process may not have synced
+    yet are checked.
+    """
+    user_model = get_user_model()
+    user_id = payload['uid']
+    claims = payload.get('user')
+    changed_at = access_denylist.changed_at(user_id)
+    cache = shared_cache()
+    if cache is not None:
+        changed_at = max(
+            changed_at, cache.get(CHANGED_KEY.format(user_id=user_id), 0)
+        )
+
+    if claims is None or payload['iat'] < changed_at:
+        issued = datetime.fromtimestamp(payload['iat'], timezone.utc)
+        if AccessTokenRevocation.objects.filter(
+            user_id=user_id, jti='', claims_changed=False,
+            created__gt=issued
+        ).exists():
+            raise InvalidToken('Access token revoked.')
+        user = user_model.objects.filter(pk=user_id).first()
+        if user is None:
+            raise InvalidToken('User inactive or deleted.')
+        return user
+
+    names = ['id', *USER_CLAIMS]
+    values = [user_id, *(claims[name] for name in USER_CLAIMS)]
+    return user_model.from_db(
+        router.db_for_read(user_model), names, values
+    )
+
+
+def issue_tokens(user):
+    """Return a new access token and refresh token for user"""
+    access, payload = create_access_token(user)
+    refresh = secrets.token_urlsafe(32)
+    RefreshToken.objects.create(
+        digest=refresh_digest(refresh),
+        user=user,
+        expires_at=timezone.now() + timedelta(
+            seconds=settings.REFRESH_TOKEN_LIFETIME
+        )
+    )
+
+    return {
+        'access': access,
+        'refresh': refresh,
+        'token_type': 'Bearer',
+        'expires_in': settings.ACCESS_TOKEN_LIFETIME,
+    }
+
+
+def use_refresh_token(token):
+    """Mark a refresh token used and return its user
+
+    Raises InvalidToken if it is unknown, expired or already used, so a
+    refresh token works exactly once even with concurrent requests.
+    """
+    digest = refresh_digest(token)
+    refresh = RefreshToken.objects.select_related('user').filter(
+        digest=digest
+    ).first()
+    used = RefreshToken.objects.filter(
+        digest=digest, used=False, expires_at__gt=timezone.now()
+    ).update(used=True)
+    if not used or not refresh.user.is_active:
+        raise InvalidToken('Invalid refresh token.')
+
+    return refresh.user
+
+
+def refresh_tokens(token):
+    """Exchange a refresh token for a new access and refresh token"""
+    with transaction.atomic():
+        return issue_tokens(use_refresh_token(token))
+
+
+def revoke_refresh_token(token, user_id):
+    """Revoke one of a user's refresh tokens"""
+    RefreshToken.objects.filter(
+        digest=refresh_digest(token), user_id=user_id
+    ).update(used=True)
+
+
+def revoke(revocation):
+    """Save a revocation and apply it to this process at once"""
+    now = timezone.now()
+    # rows only matter until the tokens they cover expire
+    AccessTokenRevocation.objects.filter(expires_at__lte=now).delete()
+    revocation.save()
+    access_denylist.add(revocation)
+
+
+def revoke_access_token(payload):
+    """Revoke a single access token given its payload"""
+    revoke(AccessTokenRevocation(
+        jti=payload['jti'],
+        user_id=payload['uid'],
+        expires_at=timezone.now() + timedelta(
+            seconds=max(payload['exp'] - time.time(), 0)
+        )
+    ))
+
+
+def revoke_user_tokens(user_id):
+    """Revoke every access and refresh token a user was issued so far"""
+    RefreshToken.objects.filter(user_id=user_id, used=False).update(
+        used=True
+    )
+    mark_shared_user_changed(user_id)
+    revoke(AccessTokenRevocation(
+        user_id=user_id,
+        expires_at=timezone.now() + timedelta(
+            seconds=settings.ACCESS_TOKEN_LIFETIME
+        )
+    ))
@@ -0,0 +1,74 @@
+import ipaddress
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.cache import never_cache
+
+from core import metrics
+from core.db.pool import pool_stats
+from core.health import run_checks
+
+
+def internal_request(request):
+    """Return whether a request may see the internals of the process
+
+    See METRICS_ALLOWED_IPS and METRICS_TOKEN in the settings.
+    """
+    if settings.DEBUG:
+        return True
+
+    token = settings.METRICS_TOKEN
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    if token and constant_time_compare(header, f'Bearer {token}'):
+        return True
+
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(
+        address in ipaddress.ip_network(network, strict=False)
+        for network in settings.METRICS_ALLOWED_IPS
+    )
+
+
+@never_cache
+def healthz(request):
+    """Liveness: the process is up and answering requests
+
+    Checks nothing else, so a database outage does not get every pod
+    restarted.
+    """
+    return JsonResponse({'status': 'ok'})
+
+
+@never_cache
+def readyz(request):
+    """Readiness: the database and the media volume can be used
+
+    Internal requests (see internal_request()) also get the latency or
+    error of every check and the usage of the process's database
+    connection pools; anyone else only whether each check passed.
+    """
+    ready, checks = run_checks()
+    body = {'status': 'ok' if ready else 'unavailable'}
+    if internal_request(request):
+        body.update(checks=checks, pools=pool_stats())
+    else:
+        body['checks'] = {name: check['ok'] for name, check in checks.items()}
+    return JsonResponse(body, status=200 if ready else 503)
+
+
+@never_cache
+def metrics_view(request):
+    """The process's metrics in the Prometheus text format
+
+    Only served to internal requests, see internal_request().
+    """
+    if not internal_request(request):
+        raise Http404
+    return HttpResponse(
+        metrics.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -0,0 +1,127 @@
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connections
+from django.db.models.functions import Lower
+
+
+# fuzzy matching on one or two characters matches almost everything
+FUZZY_MIN_LENGTH = 3
+
+
+class PrefixCache:
+    """Bounded, per-process LRU cache of autocomplete results
+
+    Entries are keyed by model, user, term and limit. The size is read from
+    settings.AUTOCOMPLETE_CACHE_SIZE on every call and a size of 0 turns
+    the cache off. Each process keeps its own copy, so invalidation only
+    covers names added through this process.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def max_entries(self):
+        return getattr(settings, 'AUTOCOMPLETE_CACHE_SIZE', 0)
+
+    def get(self, key):
+        """Return the cached results for key or None"""
+        with self._lock:
+            results = self._entries.get(key)
+            if results is not None:
+                self._entries.move_to_end(key)
+            return results
+
+    def set(self, key, results):
+        """Cache results, evicting the least recently used entries"""
+        max_entries = self.max_entries
+        if max_entries <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = results
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, model, user_id):
+        """Drop every cached result for a user's tags or ingredients"""
+        label = model._meta.label
+        with self._lock:
+            stale = [
+                key for key in self._entries
+                if key[0] == label and key[1] == user_id
+            ]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+prefix_cache = PrefixCache()
+
+
+@lru_cache(maxsize=None)
+def trigrams_supported(using):
+    """Return True if the database has the pg_trgm extension installed"""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return False
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def complete(queryset, term, limit):
+    """Return up to `limit` {'id', 'name'} rows whose name matches term
+
+    Names starting with the term come first, in alphabetical order, and are
+    served by the (user_id, lower(name)) index. On PostgreSQL any remaining
+    slots are filled with trigram matches so small typos still find a name.
+    """
+    rows = list(
+        queryset.annotate(
+            name_lower=Lower('name')
+        ).filter(
+            name_lower__startswith=term.lower()
+        ).order_by('name_lower', 'id').values('id', 'name')[:limit]
+    )
+
+    fuzzy = (
+        len(rows) < limit and
+        len(term) >= FUZZY_MIN_LENGTH and
+        trigrams_supported(queryset.db)
+    )
+    if fuzzy:
+        rows.extend(
+            queryset.filter(
+                name__trigram_similar=term
+            ).exclude(
+                id__in=[row['id'] for row in rows]
+            ).annotate(
+                similarity=TrigramSimilarity('name', term)
+            ).order_by('-similarity', 'id').values(
+                'id', 'name'
+            )[:limit - len(rows)]
+        )
+
+    return rows
+
+
+def cached_complete(queryset, user, term, limit):
+    """Return complete() results, going through the prefix cache"""
+    key = (queryset.model._meta.label, user.pk, term.lower(), limit)
+    results = prefix_cache.get(key)
+    if results is None:
+        results = complete(queryset, term, limit)
+        prefix_cache.set(key, results)
+
+    return results
@@ -0,0 +1,189 @@
+import hashlib
+import pickle
+import threading
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from rest_framework import status
+from rest_framework.response import Response
+
+from core import metrics
+
+
+VERSION_KEY = 'recipe:data-version:{user_id}'
+RESPONSE_KEY = 'recipe:response:{user_id}:{version}:{uri}'
+
+
+class CacheStats:
+    """Per-process hit/miss counters for the response cache"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def increment(self, counter):
+        with self._lock:
+            self._counts[counter] += 1
+
+    def reset(self):
+        with self._lock:
+            self._counts = {'hits': 0, 'misses': 0, 'too_large': 0}
+
+    def snapshot(self):
+        """Return a copy of the counters"""
+        with self._lock:
+            return dict(self._counts)
+
+
+stats = CacheStats()
+
+
+@metrics.register_collector
+def collect_stats():
+    return metrics.counter_samples(
+        'app_response_cache', 'Recipe API response cache lookups',
+        stats.snapshot()
+    )
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def get_data_version(user_id):
+    """Return the current version of a user's recipe data
+
+    Versions are random rather than counters, so a version key that gets
+    evicted from the cache can never come back as an older value and
+    revive stale responses.
+    """
+    cache = get_cache()
+    key = VERSION_KEY.format(user_id=user_id)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+
+    return version
+
+
+def bump_data_version(user_id):
+    """Invalidate every cached response of a user"""
+    get_cache().set(
+        VERSION_KEY.format(user_id=user_id),
+        uuid.uuid4().hex,
+        timeout=None
+    )
+
+
+class CachedResponseMixin:
+    """Cache successful responses per user and per user data version
+
+    Call cached_response() from the actions that should be cached. Any
+    write to a user's tags, ingredients or recipes bumps their data version
+    (see recipe.signals), which orphans all of their cached responses, so a
+    response is never served after the data behind it changed. Orphaned
+    entries are evicted by the cache backend's own LRU culling.
+    """
+
+    def get_response_cache_key(self, request):
+        uri = hashlib.md5(
+            request.build_absolute_uri().encode('utf-8')
+        ).hexdigest()
+        return RESPONSE_KEY.format(
+            user_id=request.user.pk,
+            version=get_data_version(request.user.pk),
+            uri=uri
+        )
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        """Return the cached response for request or call handler"""
+        if not settings.RESPONSE_CACHE_ENABLED:
+            return handler(request, *args, **kwargs)
+
+        cache = get_cache()
+        key = self.get_response_cache_key(request)
+
+        payload = cache.get(key)
+        if payload is not None:
+            stats.increment('hits')
+            response = Response(pickle.loads(payload))
+            response['X-Cache'] = 'HIT'
+            return response
+
+        stats.increment('misses')
+        response = handler(request, *args, **kwargs)
+        response['X-Cache'] = 'MISS'
+        if response.status_code != status.HTTP_200_OK:
+            return response
+
+        # the entry size limit, together with the backend's MAX_ENTRIES,
+        # puts a bound on the memory the cache can use
+        payload = pickle.dumps(response.data, pickle.HIGHEST_PROTOCOL)
+        if len(payload) > settings.RESPONSE_CACHE_MAX_ENTRY_SIZE:
+            stats.increment('too_large')
+            return response
+
+        cache.set(key, payload, settings.RESPONSE_CACHE_TIMEOUT)
+        return response
+
+
+class ConditionalResponseMixin:
+    """Answer conditional GETs from the user's change metadata
+
+    The ETag is derived from the user's data_changed_at (kept up to date by
+    core.signals), the request URI and the Accept header, so it can be
+    worked out with a single primary key lookup. When If-None-Match or
+    If-Modified-Since show the client is up to date a 304 is returned
+    before anything is loaded or serialized. Must come before
+    CachedResponseMixin in the bases.
+
+    Last-Modified has a one second resolution, so clients should prefer
+    If-None-Match. The responses vary with Accept and Authorization, so
+    shared caches keep the validators of each representation and user
+    apart.
+    """
+
+    def get_etag(self, request, changed_at):
+        parts = (
+            str(request.user.pk),
+            changed_at.isoformat() if changed_at else '',
+            request.build_absolute_uri(),
+            request.META.get('HTTP_ACCEPT', ''),
+        )
+        return quote_etag(
+            hashlib.md5('\n'.join(parts).encode('utf-8')).hexdigest()
+        )
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        changed_at = get_user_model().objects.filter(
+            pk=request.user.pk
+        ).values_list('data_changed_at', flat=True).first()
+
+        etag = self.get_etag(request, changed_at)
+        last_modified = changed_at and int(changed_at.timestamp())
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = super().cached_response(
+                handler, request, *args, **kwargs
+            )
+            patch_vary_headers(response, ('Accept', 'Authorization'))
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        else:
+            patch_vary_headers(response, ('Accept', 'Authorization'))
+
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+
+        return response
@@ -0,0 +1,94 @@
+import csv
+import json
+from itertools import islice
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from recipe.serializers import RecipeValuesSerializer
+
+
+# the relations are inlined with the same shape as the recipe detail
+EXPAND = ('ingredients', 'tags')
+
+CSV_COLUMNS = ('id', 'title', 'time_minutes', 'price', 'link',
+               'tags', 'ingredients')
+
+# separates the tag/ingredient names within a CSV cell
+CSV_NAME_SEPARATOR = '; '
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Selects newline delimited JSON for the export action
+
+    The export itself is streamed by the view, so this only renders
+    error responses.
+    """
+
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        return json.dumps(data, cls=JSONEncoder).encode(self.charset) + b'\n'
+
+
+class CSVRenderer(NDJSONRenderer):
+    """Selects CSV for the export action, errors are rendered as JSON"""
+
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+def export_recipes(queryset, chunk_size):
+    """Yield every recipe of queryset as a dict, tags/ingredients inlined
+
+    Recipes are read through a server-side cursor where the database has
+    them, `chunk_size` rows at a time, and the relations of each chunk are
+    loaded with one query per relation. Memory use therefore depends on
+    the chunk size, not on the number of recipes.
+    """
+    serializer = RecipeValuesSerializer(expand=EXPAND)
+    rows = serializer.get_queryset(
+        queryset.order_by('id')
+    ).iterator(chunk_size=chunk_size)
+
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+
+        yield from serializer.to_representation(chunk)
+
+
+def ndjson_lines(recipes):
+    """Render recipes as newline delimited JSON, one line per recipe"""
+    for recipe in recipes:
+        yield json.dumps(recipe, cls=JSONEncoder) + '\n'
+
+
+class Echo:
+    """File-like object that returns what is written to it"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(recipes):
+    """Render recipes as CSV rows, starting with a header row
+
+    Tags and ingredients are given as their names, separated by
+    CSV_NAME_SEPARATOR.
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_COLUMNS)
+
+    for recipe in recipes:
+        for field_name in EXPAND:
+            recipe[field_name] = CSV_NAME_SEPARATOR.join(
+                related['name'] for related in recipe[field_name]
+            )
+        yield writer.writerow([recipe[column] for column in CSV_COLUMNS])
@@ -0,0 +1,102 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import Count, Case, When, Value, IntegerField, F, Q
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework.exceptions import ValidationError
+
+from core.models import Recipe
+from core.search import SEARCH_CONFIG, search_vector_supported
+
+
+MATCH_ANY = 'any'
+MATCH_ALL = 'all'
+
+
+def params_to_ints(name, value):
+    """Convert a comma separated string of ids to a list of integers"""
+    try:
+        ids = {int(str_id) for str_id in value.split(',') if str_id.strip()}
+    except ValueError:
+        raise ValidationError(
+            {name: _('Expected a comma separated list of ids.')}
+        )
+
+    return sorted(ids)
+
+
+def recipes_with_related(through, related_column, ids, match):
+    """Return a subquery of recipe ids linked to the given related ids
+
+    Both modes run as a single query on the M2M through table. For all-of
+    matching the rows are grouped by recipe and only recipes linked to
+    every requested id are kept, rather than chaining one join per id.
+    """
+    rows = through.objects.filter(**{f'{related_column}__in': ids})
+
+    if match == MATCH_ALL:
+        rows = rows.values('recipe_id').annotate(
+            matched=Count(related_column, distinct=True)
+        ).filter(matched=len(ids))
+
+    return rows.values('recipe_id')
+
+
+def filter_recipes(queryset, query_params):
+    """Apply the ?tags=, ?ingredients= and ?match= filters to a queryset"""
+    match = query_params.get('match', MATCH_ANY)
+    if match not in (MATCH_ANY, MATCH_ALL):
+        raise ValidationError(
+            {'match': _('Expected "%s" or "%s".') % (MATCH_ANY, MATCH_ALL)}
+        )
+
+    related = (
+        ('tags', Recipe.tags.through, 'tag_id'),
+        ('ingredients', Recipe.ingredients.through, 'ingredient_id'),
+    )
+    for param, through, related_column in related:
+        value = query_params.get(param)
+        if not value:
+            continue
+
+        ids = params_to_ints(param, value)
+        if ids:
+            queryset = queryset.filter(
+                id__in=recipes_with_related(
+                    through, related_column, ids, match
+                )
+            )
+
+    return queryset
+
+
+def search_recipes(queryset, term):
+    """Return recipes matching a search term, most relevant first
+
+    On PostgreSQL this matches the stored, GIN indexed search vector and
+    ranks with ts_rank. Other databases (e.g. SQLite in local test runs)
+    fall back to case insensitive substring matching, ranking title
+    matches above tag and ingredient matches.
+    """
+    if search_vector_supported(queryset.db):
+        query = SearchQuery(term, config=SEARCH_CONFIG)
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-id')
+
+    title_match = Q(title__icontains=term)
+    tag_match = Q(id__in=Recipe.tags.through.objects.filter(
+        tag__name__icontains=term
+    ).values('recipe_id'))
+    ingredient_match = Q(id__in=Recipe.ingredients.through.objects.filter(
+        ingredient__name__icontains=term
+    ).values('recipe_id'))
+
+    return queryset.filter(
+        title_match | tag_match | ingredient_match
+    ).annotate(
+        rank=Case(
+            When(title_match, then=Value(2)),
+            default=Value(1),
+            output_field=IntegerField()
+        )
+    ).order_by('-rank', '-id')
@@ -0,0 +1,183 @@
+"""Render the resized variants of uploaded recipe images
+
+Decoding and re-encoding an image takes far longer than the upload
+request should, so the variants are rendered by a small pool of worker
+threads once the transaction that stored the original has committed.
+Recipe.image_status and Recipe.image_variants report the progress.
+
+Images are content addressed (see core.storage), so the variants of a
+picture already used by another recipe exist and are not rendered again.
+The same pool deletes the files no recipe references any more.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, router, transaction
+
+from PIL import Image
+
+from core.models import Recipe, StoredFile, IMAGE_READY, IMAGE_FAILED
+from core.signals import touch_user_data
+from core.storage import image_storage
+
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+# set while a garbage collection is queued, so one is queued at most
+_collect_queued = threading.Event()
+
+
+def get_executor():
+    """Return the process wide image worker pool, starting it on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS,
+                thread_name_prefix='recipe-image'
+            )
+        return _executor
+
+
+def variant_name(name, variant):
+    """Return the storage name of a variant of the image stored as name"""
+    return image_storage.derived_name(name, variant) + '.jpg'
+
+
+def variant_urls(recipe, request=None):
+    """Return {variant: url} for the ready variants of a recipe image"""
+    if not recipe.image:
+        return {}
+
+    urls = {}
+    for variant in recipe.ready_image_variants:
+        url = image_storage.url(variant_name(recipe.image.name, variant))
+        urls[variant] = request.build_absolute_uri(url) if request else url
+    return urls
+
+
+def render_variant(image, size):
+    """Return image shrunk to fit within size, encoded as JPEG"""
+    image = image.copy()
+    image.thumbnail(size, Image.LANCZOS)
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=settings.RECIPE_IMAGE_QUALITY,
+               optimize=True)
+    return buffer.getvalue()
+
+
+def open_image(name):
+    """Decode the stored image at no more than the size of the variants"""
+    sizes = settings.RECIPE_IMAGE_VARIANTS.values()
+    largest = (max(w for w, _ in sizes), max(h for _, h in sizes))
+    with image_storage.open(name) as image_file:
+        image = Image.open(image_file)
+        # lets JPEG decode at a reduced scale, much faster for big photos
+        image.draft('RGB', largest)
+        return image.convert('RGB')
+
+
+def generate_variants(recipe_id, name, using=None):
+    """Write every variant of a recipe image and record the progress
+
+    The variants are rendered smallest first and each is recorded on the
+    recipe as soon as it is written. Variants that exist already are kept.
+    If the recipe got another image or was deleted in the meantime the
+    work stops; the files are deleted with the image.
+    """
+    using = using or router.db_for_write(Recipe)
+    recipes = Recipe.objects.using(using).filter(pk=recipe_id, image=name)
+    variants = sorted(
+        settings.RECIPE_IMAGE_VARIANTS.items(), key=lambda item: item[1]
+    )
+
+    user_id = recipes.values_list('user_id', flat=True).first()
+    if user_id is None:
+        return
+
+    ready = []
+    image = None
+    try:
+        for variant, size in variants:
+            path = variant_name(name, variant)
+            if not image_storage.exists(path):
+                image = image or open_image(name)
+                image_storage.save_as(
+                    path, ContentFile(render_variant(image, size))
+                )
+            ready.append(variant)
+            if not recipes.update(image_variants=','.join(ready)):
+                return
+            touch_user_data([user_id], using)
+        status = IMAGE_READY
+    except Exception:
+        logger.exception('Rendering the variants of %s failed', name)
+        status = IMAGE_FAILED
+
+    if recipes.update(image_status=status):
+        touch_user_data([user_id], using)
+
+
+def _run_in_worker(recipe_id, name, using):
+    try:
+        generate_variants(recipe_id, name, using)
+    finally:
+        # worker threads get their own connections, which nothing else
+        # would ever close
+        connections.close_all()
+
+
+def schedule_variants(recipe, using=None):
+    """Render the variants of a recipe image once the transaction commits
+
+    With RECIPE_IMAGE_WORKERS set to 0 they are rendered in the caller.
+    """
+    using = using or router.db_for_write(Recipe)
+    name = recipe.image.name
+
+    def submit():
+        if settings.RECIPE_IMAGE_WORKERS:
+            get_executor().submit(_run_in_worker, recipe.pk, name, using)
+        else:
+            generate_variants(recipe.pk, name, using)
+
+    transaction.on_commit(submit, using=using)
+
+
+def collect_garbage(using=None):
+    """Delete every unreferenced image, return the number deleted"""
+    return StoredFile.objects.db_manager(using).collect_garbage(
+        settings.RECIPE_IMAGE_GC_BATCH_SIZE
+    )
+
+
+def _collect_in_worker(using):
+    _collect_queued.clear()
+    try:
+        collect_garbage(using)
+    finally:
+        connections.close_all()
+
+
+def schedule_collect(using=None):
+    """Delete unreferenced images once the transaction commits
+
+    Meant to be called whenever an image loses a reference. Any number of
+    calls queue a single collection.
+    """
+    using = using or router.db_for_write(Recipe)
+
+    def submit():
+        if not settings.RECIPE_IMAGE_WORKERS:
+            collect_garbage(using)
+        elif not _collect_queued.is_set():
+            _collect_queued.set()
+            get_executor().submit(_collect_in_worker, using)
+
+    transaction.on_commit(submit, using=using)
@@ -0,0 +1,222 @@
+import csv
+import json
+import time
+from itertools import islice
+
+from django.db import router, transaction
+
+from rest_framework.exceptions import ValidationError
+
+from core.bulk import insert_recipes
+from core.models import Tag, Ingredient, Recipe
+
+from recipe.autocomplete import prefix_cache
+from recipe.export import CSV_NAME_SEPARATOR
+from recipe.serializers import RecipeImportSerializer
+
+
+NDJSON = 'ndjson'
+CSV = 'csv'
+FORMATS = (NDJSON, CSV)
+
+# the related names of a record and the model they resolve to
+RELATED_MODELS = (('tags', Tag), ('ingredients', Ingredient))
+
+# keeps the report of a bad file from growing with it
+MAX_REPORTED_ERRORS = 100
+
+
+def format_for_name(filename, default=NDJSON):
+    """Guess the import format from a file name"""
+    extension = filename.rsplit('.', 1)[-1].lower() if filename else ''
+    return extension if extension in FORMATS else default
+
+
+def related_names(values):
+    """Normalise tags/ingredients given as names or as exported objects"""
+    if not isinstance(values, list):
+        return values
+
+    return [
+        value.get('name') if isinstance(value, dict) else value
+        for value in values
+    ]
+
+
+def read_ndjson(stream):
+    """Yield (data, error) for every non blank line of an NDJSON stream"""
+    for line in stream:
+        if not line.strip():
+            continue
+
+        try:
+            data = json.loads(line)
+        except ValueError as error:
+            yield None, {'non_field_errors': [f'Invalid JSON: {error}']}
+            continue
+
+        if not isinstance(data, dict):
+            yield None, {'non_field_errors': ['Expected a JSON object.']}
+            continue
+
+        for field_name, _ in RELATED_MODELS:
+            if field_name in data:
+                data[field_name] = related_names(data[field_name])
+        yield data, None
+
+
+def read_csv(stream):
+    """Yield (data, error) for every row of a CSV stream with a header"""
+    separator = CSV_NAME_SEPARATOR.strip()
+    for row in csv.DictReader(stream):
+        data = {key: value for key, value in row.items() if key}
+        for field_name, _ in RELATED_MODELS:
+            names = data.get(field_name) or ''
+            data[field_name] = [
+                name.strip() for name in names.split(separator)
+                if name.strip()
+            ]
+        yield data, None
+
+
+READERS = {NDJSON: read_ndjson, CSV: read_csv}
+
+
+class ImportStats:
+    """Progress of an import, reported after every batch"""
+
+    def __init__(self, checkpoint=0):
+        self.started = time.perf_counter()
+        # number of records dealt with, i.e. the count to skip on resume
+        self.checkpoint = checkpoint
+        self.imported = 0
+        self.skipped = 0
+        self.errors = []
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rate(self):
+        """Imported recipes per second"""
+        return self.imported / self.elapsed if self.elapsed else 0.0
+
+    def add_error(self, record, errors):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'record': record, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'imported': self.imported,
+            'skipped': self.skipped,
+            'checkpoint': self.checkpoint,
+            'seconds': round(self.elapsed, 3),
+            'rate': round(self.rate, 1),
+            'errors': self.errors,
+        }
+
+
+class RecipeImporter:
+    """Import recipe records into a user's library in fixed size batches
+
+    Records are read lazily, validated one by one and inserted
+    `batch_size` at a time by core.bulk.insert_recipes (COPY on
+    PostgreSQL), each batch in its own transaction. Tag and ingredient
+    names are resolved through an in-memory map, so only names not seen
+    before cost a query, one per batch. Memory use is bounded by the batch
+    size and the number of distinct names.
+
+    Invalid records are skipped and reported by number, counting from 1.
+    After a failure the import can be resumed by skipping the
+    `checkpoint` records that were already dealt with.
+    """
+
+    def __init__(self, user, batch_size=1000, using=None):
+        self.user = user
+        self.batch_size = batch_size
+        self.using = using or router.db_for_write(Recipe)
+        # {model: {lower case name: pk}}
+        self.name_ids = {model: {} for _, model in RELATED_MODELS}
+
+    def run(self, stream, file_format, skip=0, on_batch=None):
+        """Import every record of stream and return the ImportStats
+
+        on_batch, if given, is called with the stats after every batch.
+        """
+        stats = ImportStats(checkpoint=skip)
+        # building a serializer's fields costs far more than validating a
+        # record, so one instance validates them all
+        serializer = RecipeImportSerializer()
+        records = enumerate(READERS[file_format](stream), start=1)
+        records = islice(records, skip, None)
+
+        while True:
+            batch = list(islice(records, self.batch_size))
+            if not batch:
+                return stats
+
+            valid = []
+            for number, (data, errors) in batch:
+                if errors is None:
+                    try:
+                        valid.append(serializer.run_validation(data))
+                        continue
+                    except ValidationError as error:
+                        errors = error.detail
+                stats.add_error(number, errors)
+
+            with transaction.atomic(using=self.using):
+                self.insert(valid)
+
+            stats.imported += len(valid)
+            stats.checkpoint = batch[-1][0]
+            if on_batch is not None:
+                on_batch(stats)
+
+    def resolve_names(self, model, names):
+        """Add the ids of names not seen before to the name map"""
+        ids = self.name_ids[model]
+        missing = {}
+        for name in names:
+            if name.lower() not in ids:
+                missing.setdefault(name.lower(), name)
+        if not missing:
+            return ids
+
+        results = model.objects.get_or_create_names(
+            self.user, list(missing.values())
+        )
+        for key, (obj, _) in zip(missing, results):
+            ids[key] = obj.pk
+        if any(created for _, created in results):
+            prefix_cache.invalidate(model, self.user.pk)
+
+        return ids
+
+    def insert(self, records):
+        if not records:
+            return
+
+        related = [{} for _ in records]
+        for field_name, model in RELATED_MODELS:
+            ids = self.resolve_names(model, (
+                name for record in records for name in record[field_name]
+            ))
+            for links, record in zip(related, records):
+                links[field_name] = list(dict.fromkeys(
+                    ids[name.lower()] for name in record[field_name]
+                ))
+
+        recipes = [
+            Recipe(
+                user=self.user,
+                title=record['title'],
+                time_minutes=record['time_minutes'],
+                price=record['price'],
+                link=record.get('link', '')
+            )
+            for record in records
+        ]
+        insert_recipes(recipes, related, using=self.using)
@@ -0,0 +1,83 @@
+"""Helpers shared by the recipe benchmark management commands"""
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from core.models import Tag, Ingredient, Recipe
+
+
+class Rollback(Exception):
+    """Raised to throw away benchmark data once it has been measured"""
+
+
+@contextmanager
+def rolled_back():
+    """Run the block in a transaction that is always rolled back"""
+    try:
+        with transaction.atomic():
+            yield
+            raise Rollback
+    except Rollback:
+        pass
+
+
+def seed_library(email, recipes, tags, ingredients, rng):
+    """Create a user with a recipe library of the given size
+
+    Every recipe gets 1-5 random tags and 1-5 random ingredients. Returns
+    the user and the ids of the created tags, ingredients and recipes.
+    """
+    user = get_user_model().objects.create_user(email)
+    tag_ids = _seed_names(Tag, user, tags)
+    ingredient_ids = _seed_names(Ingredient, user, ingredients)
+
+    Recipe.objects.bulk_create(
+        (
+            Recipe(user=user, title=f'Recipe {i}', time_minutes=10, price=5)
+            for i in range(recipes)
+        ),
+        batch_size=500
+    )
+    recipe_ids = list(
+        Recipe.objects.filter(user=user).values_list('id', flat=True)
+    )
+    _link(Recipe.tags.through, 'tag_id', recipe_ids, tag_ids, rng)
+    _link(Recipe.ingredients.through, 'ingredient_id', recipe_ids,
+          ingredient_ids, rng)
+
+    return user, tag_ids, ingredient_ids, recipe_ids
+
+
+def time_ms(func, repeat):
+    """Return the wall time of `repeat` calls to func in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return timings
+
+
+def _seed_names(model, user, count):
+    model.objects.bulk_create(
+        (model(user=user, name=f'{model.__name__} {i}') for i in range(count)),
+        batch_size=500
+    )
+    return list(model.objects.filter(user=user).values_list('id', flat=True))
+
+
+def _link(through, column, recipe_ids, related_ids, rng):
+    """Attach 1-5 random related rows to every recipe"""
+    through.objects.bulk_create(
+        (
+            through(recipe_id=recipe_id, **{column: related_id})
+            for recipe_id in recipe_ids
+            for related_id in rng.sample(
+                related_ids, min(len(related_ids), rng.randint(1, 5))
+            )
+        ),
+        batch_size=500
+    )
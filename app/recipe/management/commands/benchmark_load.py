@@ -0,0 +1,219 @@
+import json
+import os
+import random
+import subprocess
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import (
+    override_settings, setup_databases, teardown_databases,
+)
+from django.utils import timezone
+
+from recipe import images
+from recipe.management import loadtest
+from recipe.management.benchmark import seed_library
+
+
+DEFAULT_MIX = {
+    'list': 40, 'detail': 30, 'create': 10, 'patch': 10, 'login': 5,
+    'upload': 5,
+}
+
+PASSWORD = 'loadtest-password'
+
+
+def parse_mix(values):
+    """Return {operation: weight} of 'operation=weight' strings"""
+    mix = {}
+    for value in values:
+        operation, _, weight = value.partition('=')
+        if operation not in loadtest.OPERATIONS:
+            raise CommandError(
+                f'Unknown operation {operation!r}, pick from '
+                f'{", ".join(loadtest.OPERATIONS)}'
+            )
+        try:
+            mix[operation] = float(weight)
+        except ValueError:
+            raise CommandError(f'Weight of {operation} is not a number')
+    if not any(mix.values()):
+        raise CommandError('Give at least one operation a weight')
+    return mix
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True,
+            universal_newlines=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    """Django command to load test the API over HTTP
+
+    Creates throwaway test databases, seeds --users users with a recipe
+    library each and serves the app from a thread of this process. Then
+    --concurrency clients log in and send a weighted random --mix of
+    requests for --duration seconds after a --warmup. Prints the
+    throughput and p50/p95/p99 latencies of every operation as JSON, with
+    the commit measured, so runs can be compared between commits.
+
+    The clients run in the same process as the server, so the numbers are
+    for comparing runs on the same machine, not capacity planning. Run it
+    against PostgreSQL: SQLite serializes every write.
+    """
+
+    help = 'Load test the API with concurrent clients and report latencies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument(
+            '--recipes', type=int, default=200,
+            help='Number of recipes seeded per user'
+        )
+        parser.add_argument('--tags', type=int, default=20)
+        parser.add_argument('--ingredients', type=int, default=50)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument(
+            '--duration', type=float, default=30,
+            help='Seconds to measure for'
+        )
+        parser.add_argument(
+            '--warmup', type=float, default=5,
+            help='Seconds to send requests for before measuring'
+        )
+        parser.add_argument(
+            '--mix', nargs='+', metavar='OPERATION=WEIGHT',
+            help='Relative weights of the operations, default '
+                 + ' '.join(f'{op}={w}' for op, w in DEFAULT_MIX.items())
+        )
+        parser.add_argument(
+            '--page-size', type=int, default=50,
+            help='Recipes per list request, 0 for the unpaginated list'
+        )
+        parser.add_argument('--output', help='File to write the JSON to')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options['mix']) if options['mix'] else DEFAULT_MIX
+        if options['users'] < 1 or options['recipes'] < 1:
+            raise CommandError('Seed at least one user and one recipe')
+
+        with tempfile.TemporaryDirectory() as directory:
+            for alias in connections:
+                test_settings = connections[alias].settings_dict['TEST']
+                # in-memory SQLite databases are not shared between threads
+                if connections[alias].vendor == 'sqlite' and \
+                        not test_settings.get('NAME'):
+                    test_settings['NAME'] = os.path.join(
+                        directory, f'{alias}.sqlite3'
+                    )
+
+            self.stderr.write('Creating test databases...')
+            old_config = setup_databases(verbosity=0, interactive=False)
+            try:
+                with override_settings(
+                    ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, '127.0.0.1'],
+                    MEDIA_ROOT=directory,
+                    DEBUG=False,
+                    NPLUSONE_ENABLED=False,
+                ):
+                    report = self.run(mix, options)
+            finally:
+                connections.close_all()
+                teardown_databases(old_config, verbosity=0)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def run(self, mix, options):
+        started = timezone.now()
+        rng = random.Random(options['seed'])
+        self.stderr.write(
+            f"Seeding {options['users']} users with "
+            f"{options['recipes']} recipes each..."
+        )
+        accounts = self.seed(options, rng)
+        upload_images = [loadtest.sample_image(seed) for seed in range(8)]
+
+        server = loadtest.start_server(WSGIHandler())
+        try:
+            host, port = server.server_address
+            clients = []
+            for i in range(options['concurrency']):
+                client = loadtest.Client(
+                    host, port, accounts[i % len(accounts)], upload_images,
+                    options['page_size'], random.Random(rng.random())
+                )
+                # one after another, so the first token of a user is not
+                # created by several clients at once
+                status = client.login()
+                if status != 200:
+                    raise CommandError(f'Logging in failed with {status}')
+                clients.append(client)
+
+            self.stderr.write(
+                f"Running {options['concurrency']} clients for "
+                f"{options['warmup']}+{options['duration']}s..."
+            )
+            results, seconds = loadtest.run_load(
+                clients, mix, options['duration'], options['warmup']
+            )
+            # let the image workers finish before the database goes away
+            images.get_executor().shutdown(wait=True)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        return {
+            'commit': current_commit(),
+            'started': started.isoformat(),
+            'database': connection.vendor,
+            'engine': connection.settings_dict['ENGINE'],
+            'options': {
+                name: options[name] for name in (
+                    'users', 'recipes', 'tags', 'ingredients', 'concurrency',
+                    'duration', 'warmup', 'page_size', 'seed',
+                )
+            },
+            'mix': mix,
+            'seconds': round(seconds, 3),
+            **results.summary(seconds),
+        }
+
+    def seed(self, options, rng):
+        """Return the login and row ids of every seeded user"""
+        accounts = []
+        for i in range(options['users']):
+            user, tag_ids, ingredient_ids, recipe_ids = seed_library(
+                f'loadtest-{i}@example.com',
+                recipes=options['recipes'],
+                tags=options['tags'],
+                ingredients=options['ingredients'],
+                rng=rng
+            )
+            accounts.append({
+                'email': user.email,
+                'password': PASSWORD,
+                'tag_ids': tag_ids,
+                'ingredient_ids': ingredient_ids,
+                'recipe_ids': recipe_ids,
+            })
+
+        # hashed once: hashing is slow on purpose
+        get_user_model().objects.update(password=make_password(PASSWORD))
+        return accounts
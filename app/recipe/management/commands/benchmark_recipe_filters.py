@@ -0,0 +1,72 @@
+import random
+import statistics
+
+from django.core.management.base import BaseCommand
+from django.http import QueryDict
+
+from core.models import Recipe
+
+from recipe.filters import filter_recipes
+from recipe.management.benchmark import rolled_back, seed_library, time_ms
+
+
+class Command(BaseCommand):
+    """Django command to time the recipe tag/ingredient filters
+
+    For every scale a throwaway user is seeded with that many recipes and
+    the any-of and all-of filters are timed. All data is rolled back at the
+    end of each scale. Timings should follow the number of matching
+    through rows, not the total size of the user's recipe library.
+    """
+
+    help = 'Benchmark ?tags=/?ingredients= filtering at growing scales'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scales', type=int, nargs='+', default=[1000, 10000, 30000],
+            help='Number of recipes to seed for each run'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Number of timed runs per filter'
+        )
+        parser.add_argument('--tags', type=int, default=50)
+        parser.add_argument('--ingredients', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        for scale in options['scales']:
+            with rolled_back():
+                self.run_scale(scale, rng, options)
+
+    def run_scale(self, scale, rng, options):
+        user, tag_ids, ingredient_ids, _ = seed_library(
+            f'benchmark-{scale}@example.com',
+            recipes=scale,
+            tags=options['tags'],
+            ingredients=options['ingredients'],
+            rng=rng
+        )
+
+        base = Recipe.objects.filter(user=user)
+        cases = (
+            ('tags any', f'tags={tag_ids[0]},{tag_ids[1]}'),
+            ('tags all', f'tags={tag_ids[0]},{tag_ids[1]}&match=all'),
+            ('tags+ingredients all',
+             f'tags={tag_ids[0]}&ingredients={ingredient_ids[0]},'
+             f'{ingredient_ids[1]}&match=all'),
+        )
+        for name, query in cases:
+            queryset = filter_recipes(base, QueryDict(query))
+            # first page of ids, as the paginated list would fetch
+            page = queryset.order_by('-id').values_list('id', flat=True)
+
+            timings = time_ms(lambda: list(page[:25]), options['repeat'])
+
+            self.stdout.write(
+                f'recipes={scale:<8} {name:<22} '
+                f'median={statistics.median(timings):7.2f}ms '
+                f'max={max(timings):7.2f}ms'
+            )
@@ -0,0 +1,81 @@
+import random
+import statistics
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+
+from rest_framework.renderers import JSONRenderer
+
+from core.models import Tag, Ingredient, Recipe
+
+from recipe import serializers
+from recipe.management.benchmark import rolled_back, seed_library, time_ms
+
+
+class Command(BaseCommand):
+    """Django command to compare the DRF and values() list serializers
+
+    Seeds a throwaway user, renders the same list to JSON through both
+    paths, checks the bytes are identical and reports the timings. All
+    data is rolled back afterwards.
+    """
+
+    help = 'Benchmark the fast list serializers against the DRF ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            self.run(options)
+
+    def run(self, options):
+        rows = options['rows']
+        user, _, _, _ = seed_library(
+            'benchmark-serializers@example.com',
+            recipes=rows,
+            tags=rows,
+            ingredients=rows,
+            rng=random.Random(options['seed'])
+        )
+
+        recipes = Recipe.objects.filter(user=user).order_by('-id')
+        cases = (
+            ('tags', Tag.objects.filter(user=user).order_by('-name'),
+             serializers.TagSerializer, serializers.TagValuesSerializer),
+            ('ingredients',
+             Ingredient.objects.filter(user=user).order_by('-name'),
+             serializers.IngredientSerializer,
+             serializers.IngredientValuesSerializer),
+            ('recipes', recipes.prefetch_related(
+                Prefetch('tags', queryset=Tag.objects.order_by('id')),
+                Prefetch('ingredients',
+                         queryset=Ingredient.objects.order_by('id')),
+            ), serializers.RecipeSerializer,
+                serializers.RecipeValuesSerializer),
+        )
+
+        renderer = JSONRenderer()
+        for name, queryset, serializer_class, values_class in cases:
+            def drf():
+                data = serializer_class(queryset.all(), many=True).data
+                return renderer.render(data)
+
+            def fast():
+                values_serializer = values_class()
+                rows = values_serializer.get_queryset(queryset.all())
+                return renderer.render(
+                    values_serializer.to_representation(rows)
+                )
+
+            if drf() != fast():
+                raise CommandError(f'{name}: rendered JSON differs')
+
+            drf_ms = statistics.median(time_ms(drf, options['repeat']))
+            fast_ms = statistics.median(time_ms(fast, options['repeat']))
+            self.stdout.write(
+                f'{name:<12} rows={rows} drf={drf_ms:8.1f}ms '
+                f'values={fast_ms:8.1f}ms speedup={drf_ms / fast_ms:4.1f}x'
+            )
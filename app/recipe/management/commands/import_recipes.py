@@ -0,0 +1,78 @@
+import json
+import os
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe.importer import FORMATS, RecipeImporter, format_for_name
+
+
+class Command(BaseCommand):
+    """Django command to import recipes from an NDJSON or CSV file
+
+    Takes the files written by the export endpoint. Progress is printed
+    after every batch. With --checkpoint the number of records dealt with
+    is saved after every committed batch and a rerun with the same file
+    resumes from there.
+    """
+
+    help = 'Import recipes into a user library from NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='file to import, - for stdin')
+        parser.add_argument('--user', required=True,
+                            help='email of the user to import for')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='defaults to the file extension or ndjson')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--skip', type=int, default=0,
+                            help='number of records to skip')
+        parser.add_argument('--checkpoint',
+                            help='file to resume from and save progress to')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(email=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user with email {options['user']}")
+
+        skip = options['skip']
+        checkpoint = options['checkpoint']
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as checkpoint_file:
+                skip = json.load(checkpoint_file)['checkpoint']
+            self.stdout.write(f'Resuming after record {skip}')
+
+        path = options['path']
+        file_format = options['format'] or format_for_name(path)
+
+        def on_batch(stats):
+            if checkpoint:
+                save_checkpoint(checkpoint, stats.checkpoint)
+            self.stdout.write(
+                f'{stats.checkpoint} records, {stats.imported} imported, '
+                f'{stats.skipped} skipped, {stats.rate:.0f} recipes/s'
+            )
+
+        importer = RecipeImporter(user, batch_size=options['batch_size'])
+        if path == '-':
+            stats = importer.run(sys.stdin, file_format, skip, on_batch)
+        else:
+            with open(path, encoding='utf-8', newline='') as stream:
+                stats = importer.run(stream, file_format, skip, on_batch)
+
+        for error in stats.errors:
+            self.stderr.write(f"Record {error['record']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {stats.imported} recipes in {stats.elapsed:.1f}s '
+            f'({stats.rate:.0f}/s), skipped {stats.skipped}'
+        ))
+
+
+def save_checkpoint(path, checkpoint):
+    """Atomically replace the checkpoint file"""
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as checkpoint_file:
+        json.dump({'checkpoint': checkpoint}, checkpoint_file)
+    os.replace(temporary, path)
@@ -0,0 +1,268 @@
+"""Drive the API over HTTP with concurrent clients, for benchmark_load
+
+Each client is a thread with its own HTTP connection, logged in as one
+of the seeded users. It picks operations at random by weight and records
+the latency of every request against the operation's name.
+"""
+import http.client
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from io import BytesIO
+
+from django.core.servers.basehttp import ThreadedWSGIServer
+from django.db import connections
+from django.test.testcases import QuietWSGIRequestHandler
+
+from PIL import Image
+
+
+TOKEN_URL = '/api/user/token/'
+RECIPES_URL = '/api/recipe/recipes/'
+
+PERCENTILES = (50, 95, 99)
+
+
+class LoadServer(ThreadedWSGIServer):
+    """Threaded WSGI server closing each thread's database connections
+
+    Every connection is handled by a thread of its own, whose database
+    connections would otherwise only be closed by the garbage collector.
+    """
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            connections.close_all()
+
+
+def start_server(application, host='127.0.0.1', port=0):
+    """Serve application from a background thread, returning the server"""
+    server = LoadServer((host, port), QuietWSGIRequestHandler)
+    server.set_app(application)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def sample_image(seed, width=640, height=480):
+    """Return the bytes of a JPEG, noisy so it does not compress away"""
+    image = Image.frombytes(
+        'RGB', (width, height), random.Random(seed).getrandbits(
+            width * height * 24
+        ).to_bytes(width * height * 3, 'little')
+    )
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def percentile(sorted_values, p):
+    """Return the nearest-rank p-th percentile of sorted values"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Results:
+    """Latencies and errors per operation, shared by the clients"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # {operation: [latency in ms]}
+        self.latencies = {}
+        self.errors = {}
+        self.statuses = {}
+
+    def record(self, operation, latency_ms, status):
+        with self._lock:
+            self.latencies.setdefault(operation, []).append(latency_ms)
+            statuses = self.statuses.setdefault(operation, {})
+            statuses[status] = statuses.get(status, 0) + 1
+            if not isinstance(status, int) or status >= 400:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    def summary(self, seconds):
+        """Return the throughput and latency percentiles per operation"""
+        def summarize(latencies, errors, statuses=None):
+            latencies = sorted(latencies)
+            summary = {
+                'requests': len(latencies),
+                'errors': errors,
+                'throughput_rps': round(len(latencies) / seconds, 2),
+                'mean_ms': round(sum(latencies) / len(latencies), 2)
+                if latencies else None,
+                'max_ms': round(latencies[-1], 2) if latencies else None,
+            }
+            for p in PERCENTILES:
+                value = percentile(latencies, p)
+                summary[f'p{p}_ms'] = \
+                    None if value is None else round(value, 2)
+            if statuses is not None:
+                summary['statuses'] = {
+                    str(status): count for status, count in statuses.items()
+                }
+            return summary
+
+        with self._lock:
+            operations = {
+                operation: summarize(
+                    latencies, self.errors.get(operation, 0),
+                    self.statuses[operation]
+                )
+                for operation, latencies in sorted(self.latencies.items())
+            }
+            total = summarize(
+                [value for values in self.latencies.values()
+                 for value in values],
+                sum(self.errors.values())
+            )
+        return {'total': total, 'endpoints': operations}
+
+
+class Client:
+    """One simulated API user, see the module docs"""
+
+    def __init__(self, host, port, account, images, page_size, rng):
+        self.connection = http.client.HTTPConnection(host, port, timeout=60)
+        self.account = account
+        # uploads are stored by content hash, so only new ones cost resizing
+        self.images = images
+        self.page_size = page_size
+        self.rng = rng
+        self.token = None
+
+    def request(self, method, url, body=None, content_type=None,
+                auth=True):
+        """Return (status, parsed JSON body or None)"""
+        headers = {}
+        if auth:
+            headers['Authorization'] = f'Token {self.token}'
+        if content_type is not None:
+            headers['Content-Type'] = content_type
+        elif body is not None:
+            headers['Content-Type'] = 'application/json'
+            body = json.dumps(body)
+
+        try:
+            self.connection.request(method, url, body, headers)
+            response = self.connection.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException):
+            # reconnect for the next request
+            self.connection.close()
+            raise
+
+        data = None
+        if content and response.getheader('Content-Type', '').startswith(
+                'application/json'):
+            data = json.loads(content)
+        return response.status, data
+
+    def login(self):
+        status, data = self.request('POST', TOKEN_URL, {
+            'email': self.account['email'],
+            'password': self.account['password'],
+        }, auth=False)
+        if status == 200:
+            self.token = data['token']
+        return status
+
+    def list(self):
+        url = RECIPES_URL
+        if self.page_size:
+            url += f'?page_size={self.page_size}'
+        return self.request('GET', url)[0]
+
+    def detail(self):
+        recipe_id = self.rng.choice(self.account['recipe_ids'])
+        return self.request('GET', f'{RECIPES_URL}{recipe_id}/')[0]
+
+    def create(self):
+        status, data = self.request('POST', RECIPES_URL, {
+            'title': f'Load test {uuid.uuid4().hex[:8]}',
+            'time_minutes': self.rng.randint(5, 120),
+            'price': '9.99',
+            'tags': self.sample(self.account['tag_ids']),
+            'ingredients': self.sample(self.account['ingredient_ids']),
+        })
+        if status == 201:
+            self.account['recipe_ids'].append(data['id'])
+        return status
+
+    def patch(self):
+        recipe_id = self.rng.choice(self.account['recipe_ids'])
+        return self.request('PATCH', f'{RECIPES_URL}{recipe_id}/', {
+            'title': f'Patched {uuid.uuid4().hex[:8]}',
+            'tags': self.sample(self.account['tag_ids']),
+        })[0]
+
+    def upload(self):
+        recipe_id = self.rng.choice(self.account['recipe_ids'])
+        boundary = uuid.uuid4().hex
+        body = b''.join((
+            f'--{boundary}\r\n'.encode(),
+            b'Content-Disposition: form-data; name="image"; '
+            b'filename="load.jpg"\r\n',
+            b'Content-Type: image/jpeg\r\n\r\n',
+            self.rng.choice(self.images),
+            f'\r\n--{boundary}--\r\n'.encode(),
+        ))
+        return self.request(
+            'POST', f'{RECIPES_URL}{recipe_id}/upload-image/', body,
+            content_type=f'multipart/form-data; boundary={boundary}'
+        )[0]
+
+    def sample(self, ids):
+        return self.rng.sample(ids, min(len(ids), self.rng.randint(1, 3)))
+
+
+OPERATIONS = ('list', 'detail', 'create', 'patch', 'login', 'upload')
+
+
+def run_client(client, mix, deadline, results, measure_from):
+    """Run weighted random operations until deadline (time.monotonic)"""
+    operations, weights = zip(*mix.items())
+    while True:
+        operation = client.rng.choices(operations, weights)[0]
+        start = time.monotonic()
+        if start >= deadline:
+            return
+        try:
+            status = getattr(client, operation)()
+        except (OSError, http.client.HTTPException) as exc:
+            status = type(exc).__name__
+        # requests started during the warm up are not recorded
+        if start >= measure_from:
+            results.record(
+                operation, (time.monotonic() - start) * 1000, status
+            )
+
+
+def run_load(clients, mix, duration, warmup=0):
+    """Run every client in a thread of its own
+
+    Returns the Results and the seconds they were measured over.
+    """
+    results = Results()
+    started = time.monotonic()
+    measure_from = started + warmup
+    deadline = measure_from + duration
+    threads = [
+        threading.Thread(
+            target=run_client,
+            args=(client, mix, deadline, results, measure_from)
+        )
+        for client in clients
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results, time.monotonic() - measure_from
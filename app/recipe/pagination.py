@@ -0,0 +1,58 @@
+from rest_framework.pagination import CursorPagination
+
+
+class OptInCursorPagination(CursorPagination):
+    """Keyset pagination that is only used when the client asks for it
+
+    Requests without a `cursor` or `page_size` parameter get the full,
+    unpaginated list so that existing clients keep working. Paginated
+    requests seek to the cursor position with a range filter on the first
+    ordering column instead of an OFFSET into the whole list, so a deep
+    page costs the same as the first one. Rows sharing the cursor's value
+    of that column are skipped with an offset, which stays small as long
+    as the column has few duplicates.
+    """
+
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def is_requested(self, request):
+        """Return True if the client opted in to pagination"""
+        params = request.query_params
+        return (
+            self.cursor_query_param in params or
+            self.page_size_query_param in params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+
+        return super().paginate_queryset(queryset, request, view)
+
+
+class NameCursorPagination(OptInCursorPagination):
+    """Paginate user owned recipe attributes by reverse name"""
+
+    # the cursor seeks on name alone, which is exact as a user's names are
+    # unique (migration 0012); id keeps the order total regardless
+    ordering = ('-name', 'id')
+
+
+class TagPagination(NameCursorPagination):
+    page_size = 100
+    max_page_size = 500
+
+
+class IngredientPagination(NameCursorPagination):
+    page_size = 100
+    max_page_size = 500
+
+
+class RecipePagination(OptInCursorPagination):
+    """Paginate recipes newest first"""
+
+    ordering = ('-id',)
+    page_size = 25
+    max_page_size = 100
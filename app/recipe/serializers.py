@@ -1,9 +1,159 @@
+from collections.abc import Mapping
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils.translation import gettext_lazy as _
+
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
 
 from core.models import Tag, Ingredient, Recipe
+from core.bulk import insert_recipes
+
+from recipe import images
+
+
+def context_user(context):
+    """Return the user a serializer works for, or None
+
+    Taken from the `user` context key if set, otherwise from the request.
+    """
+    user = context.get('user')
+    request = context.get('request')
+    if user is None and request is not None:
+        user = request.user
+    if user is None or not user.is_authenticated:
+        return None
+
+    return user
+
+
+class BatchManyRelatedField(serializers.ManyRelatedField):
+    """Many related field that looks up all submitted pks in one query
+
+    The stock field resolves every pk with a query of its own. Here the
+    pks are checked up front and fetched together, and every pk that does
+    not resolve is reported in a single error.
+    """
+
+    default_error_messages = {
+        'does_not_exist': _('Invalid pks {pk_values} - objects do not exist.'),
+    }
+
+    def to_pks(self, data):
+        """Convert the submitted values to pks, in order and deduplicated"""
+        pk_field = self.child_relation.get_queryset().model._meta.pk
+
+        pks = []
+        for item in data:
+            if isinstance(item, bool):
+                self.child_relation.fail(
+                    'incorrect_type', data_type=type(item).__name__
+                )
+            try:
+                pks.append(pk_field.to_python(item))
+            except (DjangoValidationError, TypeError, ValueError):
+                self.child_relation.fail(
+                    'incorrect_type', data_type=type(item).__name__
+                )
+
+        return list(dict.fromkeys(pks))
+
+    def get_objects(self, pks):
+        """Return {pk: object} for those pks that resolve
+
+        Uses the objects RecipeListSerializer resolved for all items when
+        validating a list, otherwise runs a query.
+        """
+        resolved = self.context.get('related_objects', {}).get(
+            self.field_name
+        )
+        if resolved is not None:
+            return {pk: resolved[pk] for pk in pks if pk in resolved}
+
+        return self.child_relation.get_queryset().in_bulk(pks)
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        pks = self.to_pks(data)
+        objects = self.get_objects(pks)
+        missing = [pk for pk in pks if pk not in objects]
+        if missing:
+            self.fail('does_not_exist', pk_values=missing)
+
+        return [objects[pk] for pk in pks]
+
+
+class UserPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Primary key field limited to objects of the requesting user
+
+    Without a user (see context_user) no object is accepted.
+    """
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BatchManyRelatedField(**list_kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+
+        user = context_user(self.context)
+        if user is None:
+            return queryset.none()
+
+        return queryset.filter(user=user)
+
 
+class UniqueNameMixin:
+    """Reject names the user already has, ignoring case
 
-class TagSerializer(serializers.ModelSerializer):
+    The database enforces the same rule, this only turns it into a
+    validation error in the common case.
+    """
+
+    def validate_name(self, value):
+        user = context_user(self.context)
+        if user is None:
+            return value
+
+        existing = self.Meta.model.objects.filter_names(user, [value])
+        if self.instance is not None:
+            existing = existing.exclude(pk=self.instance.pk)
+        if existing.exists():
+            raise serializers.ValidationError(
+                _('You already have one with this name.')
+            )
+
+        return value
+
+
+class NameListSerializer(serializers.Serializer):
+    """Validate the names posted to the tag/ingredient bulk action"""
+
+    names = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        allow_empty=False
+    )
+
+    def validate_names(self, value):
+        max_names = settings.RECIPE_ATTR_BULK_MAX_NAMES
+        if len(value) > max_names:
+            raise serializers.ValidationError(
+                _('Expected at most %d names.') % max_names
+            )
+
+        return value
+
+
+class TagSerializer(UniqueNameMixin, serializers.ModelSerializer):
     """Serializer for tag objects"""
 
     class Meta:
@@ -12,7 +162,7 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
         
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(UniqueNameMixin, serializers.ModelSerializer):
     """Serializer for ingredient objects"""
 
     class Meta:
@@ -21,15 +171,67 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
+class RecipeListSerializer(serializers.ListSerializer):
+    """Validate and create many recipes at once
+
+    The related pks of all items are resolved up front with one query per
+    relation and everything is inserted in batch by core.bulk.
+    """
+
+    def get_relation_fields(self):
+        return {
+            name: field for name, field in self.child.fields.items()
+            if isinstance(field, BatchManyRelatedField) and not field.read_only
+        }
+
+    def resolve_related(self, data):
+        """Return {field name: {pk: object}} for the pks of every item"""
+        resolved = {}
+        for name, field in self.get_relation_fields().items():
+            pks = set()
+            for item in data:
+                values = item.get(name) if isinstance(item, Mapping) else None
+                if isinstance(values, list):
+                    try:
+                        pks.update(field.to_pks(values))
+                    except serializers.ValidationError:
+                        # reported against the item during validation
+                        continue
+
+            queryset = field.child_relation.get_queryset()
+            resolved[name] = queryset.in_bulk(pks) if pks else {}
+
+        return resolved
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.context['related_objects'] = self.resolve_related(data)
+
+        return super().to_internal_value(data)
+
+    def create(self, validated_data):
+        relations = list(self.get_relation_fields())
+        related = [
+            {name: [obj.pk for obj in attrs.pop(name, [])]
+             for name in relations}
+            for attrs in validated_data
+        ]
+        model = self.child.Meta.model
+
+        return insert_recipes(
+            [model(**attrs) for attrs in validated_data], related
+        )
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """Serializer for ingredient objects"""
 
     # https://www.django-rest-framework.org/api-guide/relations/#primarykeyrelatedfield
-    ingredients = serializers.PrimaryKeyRelatedField(
+    ingredients = UserPrimaryKeyRelatedField(
         many=True,
         queryset=Ingredient.objects.all()
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = UserPrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all()
     )
@@ -40,11 +242,245 @@ class RecipeSerializer(serializers.ModelSerializer):
                   'time_minutes', 'price', 'link'
                   )
         read_only_fields = ('id',)
+        list_serializer_class = RecipeListSerializer
+
+    # nested serializers that ?expand= swaps in for the lists of pks
+    expandable_fields = {
+        'ingredients': IngredientSerializer,
+        'tags': TagSerializer,
+    }
+
+    def __init__(self, *args, **kwargs):
+        """Optionally trim the output to `fields` and inline `expand`"""
+        fields = kwargs.pop('fields', None)
+        expand = kwargs.pop('expand', ())
+        super().__init__(*args, **kwargs)
+
+        for field_name in expand:
+            self.fields[field_name] = self.expandable_fields[field_name](
+                many=True,
+                read_only=True
+            )
+
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
 
+class RecipeImageFieldsMixin(serializers.Serializer):
+    """Render the ready image variants of a recipe as {name: url}"""
 
-class RecipeDetailSerializer(RecipeSerializer):
+    image_variants = serializers.SerializerMethodField()
+
+    def get_image_variants(self, recipe):
+        return images.variant_urls(recipe, self.context.get('request'))
+
+
+class RecipeDetailSerializer(RecipeImageFieldsMixin, RecipeSerializer):
     """Serialise a recipe detail"""
 
     # django allows us to nest serializers
     ingredients = IngredientSerializer(many=True, read_only=True)
     tags = TagSerializer(many=True, read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + (
+            'image', 'image_status', 'image_variants'
+        )
+        read_only_fields = ('id', 'image', 'image_status')
+
+
+class RecipeImageSerializer(RecipeImageFieldsMixin,
+                            serializers.ModelSerializer):
+    """Serializer for uploading images to recipes"""
+
+    class Meta:
+        model = Recipe
+        fields = ('id', 'image', 'image_status', 'image_variants')
+        read_only_fields = ('id', 'image_status')
+        extra_kwargs = {'image': {'required': True, 'allow_null': False}}
+
+
+class RecipeImportSerializer(serializers.ModelSerializer):
+    """Validate one record of a recipe import
+
+    Tags and ingredients are given by name rather than pk, so an export
+    can be imported into any account. Only used to validate; the importer
+    inserts the records in batch.
+    """
+
+    ingredients = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        default=list
+    )
+    tags = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        default=list
+    )
+
+    class Meta:
+        model = Recipe
+        fields = ('title', 'ingredients', 'tags',
+                  'time_minutes', 'price', 'link')
+
+
+# Field types whose to_representation is a no-op for the values the database
+# driver already returns (str and int), so the fast path can skip the call
+PASSTHROUGH_FIELDS = (serializers.CharField, serializers.IntegerField)
+
+
+def field_converter(field):
+    """Return the function that renders a raw column value for a field"""
+    if type(field) in PASSTHROUGH_FIELDS:
+        return None
+
+    return field.to_representation
+
+
+class ValuesListSerializer:
+    """Read only fast path for rendering lists with a ModelSerializer
+
+    Builds the same data as `serializer_class(rows, many=True).data` from
+    .values() rows, and loads many-to-many fields with one query per
+    relation on the through table. No model or serializer instance is
+    created per row, which is where DRF spends most of its time on long
+    lists. Many-to-many pks and nested objects are ordered by id.
+
+    Keyword arguments are passed on to serializer_class, which is only
+    used to work out the fields to render.
+    """
+
+    serializer_class = None
+
+    def __init__(self, **kwargs):
+        serializer = self.serializer_class(**kwargs)
+        self.model = serializer.Meta.model
+        self.pk_name = self.model._meta.pk.attname
+
+        # (field name, column, converter, relation) in output order
+        self.plan = []
+        for field in serializer.fields.values():
+            if field.write_only:
+                continue
+
+            if isinstance(field, serializers.ManyRelatedField):
+                relation = self.get_relation(field.source)
+                self.plan.append((field.field_name, None, None, relation))
+            elif isinstance(field, serializers.ListSerializer):
+                relation = self.get_relation(field.source, field.child)
+                self.plan.append((field.field_name, None, None, relation))
+            else:
+                self.plan.append((
+                    field.field_name,
+                    field.source,
+                    field_converter(field),
+                    None
+                ))
+
+    def get_relation(self, source, child=None):
+        """Describe how to load a many-to-many field from its through table
+
+        Without a child serializer the relation renders a list of pks,
+        otherwise a list of objects with the child serializer's fields.
+        """
+        model_field = self.model._meta.get_field(source)
+        through = model_field.remote_field.through
+        source_column = through._meta.get_field(
+            model_field.m2m_field_name()
+        ).attname
+        target = model_field.m2m_reverse_field_name()
+        target_column = through._meta.get_field(target).attname
+
+        child_fields = []
+        if child is not None:
+            child_fields = [
+                (field.field_name, f'{target}__{field.source}',
+                 field_converter(field))
+                for field in child.fields.values() if not field.write_only
+            ]
+
+        return {
+            'through': through,
+            'source_column': source_column,
+            'target_column': target_column,
+            'child_fields': child_fields,
+        }
+
+    def get_queryset(self, queryset):
+        """Turn a model queryset into one returning the needed columns"""
+        columns = {self.pk_name}
+        columns.update(column for _, column, _, _ in self.plan if column)
+
+        return queryset.prefetch_related(None).values(*columns)
+
+    def load_relation(self, relation, pks):
+        """Return {pk: [rendered related values]} for the given rows"""
+        lookups = [relation['source_column']]
+        if relation['child_fields']:
+            lookups.extend(column for _, column, _ in relation['child_fields'])
+        else:
+            lookups.append(relation['target_column'])
+
+        links = relation['through'].objects.filter(
+            **{f"{relation['source_column']}__in": pks}
+        ).order_by(relation['target_column']).values_list(*lookups)
+
+        related = {}
+        if relation['child_fields']:
+            fields = relation['child_fields']
+            for pk, *values in links:
+                related.setdefault(pk, []).append({
+                    name: value if convert is None or value is None
+                    else convert(value)
+                    for (name, _, convert), value in zip(fields, values)
+                })
+        else:
+            for pk, target_pk in links:
+                related.setdefault(pk, []).append(target_pk)
+
+        return related
+
+    def to_representation(self, rows):
+        """Render a list of .values() rows"""
+        rows = list(rows)
+        relations = {}
+        if rows:
+            pks = [row[self.pk_name] for row in rows]
+            relations = {
+                name: self.load_relation(relation, pks)
+                for name, _, _, relation in self.plan if relation
+            }
+
+        data = []
+        for row in rows:
+            item = {}
+            for name, column, convert, relation in self.plan:
+                if relation is not None:
+                    item[name] = relations[name].get(row[self.pk_name], [])
+                    continue
+
+                value = row[column]
+                if convert is not None and value is not None:
+                    value = convert(value)
+                item[name] = value
+            data.append(item)
+
+        return data
+
+
+class TagValuesSerializer(ValuesListSerializer):
+    """Fast read only list rendering for TagSerializer"""
+
+    serializer_class = TagSerializer
+
+
+class IngredientValuesSerializer(ValuesListSerializer):
+    """Fast read only list rendering for IngredientSerializer"""
+
+    serializer_class = IngredientSerializer
+
+
+class RecipeValuesSerializer(ValuesListSerializer):
+    """Fast read only list rendering for RecipeSerializer"""
+
+    serializer_class = RecipeSerializer
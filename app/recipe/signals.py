@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from core.models import Recipe
+from core.signals import user_data_changed
+
+from recipe import images
+from recipe.cache import bump_data_version
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_created(sender, instance, created, **kwargs):
+    """Start new users on a fresh data version
+
+    Protects against cached responses outliving a deleted user whose id is
+    later reused, which some databases do.
+    """
+    if created:
+        bump_data_version(instance.pk)
+
+
+@receiver(user_data_changed)
+def invalidate_cached_responses(sender, user_ids, using=DEFAULT_DB_ALIAS,
+                                **kwargs):
+    """Invalidate the cached responses of users whose data changed
+
+    Inside a transaction the versions are bumped again once it commits:
+    until then other requests read the old rows, and may cache them under
+    the version bumped now.
+    """
+    def bump():
+        for user_id in user_ids:
+            bump_data_version(user_id)
+
+    bump()
+    if transaction.get_connection(using).in_atomic_block:
+        transaction.on_commit(bump, using=using)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_image_orphaned(sender, instance, using, **kwargs):
+    """Delete the image of a deleted recipe if nothing else uses it"""
+    if instance.image:
+        images.schedule_collect(using)
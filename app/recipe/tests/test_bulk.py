@@ -0,0 +1,202 @@
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models.signals import post_save
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.bulk import insert_recipes
+from core.models import Tag, Ingredient, Recipe
+
+from recipe.serializers import RecipeSerializer
+
+
+RECIPE_URL = reverse('recipe:recipe-list')
+BULK_URL = reverse('recipe:recipe-bulk-create')
+
+
+class RecipeBulkCreateTests(TestCase):
+    """Test creating many recipes in one request"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@email.com',
+            'testPW'
+        )
+        self.client.force_authenticate(self.user)
+
+        self.tags = [
+            Tag.objects.create(user=self.user, name=f'Tag {i}')
+            for i in range(3)
+        ]
+        self.ingredients = [
+            Ingredient.objects.create(user=self.user, name=f'Ing {i}')
+            for i in range(3)
+        ]
+
+    def payload(self, count):
+        return [
+            {
+                'title': f'Recipe {i}',
+                'time_minutes': 10 + i,
+                'price': '5.00',
+                'tags': [tag.id for tag in self.tags[:i % 3 + 1]],
+                'ingredients': [self.ingredients[i % 3].id],
+            }
+            for i in range(count)
+        ]
+
+    def test_bulk_create(self):
+        """Test every recipe is created with its tags and ingredients"""
+        response = self.client.post(BULK_URL, self.payload(4), format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 4)
+
+        recipes = Recipe.objects.filter(user=self.user).order_by('id')
+        serializer = RecipeSerializer(recipes, many=True)
+        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(
+            [recipe['tags'] for recipe in response.data],
+            [[tag.id for tag in self.tags[:i % 3 + 1]] for i in range(4)]
+        )
+
+    def test_bulk_create_queries_do_not_scale(self):
+        """Test the number of queries does not grow with the items"""
+        def create(count):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post(
+                    BULK_URL, self.payload(count), format='json'
+                )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            return len(context.captured_queries)
+
+        self.assertEqual(create(2), create(20))
+
+    def test_bulk_create_sends_no_row_signals(self):
+        """Test recipes are inserted in bulk on every backend"""
+        saved = []
+
+        def receiver(sender, **kwargs):
+            saved.append(kwargs['instance'])
+
+        post_save.connect(receiver, sender=Recipe)
+        self.addCleanup(post_save.disconnect, receiver, sender=Recipe)
+
+        response = self.client.post(BULK_URL, self.payload(3), format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(saved, [])
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data],
+            list(Recipe.objects.order_by('id').values_list('id', flat=True))
+        )
+
+    def test_insert_many_recipes(self):
+        """Test pks and links are right across several INSERTs"""
+        Recipe.objects.create(
+            user=self.user, title='Deleted', time_minutes=1, price=1
+        ).delete()
+        recipes = [
+            Recipe(user=self.user, title=f'Recipe {i}', time_minutes=i,
+                   price=1)
+            for i in range(250)
+        ]
+        related = [{'tags': [self.tags[i % 3].id]} for i in range(250)]
+
+        insert_recipes(recipes, related)
+
+        for i, recipe in enumerate(recipes):
+            stored = Recipe.objects.get(pk=recipe.pk)
+            self.assertEqual(stored.time_minutes, i)
+            self.assertEqual(
+                list(stored.tags.values_list('id', flat=True)),
+                [self.tags[i % 3].id]
+            )
+
+    def test_insert_without_returned_ids(self):
+        """Test other databases that cannot return ids save row by row"""
+        recipes = [
+            Recipe(user=self.user, title=f'Recipe {i}', time_minutes=i,
+                   price=1)
+            for i in range(3)
+        ]
+        related = [{'tags': [self.tags[i].id]} for i in range(3)]
+
+        with patch.object(connection, 'vendor', 'other'), \
+                patch.object(connection.features,
+                             'can_return_ids_from_bulk_insert', False), \
+                CaptureQueriesContext(connection) as context:
+            insert_recipes(recipes, related)
+
+        self.assertFalse(any(
+            'last_insert_rowid' in query['sql']
+            for query in context.captured_queries
+        ))
+        for i, recipe in enumerate(recipes):
+            self.assertEqual(
+                list(Recipe.objects.get(pk=recipe.pk).tags.all()),
+                [self.tags[i]]
+            )
+
+    def test_invalid_item_creates_nothing(self):
+        """Test errors are reported per item and nothing is created"""
+        other = get_user_model().objects.create_user(
+            'other@email.com',
+            'testPW'
+        )
+        other_tag = Tag.objects.create(user=other, name='Private')
+        payload = self.payload(3)
+        payload[1]['tags'] = [other_tag.id]
+        del payload[2]['title']
+
+        response = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('tags', response.data[1])
+        self.assertIn('title', response.data[2])
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_create_not_a_list(self):
+        """Test the payload must be a non empty list"""
+        for payload in ({'title': 'Curry'}, []):
+            response = self.client.post(BULK_URL, payload, format='json')
+
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST
+            )
+
+    @override_settings(RECIPE_BULK_CREATE_MAX_ITEMS=2)
+    def test_bulk_create_too_many_items(self):
+        """Test the number of items per request is capped"""
+        response = self.client.post(BULK_URL, self.payload(3), format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_create_invalidates_list(self):
+        """Test created recipes show up in a previously cached list"""
+        etag = self.client.get(RECIPE_URL)['ETag']
+
+        self.client.post(BULK_URL, self.payload(2), format='json')
+
+        response = self.client.get(RECIPE_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Requires PostgreSQL')
+    def test_bulk_created_recipes_searchable(self):
+        """Test recipes created in bulk are found by their tag names"""
+        self.client.post(BULK_URL, self.payload(1), format='json')
+
+        response = self.client.get(RECIPE_URL, {'search': 'tag'})
+
+        self.assertEqual(len(response.data), 1)
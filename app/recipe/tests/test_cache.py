@@ -0,0 +1,214 @@
+import hashlib
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe
+
+from recipe import cache
+
+
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredient-list')
+RECIPE_URL = reverse('recipe:recipe-list')
+
+
+def detail_url(recipe_id):
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+class ResponseCacheTests(TestCase):
+    """Test the per-user versioned response cache"""
+
+    def setUp(self):
+        cache.get_cache().clear()
+        cache.stats.reset()
+
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@email.com',
+            'testPW'
+        )
+        self.client.force_authenticate(self.user)
+
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Curry',
+            time_minutes=30,
+            price=5.00
+        )
+
+    def test_repeated_list_served_from_cache(self):
+        """Test a repeated request only looks up the change metadata"""
+        first = self.client.get(RECIPE_URL)
+
+        # the single query is the ETag lookup of ConditionalResponseMixin
+        with self.assertNumQueries(1):
+            second = self.client.get(RECIPE_URL)
+
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(cache.stats.snapshot()['hits'], 1)
+        self.assertEqual(cache.stats.snapshot()['misses'], 1)
+
+    def test_query_strings_cached_separately(self):
+        """Test different query strings get different entries"""
+        self.client.get(RECIPE_URL)
+
+        response = self.client.get(RECIPE_URL, {'fields': 'id'})
+
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(set(response.data[0]), {'id'})
+
+    def test_create_invalidates_list(self):
+        """Test a list is never stale after creating through the API"""
+        self.client.get(TAGS_URL)
+
+        self.client.post(TAGS_URL, {'name': 'Vegan'})
+        response = self.client.get(TAGS_URL)
+
+        self.assertEqual([tag['name'] for tag in response.data], ['Vegan'])
+
+    def test_update_invalidates_detail(self):
+        """Test a detail is never stale after an update"""
+        url = detail_url(self.recipe.id)
+        self.client.get(url)
+
+        self.client.patch(url, {'title': 'Stew'})
+        response = self.client.get(url)
+
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['title'], 'Stew')
+
+    def test_delete_invalidates_list(self):
+        """Test a deleted recipe disappears from the cached list"""
+        self.client.get(RECIPE_URL)
+
+        self.client.delete(detail_url(self.recipe.id))
+        response = self.client.get(RECIPE_URL)
+
+        self.assertEqual(response.data, [])
+
+    def test_m2m_change_invalidates(self):
+        """Test adding tags outside the API invalidates the detail"""
+        url = detail_url(self.recipe.id)
+        self.client.get(url)
+
+        tag = Tag.objects.create(user=self.user, name='Spicy')
+        self.client.get(url)
+        self.recipe.tags.add(tag)
+        response = self.client.get(url)
+
+        self.assertEqual(response.data['tags'][0]['name'], 'Spicy')
+
+    def test_reverse_m2m_clear_invalidates(self):
+        """Test clearing a tag's recipes invalidates the recipe list"""
+        tag = Tag.objects.create(user=self.user, name='Spicy')
+        self.recipe.tags.add(tag)
+        self.client.get(RECIPE_URL)
+
+        tag.recipe_set.clear()
+        response = self.client.get(RECIPE_URL)
+
+        self.assertEqual(response.data[0]['tags'], [])
+
+    def test_rename_invalidates_nested(self):
+        """Test renaming an ingredient invalidates the recipe detail"""
+        ingredient = Ingredient.objects.create(user=self.user, name='Chili')
+        self.recipe.ingredients.add(ingredient)
+        url = detail_url(self.recipe.id)
+        self.client.get(url)
+
+        ingredient.name = 'Chilli'
+        ingredient.save()
+        response = self.client.get(url)
+
+        self.assertEqual(response.data['ingredients'][0]['name'], 'Chilli')
+
+    def test_cache_is_per_user(self):
+        """Test one user's writes and cache entries do not leak"""
+        user_2 = get_user_model().objects.create_user(
+            'other@email.com',
+            'testPW'
+        )
+        client_2 = APIClient()
+        client_2.force_authenticate(user_2)
+        self.client.get(RECIPE_URL)
+
+        response = client_2.get(RECIPE_URL)
+
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data, [])
+
+    def test_errors_not_cached(self):
+        """Test only successful responses are cached"""
+        url = detail_url(self.recipe.id + 1)
+        self.client.get(url)
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(cache.stats.snapshot()['hits'], 0)
+
+    @override_settings(RESPONSE_CACHE_MAX_ENTRY_SIZE=10)
+    def test_large_responses_not_cached(self):
+        """Test responses over the entry size limit are not stored"""
+        self.client.get(RECIPE_URL)
+
+        response = self.client.get(RECIPE_URL)
+
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(cache.stats.snapshot()['too_large'], 2)
+
+    def test_version_eviction_never_serves_stale(self):
+        """Test losing the version key cannot bring back an old response"""
+        self.client.get(RECIPE_URL)
+        cache.get_cache().delete(
+            cache.VERSION_KEY.format(user_id=self.user.pk)
+        )
+
+        response = self.client.get(RECIPE_URL)
+
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+
+class ResponseCacheTransactionTests(TransactionTestCase):
+    """Test the response cache around transactions that commit later"""
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@email.com',
+            'testPW'
+        )
+        self.client.force_authenticate(self.user)
+
+    def response_key(self, url):
+        uri = hashlib.md5(f'http://testserver{url}'.encode()).hexdigest()
+        return cache.RESPONSE_KEY.format(
+            user_id=self.user.pk,
+            version=cache.get_data_version(self.user.pk),
+            uri=uri
+        )
+
+    def test_read_before_commit_not_served(self):
+        """Test a response cached before a write committed is not served"""
+        self.client.get(TAGS_URL)
+        stale = cache.get_cache().get(self.response_key(TAGS_URL))
+
+        with transaction.atomic():
+            Tag.objects.create(user=self.user, name='Vegan')
+            # what a request reading the committed rows meanwhile caches
+            cache.get_cache().set(self.response_key(TAGS_URL), stale)
+
+        response = self.client.get(TAGS_URL)
+
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual([tag['name'] for tag in response.data], ['Vegan'])
@@ -0,0 +1,145 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe
+
+from recipe import cache
+
+
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredient-list')
+RECIPE_URL = reverse('recipe:recipe-list')
+
+
+def detail_url(recipe_id):
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+class ConditionalRequestTests(TestCase):
+    """Test ETag and Last-Modified validation of the recipe endpoints"""
+
+    def setUp(self):
+        cache.get_cache().clear()
+
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@email.com',
+            'testPW'
+        )
+        self.client.force_authenticate(self.user)
+
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Curry',
+            time_minutes=30,
+            price=5.00
+        )
+
+    def assertNotModified(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def assertModified(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_validators_sent(self):
+        """Test responses carry an ETag and a Last-Modified header"""
+        for url in (TAGS_URL, INGREDIENTS_URL, RECIPE_URL,
+                    detail_url(self.recipe.id)):
+            response = self.client.get(url)
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response['ETag'].startswith('"'))
+            self.assertIn('Last-Modified', response)
+
+    def test_if_none_match_not_modified(self):
+        """Test a matching ETag is answered from the metadata alone"""
+        etag = self.client.get(RECIPE_URL)['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(RECIPE_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse(response.content)
+
+    def test_vary(self):
+        """Test shared caches keep representations and users apart"""
+        etag = self.client.get(RECIPE_URL)['ETag']
+
+        for response in (self.client.get(RECIPE_URL),
+                         self.client.get(RECIPE_URL, HTTP_IF_NONE_MATCH=etag)):
+            vary = response['Vary'].split(', ')
+            self.assertIn('Accept', vary)
+            self.assertIn('Authorization', vary)
+
+    def test_etag_per_uri(self):
+        """Test an ETag only validates the resource it was sent for"""
+        etag = self.client.get(RECIPE_URL)['ETag']
+
+        self.assertModified(detail_url(self.recipe.id), etag)
+        self.assertModified(RECIPE_URL + '?fields=id', etag)
+
+    def test_write_changes_etag(self):
+        """Test creating or updating a recipe invalidates the ETag"""
+        etag = self.client.get(RECIPE_URL)['ETag']
+
+        self.client.patch(detail_url(self.recipe.id), {'title': 'Dahl'})
+
+        self.assertModified(RECIPE_URL, etag)
+
+    def test_delete_changes_etag(self):
+        """Test deleting a tag attached to a recipe invalidates the ETag"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.recipe.tags.add(tag)
+        url = detail_url(self.recipe.id)
+        etag = self.client.get(url)['ETag']
+
+        tag.delete()
+
+        self.assertModified(url, etag)
+
+    def test_link_changes_etag(self):
+        """Test attaching an ingredient invalidates the ETag"""
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        etag = self.client.get(RECIPE_URL)['ETag']
+        self.assertNotModified(RECIPE_URL, etag)
+
+        self.recipe.ingredients.add(ingredient)
+
+        self.assertModified(RECIPE_URL, etag)
+
+    def test_other_user_write_keeps_etag(self):
+        """Test another user's writes do not invalidate the ETag"""
+        etag = self.client.get(RECIPE_URL)['ETag']
+        other = get_user_model().objects.create_user(
+            'other@email.com',
+            'testPW'
+        )
+
+        Tag.objects.create(user=other, name='Vegan')
+
+        self.assertNotModified(RECIPE_URL, etag)
+
+    def test_if_modified_since(self):
+        """Test If-Modified-Since is honoured when no ETag is sent"""
+        last_modified = self.client.get(RECIPE_URL)['Last-Modified']
+
+        response = self.client.get(
+            RECIPE_URL, HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_errors_not_validated(self):
+        """Test error responses carry no validators"""
+        response = self.client.get(detail_url(self.recipe.id + 1))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn('ETag', response)
@@ -0,0 +1,115 @@
+import csv
+import io
+import json
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe
+
+from recipe.serializers import RecipeSerializer
+
+
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+class RecipeExportTests(TestCase):
+    """Test streaming a user's recipe library"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@email.com',
+            'testPW'
+        )
+        self.client.force_authenticate(self.user)
+
+    def add_recipes(self, count):
+        for i in range(count):
+            recipe = Recipe.objects.create(
+                user=self.user,
+                title=f'Recipe {i}',
+                time_minutes=10,
+                price=5.00
+            )
+            recipe.tags.add(
+                Tag.objects.create(user=self.user, name=f'Tag {i}')
+            )
+            recipe.ingredients.add(
+                Ingredient.objects.create(user=self.user, name=f'Salt {i}'),
+                Ingredient.objects.create(user=self.user, name=f'Oil {i}')
+            )
+
+    def export(self, **params):
+        response = self.client.get(EXPORT_URL, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_export_ndjson(self):
+        """Test recipes are exported one JSON object per line"""
+        self.add_recipes(3)
+
+        response, content = self.export()
+
+        self.assertEqual(
+            response['Content-Type'], 'application/x-ndjson; charset=utf-8'
+        )
+        recipes = Recipe.objects.order_by('id')
+        expected = json.loads(json.dumps(RecipeSerializer(
+            recipes, many=True, expand=('ingredients', 'tags')
+        ).data))
+        lines = content.splitlines()
+        self.assertEqual([json.loads(line) for line in lines], expected)
+
+    def test_export_csv(self):
+        """Test recipes can be exported as CSV with related names"""
+        self.add_recipes(2)
+
+        response, content = self.export(format='csv')
+
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('recipes.csv', response['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['title'], 'Recipe 0')
+        self.assertEqual(rows[0]['tags'], 'Tag 0')
+        self.assertEqual(rows[1]['ingredients'], 'Salt 1; Oil 1')
+
+    def test_export_limited_to_user(self):
+        """Test only the user's own recipes are exported"""
+        other = get_user_model().objects.create_user(
+            'other@email.com',
+            'testPW'
+        )
+        Recipe.objects.create(
+            user=other, title='Secret', time_minutes=5, price=5.00
+        )
+
+        response, content = self.export()
+
+        self.assertEqual(content, '')
+
+    @override_settings(RECIPE_EXPORT_CHUNK_SIZE=2)
+    def test_export_relations_loaded_per_chunk(self):
+        """Test relations are queried once per chunk, not per recipe"""
+        self.add_recipes(5)
+
+        with CaptureQueriesContext(connection) as context:
+            response, content = self.export()
+
+        self.assertEqual(len(content.splitlines()), 5)
+        # the recipes, then both relations for each of the 3 chunks
+        self.assertEqual(len(context.captured_queries), 1 + 2 * 3)
+
+    def test_export_unknown_format(self):
+        """Test asking for an unsupported format is rejected"""
+        response = self.client.get(EXPORT_URL, {'format': 'xml'})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
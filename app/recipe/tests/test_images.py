@@ -0,0 +1,252 @@
+import tempfile
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from PIL import Image
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, StoredFile, IMAGE_PENDING, IMAGE_READY, \
+                        IMAGE_FAILED
+from core.storage import image_storage
+
+from recipe import images
+
+
+VARIANTS = {'thumbnail': (15, 15), 'medium': (40, 40)}
+
+
+def image_upload_url(recipe_id):
+    return reverse('recipe:recipe-upload-image', args=[recipe_id])
+
+
+def detail_url(recipe_id):
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def sample_recipe(user):
+    return Recipe.objects.create(
+        user=user, title='Curry', time_minutes=30, price=5.00
+    )
+
+
+def jpeg(size=(100, 60), color='black'):
+    image_file = tempfile.NamedTemporaryFile(suffix='.jpg')
+    Image.new('RGB', size, color).save(image_file, format='JPEG')
+    image_file.seek(0)
+    return image_file
+
+
+class ImageFilesMixin:
+    """Remove the images and variants a test stored"""
+
+    def tearDown(self):
+        for name in StoredFile.objects.values_list('name', flat=True):
+            image_storage.delete_with_derived(name)
+
+
+@override_settings(RECIPE_IMAGE_VARIANTS=VARIANTS)
+class GenerateVariantsTests(ImageFilesMixin, TestCase):
+    """Test rendering the variants of a recipe image"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@email.com',
+            'testPW'
+        )
+        self.recipe = sample_recipe(self.user)
+
+    def store_image(self, content):
+        self.recipe.image.save('curry.jpg', ContentFile(content))
+        return self.recipe.image.name
+
+    def test_variants_rendered(self):
+        """Test every variant is written within its bounds"""
+        with jpeg() as image_file:
+            name = self.store_image(image_file.read())
+
+        images.generate_variants(self.recipe.id, name)
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, IMAGE_READY)
+        self.assertEqual(
+            self.recipe.ready_image_variants, ['thumbnail', 'medium']
+        )
+        storage = image_storage
+        with storage.open(images.variant_name(name, 'thumbnail')) as thumb:
+            self.assertEqual(Image.open(thumb).size, (15, 9))
+
+    def test_broken_image_fails(self):
+        """Test an image that cannot be decoded is marked failed"""
+        name = self.store_image(b'not an image')
+
+        with self.assertLogs('recipe.images', 'ERROR'):
+            images.generate_variants(self.recipe.id, name)
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, IMAGE_FAILED)
+        self.assertEqual(self.recipe.ready_image_variants, [])
+
+    def test_replaced_image_not_recorded(self):
+        """Test variants of an image replaced meanwhile are not recorded"""
+        with jpeg() as image_file:
+            name = self.store_image(image_file.read())
+        Recipe.objects.filter(id=self.recipe.id).update(image='other.jpg')
+
+        images.generate_variants(self.recipe.id, name)
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants, '')
+        self.assertEqual(self.recipe.image_status, '')
+
+    def test_existing_variants_reused(self):
+        """Test the variants of an image stored before are not rendered"""
+        with jpeg() as image_file:
+            content = image_file.read()
+        name = self.store_image(content)
+        images.generate_variants(self.recipe.id, name)
+        other = sample_recipe(self.user)
+        other.image.save('other.jpg', ContentFile(content))
+
+        with patch('recipe.images.render_variant') as render_variant:
+            images.generate_variants(other.id, other.image.name)
+
+        render_variant.assert_not_called()
+        other.refresh_from_db()
+        self.assertEqual(other.image_status, IMAGE_READY)
+        self.assertEqual(other.ready_image_variants, ['thumbnail', 'medium'])
+
+
+class ImageUploadTests(ImageFilesMixin, TestCase):
+    """Test the upload-image action"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@email.com',
+            'testPW'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(self.user)
+
+    def upload(self):
+        with jpeg() as image_file:
+            return self.client.post(
+                image_upload_url(self.recipe.id),
+                {'image': image_file},
+                format='multipart'
+            )
+
+    @patch('recipe.images.transaction.on_commit')
+    def test_upload_schedules_variants(self, on_commit):
+        """Test variants are left to run once the upload commits"""
+        response = self.upload()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['image_status'], IMAGE_PENDING)
+        self.assertEqual(response.data['image_variants'], {})
+        # the response cache bumps its versions on commit as well
+        scheduled = [
+            call for call in on_commit.call_args_list
+            if call[0][0].__module__ == images.__name__
+        ]
+        self.assertEqual(len(scheduled), 1)
+
+    @override_settings(RECIPE_IMAGE_WORKERS=2)
+    @patch('recipe.images.get_executor')
+    @patch('recipe.images.transaction.on_commit',
+           lambda func, using=None: func())
+    def test_variants_rendered_by_worker_pool(self, get_executor):
+        """Test the committed upload is handed to the worker pool"""
+        self.upload()
+
+        self.recipe.refresh_from_db()
+        get_executor.return_value.submit.assert_called_once_with(
+            images._run_in_worker, self.recipe.id, self.recipe.image.name,
+            'default'
+        )
+
+    def test_upload_other_users_recipe(self):
+        """Test an image cannot be added to someone else's recipe"""
+        other = get_user_model().objects.create_user(
+            'other@email.com',
+            'testPW'
+        )
+        self.recipe = sample_recipe(other)
+
+        response = self.upload()
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(RECIPE_IMAGE_WORKERS=0, RECIPE_IMAGE_VARIANTS=VARIANTS)
+class ImageUploadCommitTests(ImageFilesMixin, TransactionTestCase):
+    """Test the variants of a committed upload end to end"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@email.com',
+            'testPW'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(self.user)
+
+    def upload(self, color='black'):
+        with jpeg(color=color) as image_file:
+            return self.client.post(
+                image_upload_url(self.recipe.id),
+                {'image': image_file},
+                format='multipart'
+            )
+
+    def test_variants_listed_on_detail(self):
+        """Test the recipe detail links the rendered variants"""
+        self.upload()
+
+        response = self.client.get(detail_url(self.recipe.id))
+
+        self.assertEqual(response.data['image_status'], IMAGE_READY)
+        self.assertEqual(
+            set(response.data['image_variants']), {'thumbnail', 'medium'}
+        )
+        self.assertTrue(
+            response.data['image_variants']['thumbnail'].startswith('http')
+        )
+
+    def test_replacing_image_removes_old_files(self):
+        """Test uploading a new image deletes the previous one"""
+        self.upload()
+        self.recipe.refresh_from_db()
+        old = self.recipe.image.name
+
+        self.upload(color='white')
+
+        self.assertFalse(image_storage.exists(old))
+        self.assertFalse(
+            image_storage.exists(images.variant_name(old, 'medium'))
+        )
+        self.assertFalse(StoredFile.objects.filter(name=old).exists())
+
+    def test_shared_image_kept(self):
+        """Test an image is only deleted with the last recipe using it"""
+        self.upload()
+        first = Recipe.objects.get(id=self.recipe.id)
+        self.recipe = sample_recipe(self.user)
+        self.upload()
+        self.recipe.refresh_from_db()
+        name = self.recipe.image.name
+
+        first.delete()
+
+        self.assertTrue(image_storage.exists(name))
+        self.recipe.delete()
+        self.assertFalse(image_storage.exists(name))
+        self.assertFalse(
+            image_storage.exists(images.variant_name(name, 'thumbnail'))
+        )
@@ -0,0 +1,252 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe
+
+from recipe.importer import RecipeImporter
+
+
+EXPORT_URL = reverse('recipe:recipe-export')
+IMPORT_URL = reverse('recipe:recipe-import')
+
+
+def ndjson(*records):
+    return ''.join(json.dumps(record) + '\n' for record in records)
+
+
+def record(title='Curry', **params):
+    defaults = {
+        'title': title,
+        'time_minutes': 30,
+        'price': '5.00',
+        'tags': ['Spicy'],
+        'ingredients': ['Rice', 'Chili'],
+    }
+    defaults.update(params)
+    return defaults
+
+
+class RecipeImporterTests(TestCase):
+    """Test importing recipe records in batches"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@email.com',
+            'testPW'
+        )
+
+    def run_import(self, content, file_format='ndjson', **kwargs):
+        importer = RecipeImporter(self.user, batch_size=2)
+        return importer.run(StringIO(content), file_format, **kwargs)
+
+    def test_import_ndjson(self):
+        """Test records are imported with their tags and ingredients"""
+        stats = self.run_import(ndjson(
+            record('Curry'),
+            record('Rice bowl', tags=[], ingredients=['rice']),
+            record('Dahl', link='https://example.com/dahl'),
+        ))
+
+        self.assertEqual(stats.imported, 3)
+        self.assertEqual(stats.checkpoint, 3)
+        recipes = Recipe.objects.filter(user=self.user).order_by('id')
+        self.assertEqual(
+            [recipe.title for recipe in recipes],
+            ['Curry', 'Rice bowl', 'Dahl']
+        )
+        self.assertEqual(
+            sorted(recipes[0].ingredients.values_list('name', flat=True)),
+            ['Chili', 'Rice']
+        )
+        self.assertEqual(recipes[2].link, 'https://example.com/dahl')
+
+    def test_names_resolved_once(self):
+        """Test names map onto existing objects, ignoring case"""
+        spicy = Tag.objects.create(user=self.user, name='spicy')
+
+        self.run_import(ndjson(*[record(f'Curry {i}') for i in range(5)]))
+
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(spicy.recipe_set.count(), 5)
+
+    def test_import_csv(self):
+        """Test CSV rows with separated names are imported"""
+        content = (
+            'id,title,time_minutes,price,link,tags,ingredients\r\n'
+            '7,Curry,30,5.00,,Spicy; Quick,Rice\r\n'
+        )
+
+        stats = self.run_import(content, 'csv')
+
+        self.assertEqual(stats.imported, 1)
+        recipe = Recipe.objects.get(user=self.user)
+        self.assertEqual(
+            sorted(recipe.tags.values_list('name', flat=True)),
+            ['Quick', 'Spicy']
+        )
+
+    def test_invalid_records_skipped(self):
+        """Test invalid records are reported and the rest imported"""
+        content = ndjson(record('Curry'), record(price='lots')) + \
+            'not json\n' + ndjson(record('Dahl'))
+
+        stats = self.run_import(content)
+
+        self.assertEqual(stats.imported, 2)
+        self.assertEqual(stats.skipped, 2)
+        self.assertEqual(
+            [error['record'] for error in stats.errors], [2, 3]
+        )
+        self.assertIn('price', stats.errors[0]['errors'])
+
+    def test_resume(self):
+        """Test skipping the checkpoint resumes an import"""
+        content = ndjson(*[record(f'Curry {i}') for i in range(5)])
+
+        stats = self.run_import(content, skip=3)
+
+        self.assertEqual(stats.imported, 2)
+        self.assertEqual(stats.checkpoint, 5)
+        self.assertEqual(
+            sorted(Recipe.objects.values_list('title', flat=True)),
+            ['Curry 3', 'Curry 4']
+        )
+
+
+class ImportRecipesCommandTests(TestCase):
+    """Test the import_recipes management command"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@email.com',
+            'testPW'
+        )
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'recipes.ndjson')
+        with open(self.path, 'w') as import_file:
+            import_file.write(
+                ndjson(*[record(f'Curry {i}') for i in range(3)])
+            )
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_import_command(self):
+        """Test the command imports a file and reports throughput"""
+        out = StringIO()
+
+        call_command('import_recipes', self.path, user='test@email.com',
+                     stdout=out)
+
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 3)
+        self.assertIn('Imported 3 recipes', out.getvalue())
+
+    def test_import_command_checkpoint(self):
+        """Test a saved checkpoint is resumed from"""
+        checkpoint = os.path.join(self.directory.name, 'checkpoint.json')
+        with open(checkpoint, 'w') as checkpoint_file:
+            json.dump({'checkpoint': 2}, checkpoint_file)
+
+        call_command('import_recipes', self.path, user='test@email.com',
+                     checkpoint=checkpoint, stdout=StringIO())
+
+        self.assertEqual(
+            list(Recipe.objects.values_list('title', flat=True)),
+            ['Curry 2']
+        )
+        with open(checkpoint) as checkpoint_file:
+            self.assertEqual(json.load(checkpoint_file), {'checkpoint': 3})
+
+    def test_import_command_unknown_user(self):
+        """Test importing for a missing user fails"""
+        with self.assertRaises(CommandError):
+            call_command('import_recipes', self.path,
+                         user='nobody@email.com', stdout=StringIO())
+
+
+class ImportEndpointTests(TestCase):
+    """Test uploading recipes to the import endpoint"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@email.com',
+            'testPW'
+        )
+        self.client.force_authenticate(self.user)
+
+    def upload(self, name, content, **params):
+        upload = SimpleUploadedFile(name, content.encode())
+        url = IMPORT_URL
+        if params:
+            url += '?' + '&'.join(f'{k}={v}' for k, v in params.items())
+        return self.client.post(url, {'file': upload}, format='multipart')
+
+    def test_upload_import(self):
+        """Test an uploaded file is imported and summarised"""
+        response = self.upload(
+            'recipes.ndjson', ndjson(record('Curry'), record(title=''))
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['imported'], 1)
+        self.assertEqual(response.data['skipped'], 1)
+        self.assertEqual(response.data['checkpoint'], 2)
+        self.assertEqual(response.data['errors'][0]['record'], 2)
+
+    def test_export_round_trip(self):
+        """Test an exported library can be imported again"""
+        recipe = Recipe.objects.create(
+            user=self.user, title='Curry', time_minutes=30, price=5.00
+        )
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Spicy'))
+        exports = {}
+        for file_format in ('ndjson', 'csv'):
+            response = self.client.get(EXPORT_URL, {'format': file_format})
+            exports[file_format] = b''.join(response.streaming_content)
+
+        for file_format, content in exports.items():
+            response = self.upload(f'recipes.{file_format}', content.decode())
+
+            self.assertEqual(response.data['imported'], 1)
+        self.assertEqual(Recipe.objects.count(), 3)
+        self.assertEqual(Tag.objects.count(), 1)
+        self.assertEqual(Tag.objects.get().recipe_set.count(), 3)
+
+    def test_upload_resume(self):
+        """Test ?skip= resumes an import"""
+        response = self.upload(
+            'recipes.ndjson', ndjson(record('Curry'), record('Dahl')), skip=1
+        )
+
+        self.assertEqual(response.data['imported'], 1)
+        self.assertEqual(Recipe.objects.get().title, 'Dahl')
+
+    def test_upload_required(self):
+        """Test a file must be uploaded"""
+        response = self.client.post(IMPORT_URL, {}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_upload_not_utf8(self):
+        """Test a binary file is rejected"""
+        upload = SimpleUploadedFile('recipes.csv', b'\xff\xfe\x00title')
+
+        response = self.client.post(
+            IMPORT_URL, {'file': upload}, format='multipart'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
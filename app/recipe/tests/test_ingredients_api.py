@@ -7,10 +7,13 @@ from rest_framework.test import APIClient
 
 from core.models import Ingredient
 
+from recipe.autocomplete import prefix_cache
 from recipe.serializers import IngredientSerializer
 
 
 INGREDIENTS_URL = reverse('recipe:ingredient-list')
+AUTOCOMPLETE_URL = reverse('recipe:ingredient-autocomplete')
+BULK_URL = reverse('recipe:ingredient-bulk-get-or-create')
 
 
 class PublicIngredientsAPITests(TestCase):
@@ -91,3 +94,58 @@ class PrivateIngredientsAPITests(TestCase):
         response = self.client.post(INGREDIENTS_URL, payload)
 
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_ingredient_duplicate(self):
+        """Test an ingredient name cannot be added twice"""
+        Ingredient.objects.create(user=self.user, name='Lettuce')
+
+        response = self.client.post(INGREDIENTS_URL, {'name': 'lettuce '})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_get_or_create(self):
+        """Test many ingredient names are resolved in one request"""
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+        payload = {'names': ['salt', 'Pepper']}
+
+        response = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0], {'id': salt.id, 'name': 'Salt'})
+        pepper = Ingredient.objects.get(user=self.user, name='Pepper')
+        self.assertEqual(response.data[1], {'id': pepper.id, 'name': 'Pepper'})
+
+
+class IngredientAutocompleteTests(TestCase):
+    """Test the ingredient name autocomplete endpoint"""
+
+    def setUp(self):
+        prefix_cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create(
+            email="test@email.com",
+            password="testPW"
+        )
+
+        self.client.force_authenticate(self.user)
+
+    def test_autocomplete_prefix(self):
+        """Test ingredient names starting with the term are returned"""
+        for name in ['Potato', 'Sweet potato', 'Pepper', 'Tomato']:
+            Ingredient.objects.create(user=self.user, name=name)
+
+        response = self.client.get(AUTOCOMPLETE_URL, {'q': 'p'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [ingredient['name'] for ingredient in response.data],
+            ['Pepper', 'Potato']
+        )
+
+    def test_autocomplete_empty_term(self):
+        """Test an empty term suggests nothing"""
+        Ingredient.objects.create(user=self.user, name='Potato')
+
+        response = self.client.get(AUTOCOMPLETE_URL, {'q': ' '})
+
+        self.assertEqual(response.data, [])
@@ -0,0 +1,168 @@
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+from core.storage import image_storage
+
+from recipe import images
+
+
+CONTENT = b'0123456789' * 10
+
+
+def media_url(name):
+    return reverse('media', args=[name])
+
+
+class RecipeImageServingTests(TestCase):
+    """Test serving recipe images to their owners"""
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.settings = override_settings(MEDIA_ROOT=self.media.name)
+        self.settings.enable()
+
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@email.com',
+            'testPW'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Curry', time_minutes=30, price=5.00
+        )
+        self.recipe.image.save('curry.jpg', ContentFile(CONTENT))
+        self.name = self.recipe.image.name
+
+    def tearDown(self):
+        self.settings.disable()
+        self.media.cleanup()
+
+    def get(self, name=None, **headers):
+        return self.client.get(media_url(name or self.name), **headers)
+
+    def test_serve_image(self):
+        """Test the owner gets the image, cacheable for good"""
+        response = self.get()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), CONTENT)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Content-Length'], str(len(CONTENT)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_serve_variant(self):
+        """Test the variants of an owned image are served"""
+        variant = images.variant_name(self.name, 'thumbnail')
+        image_storage.save_as(variant, ContentFile(b'small'))
+
+        response = self.get(variant)
+
+        self.assertEqual(b''.join(response.streaming_content), b'small')
+
+    def test_legacy_name_revalidated(self):
+        """Test images not named by content are not cached for good"""
+        image_storage.save_as('uploads/recipe/old.jpg', ContentFile(b'old'))
+        Recipe.objects.filter(id=self.recipe.id).update(
+            image='uploads/recipe/old.jpg'
+        )
+
+        response = self.get('uploads/recipe/old.jpg')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_auth_required(self):
+        """Test images are not served to anonymous requests"""
+        response = APIClient().get(media_url(self.name))
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_other_users_image(self):
+        """Test images are not served to other users"""
+        other = get_user_model().objects.create_user(
+            'other@email.com',
+            'testPW'
+        )
+        self.client.force_authenticate(other)
+
+        response = self.get()
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_path_outside_media(self):
+        """Test paths leaving MEDIA_ROOT are rejected"""
+        response = self.get('uploads/../../etc/passwd')
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_range(self):
+        """Test a byte range is answered with partial content"""
+        response = self.get(HTTP_RANGE='bytes=10-19')
+
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), CONTENT[10:20])
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/100')
+
+    def test_suffix_range(self):
+        """Test the last bytes of a file can be asked for"""
+        response = self.get(HTTP_RANGE='bytes=-5')
+
+        self.assertEqual(b''.join(response.streaming_content), CONTENT[-5:])
+        self.assertEqual(response['Content-Range'], 'bytes 95-99/100')
+
+    def test_range_not_satisfiable(self):
+        """Test a range beyond the end of the file is rejected"""
+        response = self.get(HTTP_RANGE='bytes=200-')
+
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        )
+        self.assertEqual(response['Content-Range'], 'bytes */100')
+
+    def test_stale_if_range_sends_whole_file(self):
+        """Test a range is ignored when If-Range does not match"""
+        response = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), CONTENT)
+
+    def test_not_modified(self):
+        """Test a cached copy is revalidated without sending the file"""
+        etag = self.get()['ETag']
+
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @override_settings(MEDIA_SERVE_MODE='x-accel-redirect')
+    def test_x_accel_redirect(self):
+        """Test the transfer can be handed to nginx"""
+        response = self.get()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response['X-Accel-Redirect'], f'/protected-media/{self.name}'
+        )
+        self.assertEqual(response.content, b'')
+        self.assertIn('immutable', response['Cache-Control'])
+
+    @override_settings(MEDIA_SERVE_MODE='x-sendfile')
+    def test_x_sendfile(self):
+        """Test the transfer can be handed to Apache or lighttpd"""
+        response = self.get()
+
+        self.assertEqual(response['X-Sendfile'], self.recipe.image.path)
+        self.assertEqual(response.content, b'')
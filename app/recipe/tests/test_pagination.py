@@ -0,0 +1,107 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe
+
+from recipe.pagination import TagPagination
+
+
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredient-list')
+RECIPE_URL = reverse('recipe:recipe-list')
+
+
+class CursorPaginationTests(TestCase):
+    """Test the opt in keyset pagination on the recipe endpoints"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@email.com',
+            'testPW'
+        )
+        self.client.force_authenticate(self.user)
+
+    def collect_pages(self, url, page_size):
+        """Follow the next links and return every page of results"""
+        pages = []
+        response = self.client.get(url, {'page_size': page_size})
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append(response.data['results'])
+            if not response.data['next']:
+                return pages
+            response = self.client.get(response.data['next'])
+
+    def test_unpaginated_by_default(self):
+        """Test clients that do not opt in still get a plain list"""
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        response = self.client.get(TAGS_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsInstance(response.data, list)
+
+    def test_tags_paginated_by_name_then_id(self):
+        """Test no tag is skipped or repeated across pages"""
+        for name in ['Vegan', 'Dessert', 'Desserts', 'dessert 2', 'Curry']:
+            Tag.objects.create(user=self.user, name=name)
+
+        pages = self.collect_pages(TAGS_URL, page_size=2)
+
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        ids = [tag['id'] for page in pages for tag in page]
+        expected = list(
+            Tag.objects.order_by('-name', 'id').values_list('id', flat=True)
+        )
+        self.assertEqual(ids, expected)
+
+    def test_ingredients_paginated(self):
+        """Test ingredients can be paged through"""
+        for name in ['Salt', 'Pepper', 'Lemon']:
+            Ingredient.objects.create(user=self.user, name=name)
+
+        pages = self.collect_pages(INGREDIENTS_URL, page_size=2)
+
+        names = [ingredient['name'] for page in pages for ingredient in page]
+        self.assertEqual(names, ['Salt', 'Pepper', 'Lemon'])
+
+    def test_recipes_paginated_newest_first(self):
+        """Test recipes are paged through in reverse id order"""
+        for i in range(5):
+            Recipe.objects.create(
+                user=self.user,
+                title=f'Recipe {i}',
+                time_minutes=5,
+                price=5.00
+            )
+
+        pages = self.collect_pages(RECIPE_URL, page_size=2)
+
+        ids = [recipe['id'] for page in pages for recipe in page]
+        expected = list(
+            Recipe.objects.order_by('-id').values_list('id', flat=True)
+        )
+        self.assertEqual(ids, expected)
+
+    def test_page_size_capped(self):
+        """Test the server enforces the maximum page size"""
+        for i in range(3):
+            Tag.objects.create(user=self.user, name=f'Tag {i}')
+
+        with patch.object(TagPagination, 'max_page_size', 2):
+            response = self.client.get(TAGS_URL, {'page_size': 1000})
+
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_invalid_cursor(self):
+        """Test a tampered cursor is rejected"""
+        response = self.client.get(TAGS_URL, {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
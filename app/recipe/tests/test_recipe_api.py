@@ -4,13 +4,17 @@ import os
 from PIL import Image
 
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Prefetch
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
 from core.models import Recipe, Tag, Ingredient
+from core.testing import QueryBudgetMixin
 
 from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
 
@@ -184,6 +188,55 @@ class PrivateRecipeAPITest(TestCase):
         self.assertIn(ingredient1, ingredients)
         self.assertIn(ingredient2, ingredients)
 
+    def test_create_recipe_with_other_users_tag(self):
+        """Test another user's tags cannot be attached to a recipe"""
+        user_2 = get_user_model().objects.create_user(
+            'other@user.com',
+            'otherPW'
+        )
+        tag = sample_tag(user=user_2, name='Private')
+        payload = {
+            'title': 'Cheesecake',
+            'tags': [tag.id],
+            'time_minutes': 60,
+            'price': 20.00
+        }
+
+        response = self.client.post(RECIPE_URL, payload)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_create_recipe_missing_ingredients(self):
+        """Test every unknown ingredient is reported in one error"""
+        ingredient = sample_ingredient(user=self.user)
+        missing = [ingredient.id + 1, ingredient.id + 2]
+        payload = {
+            'title': 'Stew',
+            'ingredients': [missing[0], ingredient.id, missing[1]],
+            'time_minutes': 60,
+            'price': 20.00
+        }
+
+        response = self.client.post(RECIPE_URL, payload)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        message = str(response.data['ingredients'][0])
+        self.assertIn(str(missing), message)
+
+    def test_create_recipe_invalid_pk(self):
+        """Test a pk of the wrong type is rejected"""
+        payload = {
+            'title': 'Stew',
+            'tags': ['not-a-pk'],
+            'time_minutes': 60,
+            'price': 20.00
+        }
+
+        response = self.client.post(RECIPE_URL, payload)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_partial_update_recipe(self):
         """Test updating a recipe with patch"""
         recipe = sample_recipe(user=self.user)
@@ -221,6 +274,310 @@ class PrivateRecipeAPITest(TestCase):
         self.assertEqual(len(tags), 0)
 
 
+class RecipeFilterTests(TestCase):
+    """Test filtering recipes by tags and ingredients"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@email.com',
+            'pestPW'
+        )
+        self.client.force_authenticate(self.user)
+
+        self.vegan = sample_tag(user=self.user, name='Vegan')
+        self.quick = sample_tag(user=self.user, name='Quick')
+        self.tofu = sample_ingredient(user=self.user, name='Tofu')
+
+        self.curry = sample_recipe(user=self.user, title='Curry')
+        self.curry.tags.add(self.vegan, self.quick)
+        self.curry.ingredients.add(self.tofu)
+
+        self.salad = sample_recipe(user=self.user, title='Salad')
+        self.salad.tags.add(self.vegan)
+
+        self.steak = sample_recipe(user=self.user, title='Steak')
+        self.steak.tags.add(self.quick)
+
+    def get_titles(self, params):
+        response = self.client.get(RECIPE_URL, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return {recipe['title'] for recipe in response.data}
+
+    def test_filter_recipes_by_tags_any(self):
+        """Test returning recipes that have any of the tags"""
+        titles = self.get_titles({'tags': f'{self.vegan.id},{self.quick.id}'})
+
+        self.assertEqual(titles, {'Curry', 'Salad', 'Steak'})
+
+    def test_filter_recipes_by_tags_all(self):
+        """Test returning recipes that have all of the tags"""
+        titles = self.get_titles({
+            'tags': f'{self.vegan.id},{self.quick.id}',
+            'match': 'all'
+        })
+
+        self.assertEqual(titles, {'Curry'})
+
+    def test_filter_recipes_by_tags_and_ingredients(self):
+        """Test the tag and ingredient filters are combined"""
+        titles = self.get_titles({
+            'tags': f'{self.vegan.id}',
+            'ingredients': f'{self.tofu.id}'
+        })
+
+        self.assertEqual(titles, {'Curry'})
+
+    def test_filter_recipes_duplicate_ids(self):
+        """Test repeated ids do not break all-of matching"""
+        titles = self.get_titles({
+            'tags': f'{self.vegan.id},{self.vegan.id}',
+            'match': 'all'
+        })
+
+        self.assertEqual(titles, {'Curry', 'Salad'})
+
+    def test_filter_recipes_invalid_params(self):
+        """Test bad filter values are rejected"""
+        for params in ({'tags': 'vegan'}, {'tags': '1', 'match': 'some'}):
+            response = self.client.get(RECIPE_URL, params)
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST
+            )
+
+    def test_filter_recipes_limited_to_user(self):
+        """Test filtering never returns other users recipes"""
+        user_2 = get_user_model().objects.create_user(
+            'other@user.com',
+            'otherPW'
+        )
+        other = sample_recipe(user=user_2, title='Other')
+        other.tags.add(self.vegan)
+
+        titles = self.get_titles({'tags': f'{self.vegan.id}'})
+
+        self.assertEqual(titles, {'Curry', 'Salad'})
+
+
+class RecipeSearchTests(TestCase):
+    """Test searching recipes by title, tag and ingredient names"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@email.com',
+            'pestPW'
+        )
+        self.client.force_authenticate(self.user)
+
+    def search(self, term):
+        response = self.client.get(RECIPE_URL, {'search': term})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [recipe['title'] for recipe in response.data]
+
+    def test_search_title_tags_and_ingredients(self):
+        """Test a term matches titles, tag names and ingredient names"""
+        sample_recipe(user=self.user, title='Lemon tart')
+        tagged = sample_recipe(user=self.user, title='Drizzle cake')
+        tagged.tags.add(sample_tag(user=self.user, name='Lemon'))
+        with_ingredient = sample_recipe(user=self.user, title='Fish')
+        with_ingredient.ingredients.add(
+            sample_ingredient(user=self.user, name='Lemon')
+        )
+        sample_recipe(user=self.user, title='Steak')
+
+        titles = self.search('lemon')
+
+        self.assertEqual(set(titles), {'Lemon tart', 'Drizzle cake', 'Fish'})
+        # a title match is more relevant than a tag or ingredient match
+        self.assertEqual(titles[0], 'Lemon tart')
+
+    def test_search_limited_to_user(self):
+        """Test searching never returns other users recipes"""
+        user_2 = get_user_model().objects.create_user(
+            'other@user.com',
+            'otherPW'
+        )
+        sample_recipe(user=user_2, title='Lemon tart')
+
+        self.assertEqual(self.search('lemon'), [])
+
+    def test_search_combined_with_filters(self):
+        """Test search and tag filters can be used together"""
+        tag = sample_tag(user=self.user, name='Vegan')
+        vegan = sample_recipe(user=self.user, title='Lemon tofu')
+        vegan.tags.add(tag)
+        sample_recipe(user=self.user, title='Lemon chicken')
+
+        response = self.client.get(
+            RECIPE_URL, {'search': 'lemon', 'tags': tag.id}
+        )
+
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['id'], vegan.id)
+
+
+class RecipeSparseFieldsTests(QueryBudgetMixin, TestCase):
+    """Test ?fields= and ?expand= on the recipe list"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@email.com',
+            'pestPW'
+        )
+        self.client.force_authenticate(self.user)
+
+    def add_recipe(self):
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(sample_tag(user=self.user, name=f'Tag {recipe.id}'))
+        recipe.ingredients.add(
+            sample_ingredient(user=self.user, name=f'Ing {recipe.id}')
+        )
+        return recipe
+
+    def test_sparse_fields(self):
+        """Test only the requested fields are rendered and loaded"""
+        self.add_recipe()
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(RECIPE_URL, {'fields': 'id,title'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data[0]), {'id', 'title'})
+        # neither the unrendered columns nor the relations are queried,
+        # the other query is the ETag lookup
+        self.assertEqual(len(context.captured_queries), 2)
+        self.assertNotIn('"link"', context.captured_queries[1]['sql'])
+
+    def test_sparse_fields_unknown(self):
+        """Test requesting an unknown field is rejected"""
+        response = self.client.get(RECIPE_URL, {'fields': 'id,user'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_expand_relations(self):
+        """Test ?expand= inlines the detail shapes of tags/ingredients"""
+        recipe = self.add_recipe()
+
+        response = self.client.get(
+            RECIPE_URL, {'expand': 'tags,ingredients'}
+        )
+
+        # the detail also renders the image, which lists leave out
+        detail = RecipeDetailSerializer(recipe).data
+        self.assertEqual(
+            response.data[0],
+            {key: detail[key] for key in RecipeSerializer.Meta.fields}
+        )
+
+    def test_expand_queries_do_not_scale(self):
+        """Test expanded relations are prefetched, not queried per row"""
+        def request():
+            response = self.client.get(
+                RECIPE_URL, {'expand': 'tags', 'fields': 'id,tags'}
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        count = self.assertQueriesDoNotScale(request, self.add_recipe)
+
+        # the ETag lookup, the recipes and the tags
+        self.assertEqual(count, 3)
+
+
+class RecipeQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Test recipe endpoints run a fixed number of queries"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@email.com',
+            'pestPW'
+        )
+        self.client.force_authenticate(self.user)
+
+    def add_recipes(self, count=5):
+        """Add recipes that each have their own tags and ingredients"""
+        for i in range(count):
+            recipe = sample_recipe(user=self.user)
+            recipe.tags.add(
+                sample_tag(user=self.user, name=f'Tag {recipe.id}'),
+                sample_tag(user=self.user, name=f'Other tag {recipe.id}')
+            )
+            recipe.ingredients.add(
+                sample_ingredient(user=self.user, name=f'Ing {recipe.id}')
+            )
+
+    def test_list_recipes_queries_do_not_scale(self):
+        """Test listing recipes does not run a query per recipe"""
+        def request():
+            response = self.client.get(RECIPE_URL)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        count = self.assertQueriesDoNotScale(request, self.add_recipes)
+
+        # the ETag lookup, the recipes and one prefetch per related field
+        self.assertLessEqual(count, 4)
+
+    def test_list_recipes_related_ids(self):
+        """Test the prefetched list still returns every related id"""
+        self.add_recipes(count=2)
+
+        response = self.client.get(RECIPE_URL)
+
+        # the list renders related ids in id order
+        recipes = Recipe.objects.filter(user=self.user).order_by(
+            '-id'
+        ).prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.order_by('id')),
+            Prefetch('ingredients', queryset=Ingredient.objects.order_by('id'))
+        )
+        serializer = RecipeSerializer(recipes, many=True)
+        self.assertEqual(response.data, serializer.data)
+
+    def create_with_ingredients(self, count):
+        """Create a recipe with count ingredients, returning the queries"""
+        ingredients = [
+            sample_ingredient(user=self.user, name=f'Ing {count}.{i}')
+            for i in range(count)
+        ]
+        payload = {
+            'title': 'Stew',
+            'ingredients': [ingredient.id for ingredient in ingredients],
+            'time_minutes': 60,
+            'price': 20.00
+        }
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(RECIPE_URL, payload)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['ingredients']), count)
+        return len(context.captured_queries)
+
+    def test_create_recipe_queries_do_not_scale(self):
+        """Test related pks are validated together, not one by one"""
+        few = self.create_with_ingredients(2)
+        many = self.create_with_ingredients(40)
+
+        self.assertEqual(few, many)
+
+    def test_recipe_detail_query_budget(self):
+        """Test viewing a recipe detail has a fixed query budget"""
+        recipe = sample_recipe(user=self.user)
+        for i in range(10):
+            recipe.tags.add(sample_tag(user=self.user, name=f'Tag {i}'))
+            recipe.ingredients.add(
+                sample_ingredient(user=self.user, name=f'Ing {i}')
+            )
+
+        with self.assertMaxQueries(4):
+            response = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(len(response.data['tags']), 10)
+        self.assertEqual(len(response.data['ingredients']), 10)
+
+
 class RecipeImageUploadTests(TestCase):
 
     def setUp(self):
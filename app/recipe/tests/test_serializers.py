@@ -0,0 +1,164 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db.models import Prefetch
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from core.models import Tag, Ingredient, Recipe
+
+from recipe import serializers
+from recipe.views import RecipeViewSet
+
+
+RECIPE_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+class ValuesListSerializerTests(TestCase):
+    """Test the fast list serializers match the DRF serializers exactly"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@email.com',
+            'testPW'
+        )
+        self.tags = [
+            Tag.objects.create(user=self.user, name=name)
+            for name in ['Vegan', 'Quick', 'Dessert']
+        ]
+        self.ingredients = [
+            Ingredient.objects.create(user=self.user, name=name)
+            for name in ['Tofu', 'Lime']
+        ]
+
+        curry = Recipe.objects.create(
+            user=self.user,
+            title='Curry',
+            time_minutes=30,
+            price=Decimal('7.5'),
+            link='https://example.com/curry'
+        )
+        curry.tags.add(*self.tags)
+        curry.ingredients.add(*self.ingredients)
+        Recipe.objects.create(
+            user=self.user,
+            title='Toast',
+            time_minutes=2,
+            price=Decimal('0.99')
+        )
+
+    def render(self, data):
+        return JSONRenderer().render(data)
+
+    def assertSameJSON(self, serializer_class, values_class, queryset,
+                       **kwargs):
+        expected = serializer_class(queryset, many=True, **kwargs).data
+        values_serializer = values_class(**kwargs)
+        rows = values_serializer.get_queryset(queryset)
+
+        actual = values_serializer.to_representation(rows)
+
+        self.assertEqual(self.render(actual), self.render(expected))
+
+    def recipes(self):
+        return Recipe.objects.order_by('-id').prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.order_by('id')),
+            Prefetch('ingredients', queryset=Ingredient.objects.order_by('id'))
+        )
+
+    def test_tags(self):
+        self.assertSameJSON(
+            serializers.TagSerializer,
+            serializers.TagValuesSerializer,
+            Tag.objects.order_by('-name')
+        )
+
+    def test_ingredients(self):
+        self.assertSameJSON(
+            serializers.IngredientSerializer,
+            serializers.IngredientValuesSerializer,
+            Ingredient.objects.order_by('-name')
+        )
+
+    def test_recipes(self):
+        self.assertSameJSON(
+            serializers.RecipeSerializer,
+            serializers.RecipeValuesSerializer,
+            self.recipes()
+        )
+
+    def test_recipes_sparse_and_expanded(self):
+        self.assertSameJSON(
+            serializers.RecipeSerializer,
+            serializers.RecipeValuesSerializer,
+            self.recipes(),
+            fields=('id', 'title', 'tags', 'price'),
+            expand=('tags',)
+        )
+
+    def test_empty(self):
+        values_serializer = serializers.RecipeValuesSerializer()
+
+        self.assertEqual(values_serializer.to_representation([]), [])
+
+
+class FastListViewTests(TestCase):
+    """Test list endpoints respond the same with and without fast lists"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@email.com',
+            'testPW'
+        )
+        self.client.force_authenticate(self.user)
+
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        for i in range(3):
+            recipe = Recipe.objects.create(
+                user=self.user,
+                title=f'Recipe {i}',
+                time_minutes=i,
+                price=Decimal('1.25') * i
+            )
+            recipe.tags.add(tag)
+
+    def get_both(self, url, params=None):
+        responses = []
+        for enabled in (True, False):
+            with override_settings(FAST_LIST_SERIALIZERS=enabled,
+                                   RESPONSE_CACHE_ENABLED=False):
+                responses.append(self.client.get(url, params))
+        return responses
+
+    def test_recipe_list(self):
+        for params in (None, {'expand': 'tags'}, {'page_size': 2}):
+            fast, regular = self.get_both(RECIPE_URL, params)
+
+            self.assertEqual(fast.content, regular.content)
+
+    def test_recipe_list_prefetches(self):
+        """Test relations are only prefetched for the regular serializer"""
+        request = Request(APIRequestFactory().get(RECIPE_URL))
+        request.user = self.user
+
+        for enabled, lookups in ((True, 0), (False, 2)):
+            with override_settings(FAST_LIST_SERIALIZERS=enabled):
+                view = RecipeViewSet(
+                    action='list', request=request, format_kwarg=None
+                )
+                queryset = view.get_queryset()
+
+            self.assertEqual(
+                len(queryset._prefetch_related_lookups), lookups
+            )
+
+    def test_tag_list(self):
+        fast, regular = self.get_both(TAGS_URL)
+
+        self.assertEqual(fast.content, regular.content)
@@ -7,10 +7,13 @@ from rest_framework.test import APIClient
 
 from core.models import Tag
 
+from recipe.autocomplete import prefix_cache
 from recipe.serializers import TagSerializer
 
 
 TAGS_URL = reverse('recipe:tag-list')
+AUTOCOMPLETE_URL = reverse('recipe:tag-autocomplete')
+BULK_URL = reverse('recipe:tag-bulk-get-or-create')
 
 
 class PublicTagsAPITests(TestCase):
@@ -92,4 +95,164 @@ class PrivateTagesAPITests(TestCase):
         response = self.client.post(TAGS_URL, payload)
 
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
-        
\ No newline at end of file
+
+
+class TagBulkGetOrCreateTests(TestCase):
+    """Test resolving many tag names in one request"""
+
+    def setUp(self):
+        prefix_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='test@email.com',
+            password='testPW'
+        )
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_duplicate_name_rejected(self):
+        """Test a user cannot have two tags differing only in case"""
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        response = self.client.post(TAGS_URL, {'name': 'VEGAN'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+
+    def test_same_name_for_other_users(self):
+        """Test names only have to be unique per user"""
+        user_2 = get_user_model().objects.create_user(
+            email="other@email.com",
+            password='testOtherPW'
+        )
+        Tag.objects.create(user=user_2, name='Vegan')
+
+        response = self.client.post(TAGS_URL, {'name': 'Vegan'})
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_bulk_get_or_create(self):
+        """Test existing names are resolved and missing ones created"""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        payload = {'names': ['Dessert', 'vegan', 'Quick', 'dessert']}
+
+        response = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [tag['name'] for tag in response.data],
+            ['Dessert', 'Vegan', 'Quick']
+        )
+        self.assertEqual(response.data[1]['id'], vegan.id)
+        tags = Tag.objects.filter(user=self.user)
+        self.assertEqual(
+            sorted(tags.values_list('id', flat=True)),
+            sorted(tag['id'] for tag in response.data)
+        )
+
+    def test_bulk_get_or_create_idempotent(self):
+        """Test retrying a request returns the same tags"""
+        payload = {'names': ['Dessert', 'Quick']}
+
+        first = self.client.post(BULK_URL, payload, format='json')
+        second = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(Tag.objects.count(), 2)
+
+    def test_bulk_get_or_create_invalid(self):
+        """Test empty lists and blank names are rejected"""
+        for names in ([], [''], 'Vegan'):
+            response = self.client.post(
+                BULK_URL, {'names': names}, format='json'
+            )
+
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST
+            )
+
+    def test_bulk_get_or_create_invalidates_autocomplete(self):
+        """Test created tags are suggested straight away"""
+        self.client.get(AUTOCOMPLETE_URL, {'q': 'veg'})
+
+        self.client.post(BULK_URL, {'names': ['Vegan']}, format='json')
+        response = self.client.get(AUTOCOMPLETE_URL, {'q': 'veg'})
+
+        self.assertEqual([tag['name'] for tag in response.data], ['Vegan'])
+
+
+class TagAutocompleteTests(TestCase):
+    """Test the tag name autocomplete endpoint"""
+
+    def setUp(self):
+        prefix_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='test@email.com',
+            password='testPW'
+        )
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_autocomplete_prefix(self):
+        """Test names starting with the term are returned in order"""
+        for name in ['Vegetarian', 'vegan', 'Dessert', 'Savoury vegan']:
+            Tag.objects.create(user=self.user, name=name)
+
+        response = self.client.get(AUTOCOMPLETE_URL, {'q': 'VEG'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [tag['name'] for tag in response.data],
+            ['vegan', 'Vegetarian']
+        )
+
+    def test_autocomplete_limit(self):
+        """Test no more than the requested number of names is returned"""
+        for i in range(5):
+            Tag.objects.create(user=self.user, name=f'Tag {i}')
+
+        response = self.client.get(AUTOCOMPLETE_URL, {'q': 'tag', 'limit': 3})
+
+        self.assertEqual(len(response.data), 3)
+
+    def test_autocomplete_invalid_limit(self):
+        """Test a bad limit is rejected"""
+        response = self.client.get(AUTOCOMPLETE_URL, {'q': 'a', 'limit': 'x'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_autocomplete_limited_to_user(self):
+        """Test other users names are never suggested"""
+        user_2 = get_user_model().objects.create_user(
+            email="other@email.com",
+            password='testOtherPW'
+        )
+        Tag.objects.create(user=user_2, name='Vegan')
+
+        response = self.client.get(AUTOCOMPLETE_URL, {'q': 'veg'})
+
+        self.assertEqual(response.data, [])
+
+    def test_autocomplete_cache_invalidated_on_create(self):
+        """Test a newly created tag is suggested straight away"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(AUTOCOMPLETE_URL, {'q': 'veg'})
+
+        self.client.post(TAGS_URL, {'name': 'Vegetarian'})
+        response = self.client.get(AUTOCOMPLETE_URL, {'q': 'veg'})
+
+        self.assertEqual(
+            [tag['name'] for tag in response.data],
+            ['Vegan', 'Vegetarian']
+        )
+
+    def test_autocomplete_cached(self):
+        """Test repeated terms are answered from the prefix cache"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(AUTOCOMPLETE_URL, {'q': 'veg'})
+
+        with self.assertNumQueries(0):
+            response = self.client.get(AUTOCOMPLETE_URL, {'q': 'veg'})
+
+        self.assertEqual(response.data[0]['name'], 'Vegan')
@@ -1,73 +1,316 @@
-from rest_framework import viewsets, mixins
-from rest_framework.authentication import TokenAuthentication
+import io
+import os
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import IntegrityError, router, transaction
+from django.db.models import Prefetch
+from django.http import Http404, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import viewsets, mixins, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core.models import Tag, Ingredient, Recipe, StoredFile, \
+                        IMAGE_PENDING
+from core.authentication import TOKEN_AUTHENTICATION_CLASSES
+from core.media import serve_file
+from core.signals import touch_user_data
+from core.storage import image_storage
+
+from recipe import serializers, pagination, filters, images
+from recipe.autocomplete import prefix_cache, cached_complete
+from recipe.cache import ConditionalResponseMixin, CachedResponseMixin
+from recipe.export import NDJSONRenderer, CSVRenderer, export_recipes, \
+                          ndjson_lines, csv_lines
+from recipe.importer import FORMATS as IMPORT_FORMATS, RecipeImporter, \
+                            format_for_name
+
+
+class FastListMixin:
+    """Render list responses from .values() rows when enabled
+
+    Uses `values_serializer_class` (see serializers.ValuesListSerializer)
+    instead of the regular serializer for the list action, unless the
+    FAST_LIST_SERIALIZERS setting is off.
+    """
+
+    values_serializer_class = None
+
+    def get_list_serializer_kwargs(self):
+        """Return extra arguments for the list serializer"""
+        return {}
+
+    def renders_values(self):
+        """Return True if the list is rendered from .values() rows"""
+        return (
+            self.action == 'list' and
+            self.values_serializer_class is not None and
+            settings.FAST_LIST_SERIALIZERS
+        )
+
+    def list(self, request, *args, **kwargs):
+        if not self.renders_values():
+            return super().list(request, *args, **kwargs)
 
-from core.models import Tag, Ingredient, Recipe
+        serializer = self.values_serializer_class(
+            **self.get_list_serializer_kwargs()
+        )
+        queryset = serializer.get_queryset(
+            self.filter_queryset(self.get_queryset())
+        )
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(
+                serializer.to_representation(page)
+            )
+
+        return Response(serializer.to_representation(queryset))
 
-from recipe import serializers
 
 # mixins add functionality to the base class
-class TagViewSet(viewsets.GenericViewSet, 
-                 mixins.ListModelMixin,
-                 mixins.CreateModelMixin):
-    """Manage tags in the db"""
+class BaseRecipeAttrViewSet(ConditionalResponseMixin,
+                            CachedResponseMixin,
+                            FastListMixin,
+                            viewsets.GenericViewSet,
+                            mixins.ListModelMixin,
+                            mixins.CreateModelMixin):
+    """Base viewset for user owned recipe attributes"""
 
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = TOKEN_AUTHENTICATION_CLASSES
     permission_classes = (IsAuthenticated,)
 
-    #queryset is what we want to return
-    queryset = Tag.objects.all()
-    serializer_class = serializers.TagSerializer
+    autocomplete_limit = 10
+    autocomplete_max_limit = 50
 
     def get_queryset(self):
-        """Return objects for current authed user"""
+        """Return objects for the current authenticated user only"""
         return self.queryset.filter(user=self.request.user).order_by('-name')
 
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
     def perform_create(self, serializer):
-        """Create new tag"""
-        serializer.save(user=self.request.user)
+        """Create a new object for the current user"""
+        try:
+            with transaction.atomic():
+                serializer.save(user=self.request.user)
+        except IntegrityError:
+            # lost a race with a concurrent request for the same name
+            raise ValidationError(
+                {'name': [_('You already have one with this name.')]}
+            )
+        prefix_cache.invalidate(
+            self.queryset.model, self.request.user.pk
+        )
 
+    @action(methods=['post'], detail=False, url_path='bulk')
+    def bulk_get_or_create(self, request):
+        """Return the objects with the posted names, creating missing ones
 
-class IngredientViewSet(viewsets.GenericViewSet, 
-                        mixins.ListModelMixin,
-                        mixins.CreateModelMixin):
-    """manage ingredients in the db"""
+        Safe to retry: names that already exist, in any case, resolve to
+        the existing objects.
+        """
+        serializer = serializers.NameListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
 
-    authentication_classes = (TokenAuthentication,)
-    permission_classes = (IsAuthenticated,)
+        model = self.queryset.model
+        results = model.objects.get_or_create_names(
+            request.user, serializer.validated_data['names']
+        )
+        if any(created for _, created in results):
+            touch_user_data([request.user.pk], router.db_for_write(model))
+            prefix_cache.invalidate(model, request.user.pk)
 
-    queryset = Ingredient.objects.all()
-    serializer_class = serializers.IngredientSerializer
+        return Response([{'id': obj.id, 'name': obj.name}
+                         for obj, _ in results])
 
-    def get_queryset(self):
-        """return objects for crrent user"""
+    @action(methods=['get'], detail=False)
+    def autocomplete(self, request):
+        """Return the names that best complete the ?q= term"""
+        term = request.query_params.get('q', '').strip()
+        if not term:
+            return Response([])
 
-        return self.queryset.filter(user=self.request.user).order_by('-name')
+        limit = request.query_params.get('limit', self.autocomplete_limit)
+        try:
+            limit = min(int(limit), self.autocomplete_max_limit)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            raise ValidationError({'limit': _('Expected a positive integer.')})
 
-    def perform_create(self, serializer):
-        """create new ingredient"""
-        serializer.save(user=self.request.user)
+        queryset = self.queryset.filter(user=request.user)
+        return Response(
+            cached_complete(queryset, request.user, term, limit)
+        )
+
+
+class TagViewSet(BaseRecipeAttrViewSet):
+    """Manage tags in the db"""
+
+    # queryset is what we want to return
+    queryset = Tag.objects.all()
+    serializer_class = serializers.TagSerializer
+    values_serializer_class = serializers.TagValuesSerializer
+    pagination_class = pagination.TagPagination
+
+
+class IngredientViewSet(BaseRecipeAttrViewSet):
+    """manage ingredients in the db"""
+
+    queryset = Ingredient.objects.all()
+    serializer_class = serializers.IngredientSerializer
+    values_serializer_class = serializers.IngredientValuesSerializer
+    pagination_class = pagination.IngredientPagination
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalResponseMixin, CachedResponseMixin,
+                    FastListMixin, viewsets.ModelViewSet):
     """Manage recipes in db"""
 
     # the ModelViewSet class knows how to create a new instance as long as 
     # we provide a serialiser that is attached to a model. We just need 
     # assign the authed user to that model
     serializer_class = serializers.RecipeSerializer
+    values_serializer_class = serializers.RecipeValuesSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = TOKEN_AUTHENTICATION_CLASSES
     permission_classes = (IsAuthenticated,)
+    pagination_class = pagination.RecipePagination
+
+    # columns the list serializer actually reads; the image path and user
+    # id are never rendered so there is no point loading them for every row
+    list_fields = ('id', 'title', 'time_minutes', 'price', 'link')
+    search_limit = 100
 
     def get_queryset(self):
         """Returve user recipes"""
-        return self.queryset.filter(user=self.request.user)
+        queryset = self.queryset.filter(user=self.request.user)
+
+        if self.action == 'list':
+            queryset = filters.filter_recipes(
+                queryset, self.request.query_params
+            )
+
+            search = self.get_search_term()
+            if search:
+                queryset = filters.search_recipes(queryset, search)
+            else:
+                queryset = queryset.order_by('-id')
+
+            # the values serializer loads the columns and relations itself
+            if not self.renders_values():
+                queryset = self.load_list_fields(queryset)
+
+            if search:
+                # ranked results cannot be keyset paginated on id, so
+                # searches return the top matches instead
+                queryset = queryset[:self.search_limit]
+
+            return queryset
+
+        if self.action == 'retrieve':
+            # the nested detail serializers need the related names as well
+            return queryset.prefetch_related('ingredients', 'tags')
+
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def load_list_fields(self, queryset):
+        """Load only what the regular list serializer renders
+
+        Only the columns of the requested fields are loaded, and the related
+        rows are prefetched in one query per relation instead of per recipe.
+        Unexpanded relations are rendered as pks so only need the id.
+        """
+        fields = self.get_requested_fields()
+        expand = self.get_expand()
+
+        related = []
+        for field_name, model in (('ingredients', Ingredient),
+                                  ('tags', Tag)):
+            if field_name in fields:
+                columns = ('id', 'name') if field_name in expand \
+                    else ('id',)
+                related.append(Prefetch(
+                    field_name,
+                    queryset=model.objects.only(*columns).order_by('id')
+                ))
+
+        return queryset.only(
+            'id', *[name for name in self.list_fields if name in fields]
+        ).prefetch_related(*related)
+
+    def get_requested_fields(self):
+        """Return the ?fields= the list should render, default all"""
+        all_fields = self.serializer_class.Meta.fields
+        return self._parse_field_list('fields', all_fields) or all_fields
+
+    def get_expand(self):
+        """Return the relations ?expand= asks to inline in the list"""
+        return self._parse_field_list(
+            'expand', self.serializer_class.expandable_fields
+        )
+
+    def _parse_field_list(self, param, allowed):
+        value = self.request.query_params.get(param, '')
+        names = [name.strip() for name in value.split(',') if name.strip()]
+
+        unknown = sorted(set(names) - set(allowed))
+        if unknown:
+            raise ValidationError(
+                {param: _('Unknown field(s): %s.') % ', '.join(unknown)}
+            )
+
+        return tuple(names)
+
+    def get_list_serializer_kwargs(self):
+        """Apply ?fields= and ?expand= to the list serializer"""
+        return {
+            'fields': self.get_requested_fields(),
+            'expand': self.get_expand(),
+        }
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action == 'list':
+            for key, value in self.get_list_serializer_kwargs().items():
+                kwargs.setdefault(key, value)
+
+        return super().get_serializer(*args, **kwargs)
+
+    def get_search_term(self):
+        """Return the stripped ?search= term, if any"""
+        return self.request.query_params.get('search', '').strip()
+
+    def paginate_queryset(self, queryset):
+        """Paginate the list unless it is a ranked search"""
+        if self.get_search_term():
+            return None
+
+        return super().paginate_queryset(queryset)
 
     def get_serializer_class(self):
         """return appropriate serialiser class"""
         if self.action == 'retrieve':
             return serializers.RecipeDetailSerializer
+        elif self.action == 'upload_image':
+            return serializers.RecipeImageSerializer
         
         return self.serializer_class
 
@@ -75,30 +318,160 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """create new recipe"""
         serializer.save(user=self.request.user)
 
+    @action(methods=['post'], detail=True, url_path='upload-image',
+            parser_classes=(MultiPartParser,))
+    def upload_image(self, request, pk=None):
+        """Upload an image to a recipe
+
+        The upload is spooled to a temporary file that the storage moves
+        into place, so it is never held in memory whatever its size. The
+        resized variants are rendered by recipe.images once the recipe is
+        saved; image_status and image_variants report their progress. The
+        previous image is deleted unless another recipe uses it too.
+        """
+        request._request.upload_handlers = [
+            TemporaryFileUploadHandler(request._request)
+        ]
+        recipe = self.get_object()
+        previous = recipe.image.name
+        serializer = self.get_serializer(recipe, data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        using = router.db_for_write(Recipe)
+        with transaction.atomic(using=using):
+            # the storage takes a reference on the new image as it saves
+            recipe = serializer.save(
+                image_status=IMAGE_PENDING, image_variants=''
+            )
+            images.schedule_variants(recipe, using)
+            if previous:
+                StoredFile.objects.db_manager(using).release([previous])
+                images.schedule_collect(using)
+
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @action(methods=['get'], detail=False,
+            renderer_classes=(NDJSONRenderer, CSVRenderer))
+    def export(self, request):
+        """Stream every recipe of the user as NDJSON or CSV
+
+        The format is picked with ?format=ndjson|csv or the Accept header
+        and defaults to NDJSON.
+        """
+        renderer = request.accepted_renderer
+        recipes = export_recipes(
+            self.get_queryset(), settings.RECIPE_EXPORT_CHUNK_SIZE
+        )
+        if renderer.format == CSVRenderer.format:
+            lines = csv_lines(recipes)
+        else:
+            lines = ndjson_lines(recipes)
+
+        response = StreamingHttpResponse(
+            lines,
+            content_type=f'{renderer.media_type}; charset={renderer.charset}'
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="recipes.{renderer.format}"'
+        )
+        return response
+
+    @action(methods=['post'], detail=False, url_path='import',
+            url_name='import', parser_classes=(MultiPartParser,))
+    def import_recipes(self, request):
+        """Import the recipes of an uploaded NDJSON or CSV file
 
-# class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
-#                             mixins.ListModelMixin,
-#                             mixins.CreateModelMixin):
-#     """Base viewset for user owned recipe attributes"""
-#     authentication_classes = (TokenAuthentication,)
-#     permission_classes = (IsAuthenticated,)
+        The file is read incrementally and inserted in batches, see
+        recipe.importer. ?skip=N resumes an import after the `checkpoint`
+        of an earlier response. Large libraries are better imported with
+        the import_recipes management command.
+        """
+        upload = request.data.get('file')
+        if upload is None or isinstance(upload, str):
+            raise ValidationError({'file': [_('No file was submitted.')]})
 
-#     def get_queryset(self):
-#         """Return objects for the current authenticated user only"""
-#         return self.queryset.filter(user=self.request.user).order_by('-name')
+        file_format = request.data.get('format') or \
+            format_for_name(upload.name)
+        if file_format not in IMPORT_FORMATS:
+            raise ValidationError({'format': [_('Expected ndjson or csv.')]})
 
-#     def perform_create(self, serializer):
-#         """Create a new ingredient"""
-#         serializer.save(user=self.request.user)
+        try:
+            skip = max(int(request.query_params.get('skip', 0)), 0)
+        except ValueError:
+            raise ValidationError({'skip': [_('Expected an integer.')]})
 
+        importer = RecipeImporter(
+            request.user, batch_size=settings.RECIPE_IMPORT_BATCH_SIZE
+        )
+        stream = io.TextIOWrapper(upload, encoding='utf-8', newline='')
+        try:
+            stats = importer.run(stream, file_format, skip)
+        except UnicodeDecodeError:
+            raise ValidationError({'file': [_('Expected UTF-8 text.')]})
+
+        return Response(stats.as_dict())
+
+    @action(methods=['post'], detail=False, url_path='bulk')
+    def bulk_create(self, request):
+        """Create a list of recipes in a single transaction
+
+        Either every recipe is created or, if any item is invalid, none
+        is and the errors are returned in the order of the items.
+        """
+        max_items = settings.RECIPE_BULK_CREATE_MAX_ITEMS
+        if isinstance(request.data, list) and len(request.data) > max_items:
+            raise ValidationError({
+                'non_field_errors': [
+                    _('Expected at most %d items.') % max_items
+                ]
+            })
+
+        serializer = self.get_serializer(
+            data=request.data, many=True, allow_empty=False
+        )
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            recipes = serializer.save(user=request.user)
+
+        # render the created recipes like the list does, in one query
+        # per relation rather than per recipe
+        values_serializer = self.values_serializer_class()
+        queryset = values_serializer.get_queryset(
+            Recipe.objects.filter(
+                pk__in=[recipe.pk for recipe in recipes]
+            ).order_by('id')
+        )
+        return Response(
+            values_serializer.to_representation(queryset),
+            status=status.HTTP_201_CREATED
+        )
+
+
+class RecipeImageView(APIView):
+    """Serve a recipe image, or a variant of it, to the recipe's owner
+
+    Django only authorises the request; see core.media for how the file
+    itself is sent.
+    """
+
+    authentication_classes = TOKEN_AUTHENTICATION_CLASSES
+    permission_classes = (IsAuthenticated,)
 
-# class TagViewSet(BaseRecipeAttrViewSet):
-#     """Manage tags in the database"""
-#     queryset = Tag.objects.all()
-#     serializer_class = serializers.TagSerializer
+    def get(self, request, path):
+        try:
+            full_path = safe_join(image_storage.location, path)
+        except SuspiciousFileOperation:
+            raise Http404
 
+        # variants are named after the image, whatever its extension
+        owned = Recipe.objects.filter(
+            user=request.user,
+            image__startswith=image_storage.source_stem(path) + '.'
+        )
+        if not owned.exists() or not os.path.isfile(full_path):
+            raise Http404
 
-# class IngredientViewSet(BaseRecipeAttrViewSet):
-#     """Manage ingredients in the database"""
-#     queryset = Ingredient.objects.all()
-#     serializer_class = serializers.IngredientSerializer
+        return serve_file(
+            request, path, full_path,
+            immutable=image_storage.is_content_addressed(path)
+        )
@@ -54,6 +54,12 @@ class AuthTokenSerializer(serializers.Serializer):
         style={'input_type': 'password'},
         trim_whitespace=False
     )
+    # 'signed' returns a short lived access token and a refresh token
+    # instead of the opaque token older clients expect
+    token_type = serializers.ChoiceField(
+        choices=('opaque', 'signed'),
+        default='opaque'
+    )
 
     # This is what is called when we validate
     def validate(self, attrs):
@@ -76,3 +82,7 @@ class AuthTokenSerializer(serializers.Serializer):
         attrs['user'] = user
         return attrs
 
+
+class RefreshTokenSerializer(serializers.Serializer):
+    """Serializer for a refresh token"""
+    refresh = serializers.CharField()
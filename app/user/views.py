@@ -1,10 +1,18 @@
-from user.serializers import UserSerializer, AuthTokenSerializer
+from user.serializers import UserSerializer, AuthTokenSerializer, \
+                             RefreshTokenSerializer
 
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, permissions, serializers, status
 # Note that if we didn't need to customise the email field, this could be 
 # passed directly to urls
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.authtoken.models import Token
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+
+from core import tokens
+from core.authentication import TOKEN_AUTHENTICATION_CLASSES, \
+                                SignedTokenAuthentication
 
 
 class CreateUserView(generics.CreateAPIView):
@@ -21,6 +29,61 @@ class CreateTokenView(ObtainAuthToken):
     # why is this done?
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
+    def post(self, request, *args, **kwargs):
+        serializer = self.serializer_class(
+            data=request.data,
+            context={'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+
+        if serializer.validated_data['token_type'] == 'signed':
+            return Response(tokens.issue_tokens(user))
+
+        token, created = Token.objects.get_or_create(user=user)
+        return Response({'token': token.key})
+
+
+class RefreshTokenView(APIView):
+    """Exchange a refresh token for a new access and refresh token"""
+
+    serializer_class = RefreshTokenSerializer
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    authentication_classes = ()
+    permission_classes = ()
+
+    def post(self, request):
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            pair = tokens.refresh_tokens(serializer.validated_data['refresh'])
+        except tokens.InvalidToken as error:
+            raise serializers.ValidationError(
+                {'refresh': [str(error)]}, code='invalid'
+            )
+
+        return Response(pair)
+
+
+class RevokeTokenView(APIView):
+    """Revoke the signed access token of the request
+
+    Revokes the refresh token given as well, so signing out leaves
+    nothing usable behind.
+    """
+
+    authentication_classes = (SignedTokenAuthentication,)
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def post(self, request):
+        tokens.revoke_access_token(request.auth)
+        refresh = request.data.get('refresh')
+        if refresh:
+            tokens.revoke_refresh_token(refresh, request.user.pk)
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 
 class ManageUserView(generics.RetrieveUpdateAPIView):
     """Manage the authenticated user"""
@@ -28,7 +91,7 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
     serializer_class = UserSerializer
 
     # authentication is mechanism by which auth happens
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = TOKEN_AUTHENTICATION_CLASSES
     # permissions are the level of access
     permission_classes = (permissions.IsAuthenticated,)
 